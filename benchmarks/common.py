@@ -0,0 +1,117 @@
+"""基准测试公共工具 - 本机服务器、统计、资源占用和结果文件"""
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port: int, timeout: float = 10):
+    """等到服务器开始监听 (TransferServer.start 在后台线程里 bind)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"服务器未在 {timeout}s 内开始监听: {port}")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q 取 0~100，线性插值"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def cpu_time() -> float:
+    """本进程累计 CPU 时间 (用户 + 系统，秒)"""
+    t = os.times()
+    return t.user + t.system
+
+
+def peak_rss() -> Optional[int]:
+    """本进程峰值常驻内存 (字节)，不支持的平台返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def apply_overrides(overrides: Dict[str, object]):
+    """在导入 network 之前修改 config 中的常量 (各模块导入时才拷贝这些值)"""
+    if 'network.transfer' in sys.modules:
+        raise RuntimeError("config 覆盖必须在导入 network 之前进行")
+    import config
+    for name, value in overrides.items():
+        if not hasattr(config, name):
+            raise KeyError(f"config 中没有 {name}")
+        setattr(config, name, value)
+
+
+def run_isolated(script: str, spec: dict, timeout: Optional[float] = None) -> dict:
+    """在独立的子进程中运行一组测量，返回其 stdout 最后一行的 JSON
+
+    子进程使用临时 HOME (接收目录随之放到临时目录里，测完即删)，
+    并且 CPU 时间、峰值内存只反映这一组测量。
+    """
+    with tempfile.TemporaryDirectory(prefix='ec-bench-') as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        proc = subprocess.run([sys.executable, script, '--worker', json.dumps(spec)],
+                              env=env, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"测量进程失败 ({proc.returncode}):\n{proc.stderr[-2000:]}")
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if not lines:
+        raise RuntimeError(f"测量进程没有输出结果:\n{proc.stdout[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_results(path: str, kind: str, params: dict, results: List[dict]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'benchmark': kind, 'environment': environment(), 'params': params,
+                   'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"[Bench] 结果已保存: {path}")
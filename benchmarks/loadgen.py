@@ -0,0 +1,323 @@
+"""接收端压力测试 - 大量虚拟发送方按设定的到达率同时向一个 TransferServer 发文字和文件
+
+虚拟发送方用 asyncio 实现，直接讲现有协议 (v1: 长度头 + JSON，v2: HELLO 之后二进制帧)，
+每个发送方有自己的连接，数百个也只占一个线程，不会被发送端的线程池限制住。
+到达间隔服从指数分布 (开环)，延迟从计划发出的时刻算起，接收端变慢时排队时间也计入尾延迟。
+
+默认在子进程中启动本机接收端 (临时 HOME，--engine 选择线程版或 asyncio 版，--set 覆盖 config，
+如 --set SERVER_BACKLOG=5)，结束时汇报它的峰值线程数、连接数、CPU 和内存；
+--target HOST:PORT 改为压测已在运行的接收端。
+
+用法:
+    python benchmarks/loadgen.py --peers 300 --rate 500 --duration 20
+    python benchmarks/loadgen.py --engine asyncio --peers 500 --keep-alive
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, apply_overrides, cpu_time, free_port, peak_rss, percentile, write_results
+from transfer_bench import format_size, parse_size
+
+
+# ---- 子进程: 被压测的接收端 ----
+
+def serve(args) -> int:
+    overrides = {}
+    for item in args.set or []:
+        name, _, value = item.partition('=')
+        overrides[name] = json.loads(value)
+    apply_overrides(overrides)
+    from network.aio_server import AsyncTransferServer
+    from network.transfer import TransferServer
+
+    counts = {'texts': 0, 'files': 0}
+
+    def _on_text(sender, text):
+        counts['texts'] += 1
+
+    def _on_file(sender, name, path):
+        counts['files'] += 1
+        os.remove(path)
+
+    server_class = AsyncTransferServer if args.engine == 'asyncio' else TransferServer
+    server = server_class(args.port)
+    server.set_callbacks(on_text=_on_text, on_file=_on_file)
+    server.start()
+
+    peaks = {'threads': 0, 'connections': 0}
+    stop = threading.Event()
+
+    def _sample():
+        while not stop.wait(0.05):
+            peaks['threads'] = max(peaks['threads'], threading.active_count())
+            peaks['connections'] = max(peaks['connections'], len(server._active_connections))
+
+    sampler = threading.Thread(target=_sample, daemon=True)
+    sampler.start()
+    cpu_start = cpu_time()
+    print(json.dumps({'ready': args.port}), flush=True)
+    sys.stdin.read()  # 父进程关闭 stdin 表示压测结束
+    stop.set()
+    sampler.join()
+    server.stop()
+    print(json.dumps({'engine': args.engine, 'peak_threads': peaks['threads'],
+                      'peak_connections': peaks['connections'], 'cpu_seconds': cpu_time() - cpu_start,
+                      'peak_rss': peak_rss(), **counts}), flush=True)
+    return 0
+
+
+class _ServerProcess:
+    def __init__(self, args):
+        self._home = tempfile.TemporaryDirectory(prefix='ec-load-')
+        self.port = free_port()
+        cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--engine', args.engine,
+               '--port', str(self.port)]
+        for item in args.set or []:
+            cmd += ['--set', item]
+        env = dict(os.environ, HOME=self._home.name, USERPROFILE=self._home.name)
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for line in self.proc.stdout:
+            if line.startswith('{') and 'ready' in json.loads(line):
+                break
+        else:
+            raise RuntimeError("接收端进程启动失败")
+        # 接收端每条消息都会打印日志，持续读走 stdout，否则管道写满后接收端会卡住
+        self._report = {}
+        self._drain = threading.Thread(target=self._read_output, daemon=True)
+        self._drain.start()
+
+    def _read_output(self):
+        for line in self.proc.stdout:
+            if line.startswith('{'):
+                self._report = json.loads(line)
+
+    def finish(self) -> dict:
+        self.proc.stdin.close()
+        self.proc.wait(timeout=30)
+        self._drain.join(timeout=5)
+        self._home.cleanup()
+        return self._report
+
+
+# ---- 虚拟发送方 ----
+
+class _Stats:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = {'text': [], 'file': []}
+        self.connect: List[float] = []
+        self.counts: Dict[str, int] = {}
+        self.bytes = 0
+
+    def count(self, name: str):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+class _Connection:
+    """一个虚拟发送方的连接，按协商好的版本收发"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, version: int):
+        self.reader = reader
+        self.writer = writer
+        self.version = version
+        self.stream_id = 0
+
+    @classmethod
+    async def open(cls, host: str, port: int, version: int, name: str) -> '_Connection':
+        from network.framing import PROTOCOL_VERSION
+        from network.protocol import encode_message
+        reader, writer = await asyncio.open_connection(host, port)
+        conn = cls(reader, writer, 1)
+        if version == PROTOCOL_VERSION:
+            try:
+                writer.write(encode_message({'type': 'HELLO', 'sender': name,
+                                             'versions': [1, PROTOCOL_VERSION], 'keep_alive': True}))
+                reply = await conn._recv_frame()
+                if reply['type'] != 'HELLO' or reply.get('version') != PROTOCOL_VERSION:
+                    raise ConnectionError("接收端不支持 v2")
+            except BaseException:  # 包括 wait_for 超时取消
+                writer.close()
+                raise
+            conn.version = PROTOCOL_VERSION
+        return conn
+
+    async def _recv_frame(self) -> dict:
+        from network.framing import FRAME_HEADER, decode_frame, parse_frame_length
+        header = await self.reader.readexactly(FRAME_HEADER.size)
+        return decode_frame(header, await self.reader.readexactly(parse_frame_length(header)))
+
+    async def _reply(self, size: int) -> bytes:
+        if self.version == 1:
+            return await self.reader.readexactly(size)
+        frame = await self._recv_frame()
+        if frame['stream_id'] != self.stream_id:
+            raise ConnectionError("应答流 ID 不匹配")
+        return frame['type'].encode()
+
+    async def request(self, message: dict, payload: Optional[bytes] = None):
+        from network.framing import encode_frame
+        from network.protocol import ACK, READY, encode_message
+        if self.version == 1:
+            self.writer.write(encode_message(message))
+        else:
+            self.stream_id += 1
+            self.writer.write(encode_frame(message, self.stream_id))
+        if payload is not None:
+            if await self._reply(5 if self.version == 1 else 0) != READY:
+                raise ConnectionError("接收端拒绝接收")
+            self.writer.write(payload)
+        await self.writer.drain()
+        if await self._reply(3) != ACK:
+            raise ConnectionError("未收到确认")
+
+    def close(self):
+        self.writer.close()
+
+
+async def _peer(index: int, args, host: str, port: int, payload: bytes, text: str,
+                deadline: float, stats: _Stats):
+    loop = asyncio.get_running_loop()
+    rng = random.Random(index)
+    rate = args.rate / args.peers
+    name = f"loadgen-{index}"
+    conn: Optional[_Connection] = None
+    next_at = loop.time() + rng.expovariate(rate)
+    while next_at < deadline:
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        scheduled = next_at
+        next_at += rng.expovariate(rate)
+        kind = 'text' if rng.random() < args.text_ratio else 'file'
+        if conn is None:
+            started = loop.time()
+            stats.count('connect_attempts')
+            try:
+                conn = await asyncio.wait_for(_Connection.open(host, port, args.protocol, name),
+                                              args.connect_timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                stats.count('connect_failed')
+                continue
+            stats.count('connect_ok')
+            stats.connect.append(loop.time() - started)
+        if kind == 'text':
+            message = {'type': 'TEXT', 'sender': name, 'content': text}
+            data = None
+        else:
+            message = {'type': 'FILE', 'sender': name, 'content': f'{name}.bin',
+                       'file_size': len(payload)}
+            data = payload
+        message['keep_alive'] = args.keep_alive
+        try:
+            await asyncio.wait_for(conn.request(message, data), args.request_timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            stats.count(f'{kind}_failed')
+            conn.close()
+            conn = None
+            continue
+        stats.count(f'{kind}_ok')
+        stats.latency[kind].append(loop.time() - scheduled)
+        stats.bytes += len(text) if data is None else len(data)
+        if not args.keep_alive:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+async def _run_load(args, host: str, port: int) -> dict:
+    stats = _Stats()
+    payload = os.urandom(args.file_size)
+    text = 'x' * args.text_size
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + args.duration
+    await asyncio.gather(*(_peer(i, args, host, port, payload, text, deadline, stats)
+                           for i in range(args.peers)))
+    elapsed = loop.time() - started
+
+    def _latency(values: List[float]) -> dict:
+        summary = {f'p{q:g}_ms': (percentile(values, q) or 0) * 1000 for q in (50, 90, 99, 99.9)}
+        summary.update(max_ms=max(values, default=0) * 1000, count=len(values))
+        return summary
+
+    ok = stats.counts.get('text_ok', 0) + stats.counts.get('file_ok', 0)
+    return {
+        'seconds': elapsed,
+        'counts': stats.counts,
+        'messages_per_sec': ok / elapsed,
+        'payload_mbps': stats.bytes / elapsed / 1024 ** 2,
+        'latency': {kind: _latency(values) for kind, values in stats.latency.items()},
+        'connect': _latency(stats.connect),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EasyConnect 接收端并发压力测试")
+    parser.add_argument('--peers', type=int, default=200, help="虚拟发送方数量")
+    parser.add_argument('--rate', type=float, default=200, help="所有发送方合计每秒发起的消息数")
+    parser.add_argument('--duration', type=float, default=10, help="压测时长 (秒)")
+    parser.add_argument('--text-ratio', type=float, default=0.8, help="文字消息所占比例")
+    parser.add_argument('--text-size', type=parse_size, default=256, help="文字长度 (字符)")
+    parser.add_argument('--file-size', type=parse_size, default=parse_size('256K'), help="文件大小")
+    parser.add_argument('--protocol', type=int, choices=(1, 2), default=2, help="协议版本")
+    parser.add_argument('--keep-alive', action='store_true', help="每个发送方复用一条长连接")
+    parser.add_argument('--connect-timeout', type=float, default=5)
+    parser.add_argument('--request-timeout', type=float, default=30)
+    parser.add_argument('--engine', choices=('thread', 'asyncio'), default='thread',
+                        help="本机接收端引擎")
+    parser.add_argument('--set', action='append', metavar='NAME=JSON', help="覆盖接收端 config 常量")
+    parser.add_argument('--target', metavar='HOST:PORT', help="压测已在运行的接收端")
+    parser.add_argument('--output', default='loadgen.json', help="结果 JSON 文件")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(args)
+
+    server = None
+    if args.target:
+        host, _, port = args.target.rpartition(':')
+        port = int(port)
+    else:
+        server = _ServerProcess(args)
+        host, port = '127.0.0.1', server.port
+    print(f"[Load] {args.peers} 个发送方 → {host}:{port}，{args.rate:g} 条/秒，"
+          f"文字 {args.text_ratio:.0%}，文件 {format_size(args.file_size)}，{args.duration:g}s")
+    try:
+        result = asyncio.run(_run_load(args, host, port))
+    finally:
+        if server:
+            result_server = server.finish()
+    if server:
+        result['server'] = result_server
+
+    counts = result['counts']
+    print(f"[Load] 连接 成功 {counts.get('connect_ok', 0)} / 失败 {counts.get('connect_failed', 0)}；"
+          f"文字 成功 {counts.get('text_ok', 0)} / 失败 {counts.get('text_failed', 0)}；"
+          f"文件 成功 {counts.get('file_ok', 0)} / 失败 {counts.get('file_failed', 0)}")
+    print(f"[Load] {result['messages_per_sec']:.0f} 条/秒，负载 {result['payload_mbps']:.1f} MB/s")
+    for kind, latency in list(result['latency'].items()) + [('connect', result['connect'])]:
+        if latency['count']:
+            print(f"[Load] {kind:7s} p50 {latency['p50_ms']:8.2f} ms  p99 {latency['p99_ms']:8.2f} ms  "
+                  f"p99.9 {latency['p99.9_ms']:8.2f} ms  max {latency['max_ms']:8.2f} ms")
+    if server:
+        info = result['server']
+        print(f"[Load] 接收端 ({info.get('engine')}): 峰值线程 {info.get('peak_threads')}，"
+              f"峰值连接 {info.get('peak_connections')}，CPU {info.get('cpu_seconds', 0):.2f}s")
+    params = {k: v for k, v in vars(args).items() if k not in ('serve', 'port')}
+    write_results(args.output, 'loadgen', params, [result])
+    return 0 if not counts.get('connect_failed') and not counts.get('text_failed') \
+        and not counts.get('file_failed') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""启动时间基准 - 反复冷启动 main.py，测量到主窗口显示的时间并与预算比较
+
+每轮在子进程中运行 main.py --profile-startup --exit-after-window (临时 HOME，默认 Qt offscreen 平台，
+无显示器的 CI 上也能运行)，窗口显示、后台服务都启动完后进程打印启动报告并退出。
+到窗口时间从创建子进程算起，包含解释器自身的启动；同时汇总各步骤、各服务就绪时刻和最慢导入的耗时。
+中位数超过 config.STARTUP_BUDGET (或 --budget) 时退出码为 1。
+
+用法:
+    python benchmarks/startup_bench.py --repeat 5
+    python benchmarks/startup_bench.py --platform xcb --budget 2.0 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, percentile, write_results
+
+
+def run_once(platform: str, timeout: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix='ec-startup-') as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home, QT_QPA_PLATFORM=platform)
+        spawned = time.time()
+        proc = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '--profile-startup',
+                               '--exit-after-window'],
+                              env=env, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if not lines:
+        raise RuntimeError(f"main.py 没有输出启动报告 ({proc.returncode}):\n"
+                           f"{proc.stdout[-1000:]}\n{proc.stderr[-2000:]}")
+    report = json.loads(lines[-1])
+    report['time_to_window'] = report['wall_started'] + report['marks']['event_loop_running'] - spawned
+    return report
+
+
+def summarize(reports: List[dict]) -> dict:
+    steps: Dict[str, List[float]] = {}
+    marks: Dict[str, List[float]] = {}
+    imports: Dict[str, List[float]] = {}
+    for report in reports:
+        for step in report['steps']:
+            steps.setdefault(step['name'], []).append(step['seconds'])
+        for name, at in report['marks'].items():
+            marks.setdefault(name, []).append(at)
+        for item in report['imports']:
+            imports.setdefault(item['module'], []).append(item['seconds'])
+    windows = [r['time_to_window'] for r in reports]
+    in_process = [r['marks'].get('event_loop_running', 0) for r in reports]
+    slowest = sorted(imports.items(), key=lambda kv: percentile(kv[1], 50), reverse=True)[:10]
+    return {
+        'runs': len(reports),
+        'time_to_window': {'p50': percentile(windows, 50), 'max': max(windows), 'min': min(windows)},
+        'in_process': {'p50': percentile(in_process, 50)},
+        'steps': {name: percentile(values, 50) for name, values in steps.items()},
+        'marks': {name: percentile(values, 50) for name, values in marks.items()},
+        'imports': {name: percentile(values, 50) for name, values in slowest},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from config import STARTUP_BUDGET
+    parser = argparse.ArgumentParser(description="EasyConnect 启动时间基准")
+    parser.add_argument('--repeat', type=int, default=5, help="冷启动次数 (取中位数)")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="到窗口时间预算 (秒)")
+    parser.add_argument('--platform', default='offscreen', help="Qt 平台插件 (QT_QPA_PLATFORM)")
+    parser.add_argument('--timeout', type=float, default=60, help="单次启动的超时 (秒)")
+    parser.add_argument('--output', default='startup_bench.json', help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for i in range(args.repeat):
+        report = run_once(args.platform, args.timeout)
+        print(f"[Bench] 第 {i + 1} 次: 到窗口 {report['time_to_window'] * 1000:7.1f} ms "
+              f"(进程内 {report['marks'].get('event_loop_running', 0) * 1000:7.1f} ms)")
+        reports.append(report)
+
+    summary = summarize(reports)
+    print("[Bench] 各步骤 (中位数):")
+    for name, seconds in summary['steps'].items():
+        print(f"[Bench]   {seconds * 1000:8.1f} ms  {name}")
+    print("[Bench] 各时刻 (距 main.py 开始，中位数):")
+    for name, at in sorted(summary['marks'].items(), key=lambda kv: kv[1]):
+        print(f"[Bench]   {at * 1000:8.1f} ms  {name}")
+    print("[Bench] 最慢的导入 (中位数):")
+    for name, seconds in summary['imports'].items():
+        print(f"[Bench]   {seconds * 1000:8.1f} ms  {name}")
+
+    window = summary['time_to_window']['p50']
+    within = window <= args.budget
+    print(f"[Bench] 到窗口时间中位数 {window * 1000:.1f} ms，预算 {args.budget * 1000:.0f} ms: "
+          f"{'通过' if within else '超出预算'}")
+    summary['budget'] = args.budget
+    summary['within_budget'] = within
+    write_results(args.output, 'startup', vars(args), [summary])
+    return 0 if within else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
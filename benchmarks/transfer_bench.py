@@ -0,0 +1,261 @@
+"""传输层基准测试 - 本机回环上测量文件吞吐和文字消息延迟
+
+在本机启动 TransferServer，用 FileTransfer 按参数网格发送:
+  - 文件: 文件大小 × 缓冲区大小 × 并发数，报告 MB/s
+  - 文字: 消息大小 × 并发数，报告 p50/p99 延迟和每秒消息数
+每组参数在独立子进程中运行 (临时 HOME，接收到的文件测完即删)，同时记录 CPU 时间和峰值内存。
+结果保存为 JSON，--compare 与之前的结果逐项对比。
+
+用法:
+    python benchmarks/transfer_bench.py --output bench.json
+    python benchmarks/transfer_bench.py --sizes 1M,64M --concurrency 1,4 --compare bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import (apply_overrides, cpu_time, free_port, peak_rss, percentile, run_isolated,
+                    wait_listening, write_results)
+
+_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def parse_list(text: str, convert=parse_size) -> List[int]:
+    return [convert(item) for item in text.split(',') if item.strip()]
+
+
+def format_size(n: int) -> str:
+    for unit in ('G', 'M', 'K'):
+        if n >= _UNITS[unit] and n % _UNITS[unit] == 0:
+            return f"{n // _UNITS[unit]}{unit}"
+    return str(n)
+
+
+# ---- 子进程: 一组参数的测量 ----
+
+def _start(spec: dict):
+    overrides = dict(spec.get('config') or {})
+    if spec.get('buffer'):
+        # 接收流水线缓冲区与发送分块上限一起调整
+        overrides.setdefault('PIPELINE_BUFFER', spec['buffer'])
+        overrides.setdefault('TUNE_MAX_CHUNK', spec['buffer'])
+    apply_overrides(overrides)
+    from network.transfer import FileTransfer, TransferServer
+
+    received = threading.Semaphore(0)
+
+    def _on_file(sender, name, path):
+        os.remove(path)  # 下一轮同名文件不应走增量传输
+        received.release()
+
+    port = free_port()
+    server = TransferServer(port)
+    server.set_callbacks(on_text=lambda sender, text: None, on_file=_on_file)
+    server.start()
+    wait_listening(port)
+    return server, FileTransfer(), port, received
+
+
+def _file_worker(spec: dict) -> dict:
+    server, sender, port, received = _start(spec)
+    size, concurrency = spec['size'], spec['concurrency']
+    work_dir = os.path.join(os.path.expanduser('~'), 'bench-src')
+    os.makedirs(work_dir, exist_ok=True)
+    paths = []
+    for i in range(concurrency):
+        path = os.path.join(work_dir, f'bench_{i}.bin')
+        with open(path, 'wb') as f:
+            left = size
+            while left > 0:
+                n = min(left, 4 * 1024 * 1024)
+                f.write(os.urandom(n))  # 随机数据，不会协商压缩
+                left -= n
+        paths.append(path)
+
+    runs = []
+    cpu_start = cpu_time()
+    try:
+        for _ in range(spec['repeat']):
+            started = time.perf_counter()
+            handles = [sender.send_file('127.0.0.1', port, path) for path in paths]
+            for handle in handles:
+                handle.result()
+            elapsed = time.perf_counter() - started
+            for _ in paths:
+                received.acquire(timeout=30)
+            runs.append({'seconds': elapsed, 'mbps': size * concurrency / elapsed / 1024 ** 2})
+    finally:
+        sender.close()
+        server.stop()
+    return {
+        'runs': runs,
+        'mbps': percentile([r['mbps'] for r in runs], 50),
+        'cpu_seconds': cpu_time() - cpu_start,
+        'peak_rss': peak_rss(),
+    }
+
+
+def _message_worker(spec: dict) -> dict:
+    server, sender, port, _ = _start(spec)
+    text = 'x' * spec['message_size']
+    latencies: List[float] = []
+    lock = threading.Lock()
+    errors: List[Exception] = []
+
+    def _run():
+        local = []
+        try:
+            for _ in range(spec['count']):
+                started = time.perf_counter()
+                sender.send_text('127.0.0.1', port, text).result()
+                local.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(e)
+        with lock:
+            latencies.extend(local)
+
+    # 预热: 建立连接、完成协议协商
+    sender.send_text('127.0.0.1', port, 'warmup').result()
+    threads = [threading.Thread(target=_run) for _ in range(spec['concurrency'])]
+    cpu_start = cpu_time()
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    cpu = cpu_time() - cpu_start
+    sender.close()
+    server.stop()
+    if errors:
+        raise errors[0]
+    return {
+        'messages': len(latencies),
+        'msgs_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'cpu_seconds': cpu,
+        'peak_rss': peak_rss(),
+    }
+
+
+def worker(spec: dict):
+    result = _file_worker(spec) if spec['workload'] == 'file' else _message_worker(spec)
+    print(json.dumps(result))
+
+
+# ---- 主进程: 参数网格、汇总和对比 ----
+
+def _key(result: dict) -> tuple:
+    return tuple((k, result.get(k)) for k in
+                 ('workload', 'size', 'buffer', 'message_size', 'concurrency'))
+
+
+def _describe(result: dict) -> str:
+    if result['workload'] == 'file':
+        return (f"file size={format_size(result['size'])} buffer={format_size(result['buffer'])} "
+                f"x{result['concurrency']}")
+    return f"text size={format_size(result['message_size'])} x{result['concurrency']}"
+
+
+def _summary(result: dict) -> str:
+    if result['workload'] == 'file':
+        text = f"{result['mbps']:8.1f} MB/s"
+    else:
+        text = (f"p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms  "
+                f"{result['msgs_per_sec']:8.0f} msg/s")
+    text += f"  cpu {result['cpu_seconds']:.2f}s"
+    if result.get('peak_rss'):
+        text += f"  rss {result['peak_rss'] / 1024 ** 2:.0f} MB"
+    return text
+
+
+# 对比时看的指标和方向 (True 表示越大越好)
+_COMPARED = {'mbps': True, 'msgs_per_sec': True, 'p50_ms': False, 'p99_ms': False,
+             'cpu_seconds': False}
+
+
+def compare(old_path: str, results: List[dict]):
+    with open(old_path, encoding='utf-8') as f:
+        old = {_key(r): r for r in json.load(f)['results']}
+    print(f"\n对比 {old_path}:")
+    for result in results:
+        before = old.get(_key(result))
+        if before is None:
+            continue
+        parts = []
+        for metric, higher_better in _COMPARED.items():
+            if result.get(metric) is None or not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            better = change > 0 if higher_better else change < 0
+            parts.append(f"{metric} {change:+.1f}%{'' if abs(change) < 5 else (' ↑' if better else ' ↓')}")
+        print(f"  {_describe(result):40s} {'  '.join(parts)}")
+
+
+def build_grid(args) -> List[dict]:
+    overrides = {'DELTA_ENABLED': False}
+    for item in args.set or []:
+        name, _, value = item.partition('=')
+        overrides[name] = json.loads(value)
+    grid = []
+    for size in parse_list(args.sizes):
+        for buffer in parse_list(args.buffers):
+            for concurrency in parse_list(args.concurrency, int):
+                grid.append({'workload': 'file', 'size': size, 'buffer': buffer,
+                             'concurrency': concurrency, 'repeat': args.repeat, 'config': overrides})
+    for message_size in parse_list(args.messages):
+        for concurrency in parse_list(args.concurrency, int):
+            grid.append({'workload': 'message', 'message_size': message_size,
+                         'concurrency': concurrency, 'count': args.count, 'config': overrides})
+    return grid
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EasyConnect 传输层回环基准测试")
+    parser.add_argument('--sizes', default='1M,16M,128M', help="文件大小列表")
+    parser.add_argument('--buffers', default='256K,1M', help="接收缓冲区/发送分块上限列表")
+    parser.add_argument('--messages', default='64,4K,256K', help="文字消息大小列表 (字符)")
+    parser.add_argument('--concurrency', default='1,4', help="并发发送数列表")
+    parser.add_argument('--repeat', type=int, default=3, help="每组文件测量的轮数 (取中位数)")
+    parser.add_argument('--count', type=int, default=200, help="每个并发发送方发送的文字条数")
+    parser.add_argument('--set', action='append', metavar='NAME=JSON',
+                        help="覆盖 config 中的常量，如 --set COMPRESSION_ENABLED=false")
+    parser.add_argument('--output', default='transfer_bench.json', help="结果 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的结果对比")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(json.loads(args.worker))
+        return 0
+
+    results = []
+    for spec in build_grid(args):
+        result = {k: v for k, v in spec.items() if k not in ('config', 'repeat', 'count')}
+        print(f"[Bench] {_describe(result):40s}", end=' ', flush=True)
+        result.update(run_isolated(os.path.abspath(__file__), spec))
+        print(_summary(result))
+        results.append(result)
+
+    write_results(args.output, 'transfer', vars(args), results)
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,11 @@
-"""EasyConnect 配置文件"""
+"""EasyConnect 配置文件
+
+导入时只定义常量，不做网络访问和磁盘写入 (本机 IP 在第一次用到时探测并缓存，接收目录在接收端启动时创建)。
+"""
 import os
 import socket
 import platform
+from functools import lru_cache
 
 # 应用信息
 APP_NAME = "EasyConnect"
@@ -12,14 +16,128 @@ SERVICE_TYPE = "_easyconnect._tcp.local."  # mDNS 服务类型
 TRANSFER_PORT = 52525
 DISCOVERY_PORT = 52526
 BUFFER_SIZE = 8192
+SENDFILE_CHUNK = 4 * 1024 * 1024  # 零拷贝发送时每段大小，也是进度回报粒度
+MAX_HEADER_SIZE = 64 * 1024 * 1024  # 单条 JSON 消息 (含文字内容) 的上限
+RECV_BUFFER_KEEP = 1024 * 1024      # 接收缓冲区超过此大小时处理完即释放
+
+# 链路调优 (按 RTT × 吞吐自动选择，以下为边界)
+TUNE_INITIAL_CHUNK = 64 * 1024          # 还没有链路估计时的发送分块
+TUNE_MIN_CHUNK = 16 * 1024
+TUNE_MAX_CHUNK = 1024 * 1024            # 发送/接收分块上限
+TUNE_CHUNK_TIME = 0.002                 # 每块至少包含这么多秒的数据，摊薄系统调用开销
+TUNE_MAX_SOCK_BUF = 16 * 1024 * 1024    # SO_SNDBUF 上限
+
+# 接收流水线
+PIPELINE_BUFFER = 1024 * 1024           # 网络线程每次读满的缓冲区大小
+PIPELINE_DEPTH = 4                      # 每个分段在途 (已收未写) 的缓冲区数，用完时暂停读取
+PIPELINE_POOL_MAX = 16                  # 全局保留复用的空闲缓冲区数
+
+# 多路并行传输
+PARALLEL_MAX_STREAMS = 4                        # 单个文件最多并行连接数
+PARALLEL_BYTES_PER_STREAM = 64 * 1024 * 1024    # 每多一条连接所需的文件大小
+PARALLEL_IDLE_TIMEOUT = 60                      # 分段长时间无进展视为失败
+
+# 断点续传
+PARTIAL_DIR_NAME = ".partial"                   # 接收目录下存放 .part 文件和检查点的子目录
+PARTIAL_MAX_AGE = 7 * 24 * 3600                 # 超过此时间未续传的 .part 文件会被清理
+CHECKPOINT_INTERVAL = 1.0                       # 每隔这么多秒 fsync 一次并更新检查点 (中断时最多重传这么久的数据)
+RESUME_RETRIES = 3                              # 发送端连接中断后自动续传次数
+RESUME_RETRY_DELAY = 2                          # 续传重试间隔 (秒)，逐次递增
+
+# 传输压缩
+COMPRESSION_ENABLED = True      # 自动协商压缩 (zlib，安装了 zstandard/lz4 时优先使用)
+COMPRESS_CHUNK = 256 * 1024     # 压缩块大小 (原始字节)
+COMPRESS_MIN_SIZE = 4 * 1024 * 1024 # 小于此大小的文件不采样也不压缩，局域网上省下的时间抵不过开销
+COMPRESS_SAMPLE = 64 * 1024     # 协商前从文件中间取这么多字节试压，判断是否值得压缩
+COMPRESS_MIN_SAVING = 0.1       # 单块 (及协商前的样本) 至少省下 10% 才发送压缩结果，否则原样发送
+
+# 进度回报
+PROGRESS_INTERVAL = 0.05        # 两次进度回调的最小间隔 (秒)
+PROGRESS_STEP = 0.01            # 进度每前进 1% 也回调一次
+PROGRESS_SMOOTHING = 2.0        # 平滑速率的时间常数 (秒)，用于估算剩余时间
+
+# 完整性校验
+INTEGRITY_ENABLED = True        # 协商流式摘要 (xxhash 已安装时用 xxh3_128，否则 BLAKE2b)
+INTEGRITY_QUEUE_DEPTH = 8       # 等待后台哈希线程处理的数据块上限
+INTEGRITY_READ_BUFFER = 1024 * 1024  # sendfile 发出的数据由哈希线程从页缓存读回，每次读这么多
+
+# 协议版本协商
+HELLO_TIMEOUT = 3               # 等待对端 HELLO 应答的秒数，超时视为只支持 v1
+V1_PEER_RECHECK = 300           # 对端被判定为 v1 后，隔这么久再尝试协商 v2
+
+# 长连接配置
+POOL_IDLE_TIMEOUT = 30        # 发送端空闲连接保留秒数
+POOL_MAX_IDLE_PER_PEER = 4    # 每个对端最多保留的空闲连接数
+KEEPALIVE_TIMEOUT = 60        # 接收端等待下一条消息的超时 (需大于 POOL_IDLE_TIMEOUT)
+
+# 发送任务调度
+SEND_WORKERS = 8                  # 发送工作线程数
+SEND_QUEUE_SIZE = 1024            # 排队任务上限，超出时提交方阻塞 (背压)
+SEND_PER_PEER_LIMIT = 2           # 同一对端同时进行的发送任务数
 
+# 优先级通道: 文字/剪贴板优先于文件
+SEND_INTERACTIVE_WORKERS = 1      # 为交互任务保留的工作线程数，文件传输不能占满全部线程
+BULK_MAX_YIELD = 0.2              # 文件传输为交互消息让路时，每个数据块之间最多暂停的秒数
+BULK_SLICE_TIME = 0.01            # sendfile 每次调用约发送这么多秒的数据，决定让路的响应粒度
+BULK_NOTSENT_LOWAT = 256 * 1024   # 文件连接在内核中排队未发出的数据上限 (Linux TCP_NOTSENT_LOWAT)
+
+# 多播发送 (同一文件发给多个对端)
+FANOUT_CHUNK = 1024 * 1024        # 共享环每块大小
+FANOUT_RING_SLOTS = 32            # 共享环块数，最快与最慢对端最多相差这么多块
+FANOUT_MAX_STALL = 2.0            # 最慢的对端让读取等待超过这么多秒就被分离，改为自己读盘
+
+# 链式中继
+RELAY_ACK_TIMEOUT = 3600          # 中继节点要等下游全部结束才回复最终 ACK，等待上限 (秒)
+
+# 增量传输 (接收目录已有同名文件时只发变化的块)
+DELTA_ENABLED = True
+DELTA_MIN_SIZE = 1024 * 1024      # 小于此大小的文件直接整份发送
+DELTA_MIN_BLOCK = 4 * 1024        # 块大小取文件大小的平方根，限制在这个范围内
+DELTA_MAX_BLOCK = 256 * 1024
+DELTA_SCAN_WINDOW = 4 * 1024 * 1024  # 发送方向量化扫描滚动校验的窗口上限 (需要 numpy)
+DELTA_MAX_LITERAL = 256 * 1024    # 单条字面数据指令的长度上限
+DELTA_MAX_COPY = 64 * 1024 * 1024  # 单条复制指令最多覆盖的字节数，文件大段未变时接收方也能持续看到进度
+DELTA_HASH_THREADS = 4            # 接收方计算块签名的线程数
+DELTA_INDEX_MAX = 1024            # 接收方记录来源的已收文件数上限，只有同一发送方发来的文件才作为增量基准
+
+# 限速 (字节/秒，0 为不限)，运行中可通过界面或 RateLimiter.set_limits 修改
+RATE_LIMIT_SEND = 0               # 所有发送合计
+RATE_LIMIT_SEND_PER_PEER = 0      # 发往单个对端
+RATE_LIMIT_RECV = 0               # 所有接收合计
+RATE_LIMIT_RECV_PER_PEER = 0      # 来自单个对端
+RATE_LIMIT_BURST = 0.1            # 令牌桶最多积攒这么多秒的额度
+RATE_LIMIT_SLICE = 0.01           # 限速时每块数据约为这么多秒的量，并发传输轮流发送
+
+# 文字合并发送 (对端声明支持 text_batch 时)
+TEXT_BATCH_ENABLED = True
+TEXT_BATCH_WINDOW = 0.005         # 第一条文字最多等待这么久，收集同一对端的后续文字
+TEXT_BATCH_MAX_ITEMS = 512        # 单批最多条数
+TEXT_BATCH_MAX_BYTES = 1024 * 1024  # 单批文字总长度上限 (字符)
+TEXT_BATCH_MAX_PENDING = 1024     # 每个对端等待合并的文字上限，超出时 send_text 阻塞 (背压)
+
+# 指标端点 (只监听本机)，端口为 0 时由系统分配
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 52527
+
+# 接收服务器
+SERVER_ENGINE = "thread"          # "thread": 每连接一个线程; "asyncio": 单事件循环 (适合大量设备)
+SERVER_BACKLOG = 128              # listen 队列长度
+ASYNC_MAX_CONNECTIONS = 4096      # asyncio 引擎同时保持的连接上限
+ASYNC_MAX_FILE_TRANSFERS = 16     # asyncio 引擎同时进行的文件传输上限，超出的排队等待
+
+# 启动
+STARTUP_BUDGET = 1.5              # 从进程启动到主窗口显示的时间预算 (秒)，benchmarks/startup_bench.py 超出时失败
+
+@lru_cache(maxsize=None)
 def get_device_name():
     hostname = socket.gethostname()
     system = platform.system()
     return f"{hostname} ({system})"
 
+@lru_cache(maxsize=None)
 def get_local_ip():
-    """TCP 连接获取本地 IP"""
+    """UDP connect 获取本地 IP (不发送数据)，结果缓存"""
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
@@ -31,8 +149,11 @@ def get_local_ip():
 
 # 文件接收目录
 RECEIVE_DIR = os.path.join(os.path.expanduser("~"), "EasyConnect_Received")
-if not os.path.exists(RECEIVE_DIR):
-    os.makedirs(RECEIVE_DIR)
+
+def ensure_receive_dir() -> str:
+    """确保接收目录存在 (接收端启动、打开目录时调用)"""
+    os.makedirs(RECEIVE_DIR, exist_ok=True)
+    return RECEIVE_DIR
 
 # UI配置
 WINDOW_WIDTH = 400
@@ -44,4 +165,8 @@ class MessageType:
     TEXT = "TEXT"
     FILE = "FILE"
     FILE_INFO = "FILE_INFO"
+    FILE_RANGE = "FILE_RANGE"
+    HELLO = "HELLO"
+    TEXT_BATCH = "TEXT_BATCH"
+    TRAILER = "TRAILER"
     ACK = "ACK"
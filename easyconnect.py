@@ -0,0 +1,362 @@
+"""EasyConnect 命令行 - 不加载 PySide6，只运行网络核心，适合服务器、CI 和脚本批量传输
+
+    python easyconnect.py send HOST[:PORT] FILE... [--text TEXT] [--stdin]
+                               [--relay HOST[:PORT],... | --relay-discovered]
+    python easyconnect.py recv [--count N] [--timeout S] [--dir DIR]
+    python easyconnect.py serve [--no-discovery]
+    python easyconnect.py peers [--timeout S]
+
+结果写到 stdout，--json 时每行一个 JSON 对象；网络模块的日志改写到 stderr (--quiet 关闭)。
+退出码: 0 成功，1 有传输失败或出错，2 参数错误，3 超时。
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import TRANSFER_PORT, SERVER_ENGINE, METRICS_ENABLED
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_TIMEOUT = 3
+
+
+class _Output:
+    """结果输出: 人类可读的一行文字，或 JSON Lines (回调来自网络线程，加锁写出)"""
+
+    def __init__(self, stream, as_json: bool):
+        self.stream = stream
+        self.as_json = as_json
+        self._lock = threading.Lock()
+
+    def emit(self, record: dict, text: str):
+        line = json.dumps(record, ensure_ascii=False) if self.as_json else text
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def _parse_target(text: str) -> Tuple[str, int]:
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        return text, TRANSFER_PORT
+    return host, int(port)
+
+
+def _format_size(n: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _set_receive_dir(path: str):
+    """修改接收目录，必须在导入 network 之前 (各模块导入时拷贝 RECEIVE_DIR)"""
+    import config
+    path = os.path.abspath(path)
+    os.makedirs(path, exist_ok=True)
+    config.RECEIVE_DIR = path
+
+
+def _wait_for_signal(stop: threading.Event, timeout: Optional[float] = None) -> bool:
+    """等到 Ctrl+C / SIGTERM 或 stop 被设置；超时返回 False"""
+    def _handler(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, _handler)
+    signal.signal(signal.SIGTERM, _handler)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not stop.is_set():
+        left = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+        if left <= 0:
+            return False
+        stop.wait(left)  # 分段等待，主线程能及时处理信号
+    return True
+
+
+# ---- send ----
+
+def cmd_send(args, out: _Output) -> int:
+    texts: List[str] = list(args.text or [])
+    if args.stdin:
+        texts.append(sys.stdin.read())
+    if not texts and not args.files:
+        print("send: 需要至少一个文件或 --text/--stdin", file=sys.stderr)
+        return EXIT_USAGE
+
+    host, port = _parse_target(args.target)
+    target = f"{host}:{port}"
+    chain = None
+    if args.relay or args.relay_discovered:
+        try:
+            chain = _relay_chain(args, (host, port))
+        except ImportError as e:
+            print(f"send: --relay-discovered 需要 zeroconf ({e})", file=sys.stderr)
+            return EXIT_FAILED
+
+    from network.transfer import FileTransfer
+    transfer = FileTransfer()
+    jobs = []  # (记录, 句柄, 起止时间)
+    failed = 0
+
+    def _track(record: dict, handle):
+        timing = {'started': time.monotonic()}
+        handle.add_done_callback(lambda h: timing.setdefault('finished', time.monotonic()))
+        jobs.append((record, handle, timing))
+
+    try:
+        for text in texts:
+            _track({'kind': 'text', 'bytes': len(text.encode('utf-8'))},
+                   transfer.send_text(host, port, text))
+        for path in args.files:
+            if not os.path.isfile(path):
+                out.emit({'event': 'sent', 'kind': 'file', 'target': target, 'path': path,
+                          'ok': False, 'error': "不是文件或不存在"},
+                         f"FAIL  {path}: 不是文件或不存在")
+                failed += 1
+                continue
+            if chain:
+                _track({'kind': 'file', 'path': path, 'bytes': os.path.getsize(path),
+                        'relay': [f"{ip}:{p}" for ip, p in chain[1:]]},
+                       transfer.send_file_relay(chain, path))
+            else:
+                _track({'kind': 'file', 'path': path, 'bytes': os.path.getsize(path)},
+                       transfer.send_file(host, port, path, streams=args.streams))
+
+        deadline = None if args.timeout is None else time.monotonic() + args.timeout
+        for record, handle, timing in jobs:
+            name = record.get('path', 'text')
+            result = {'event': 'sent', 'target': target, **record}
+            try:
+                value = handle.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                for _, pending, _ in jobs:
+                    pending.cancel()
+                out.emit(dict(result, ok=False, error="超时"), f"FAIL  {name}: 超时")
+                return EXIT_TIMEOUT
+            except Exception as e:
+                failed += 1
+                out.emit(dict(result, ok=False, error=str(e)), f"FAIL  {name}: {e}")
+                continue
+            # 完成回调可能晚于 result() 返回
+            seconds = timing.get('finished', time.monotonic()) - timing['started']
+            result.update(ok=True, seconds=round(seconds, 6))
+            rate = record['bytes'] / seconds if seconds > 0 else 0
+            line = f"{name}  {_format_size(record['bytes'])}  {seconds:.2f}s  {_format_size(rate)}/s"
+            if 'relay' in record:
+                # 中继的结果按对端给出，链上任一对端没收到都算失败
+                delivered = [f"{ip}:{p}" for ip, p in value['delivered']]
+                missed = [f"{ip}:{p}" for ip, p in value['failed']]
+                result.update(ok=not missed, delivered=delivered, failed=missed)
+                if missed:
+                    failed += 1
+                    out.emit(result, f"FAIL  {name}: {len(delivered)}/{len(chain)} 个对端收到，"
+                                     f"未送达: {', '.join(missed)}")
+                    continue
+                line += f"  {len(chain)} 个对端收到"
+            out.emit(result, f"OK    {line}")
+    finally:
+        transfer.close()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def _relay_chain(args, first: Tuple[str, int]) -> List[Tuple[str, int]]:
+    """--relay 给出的对端，加上 --relay-discovered 时浏览到的设备，接在目标之后组成中继链"""
+    from network.relay import build_chain
+    peers = [_parse_target(item.strip()) for item in (args.relay or '').split(',') if item.strip()]
+    if args.relay_discovered:
+        peers += [(d.ip, d.port) for d in _discover(args.browse)]  # 发现结果不含本机
+    return build_chain(first, peers)
+
+
+def _discover(seconds: float) -> list:
+    """浏览 seconds 秒，返回发现的设备；未安装 zeroconf 时抛出 ImportError"""
+    from network.discovery import DeviceDiscovery
+    discovery = DeviceDiscovery()
+    discovery.start(register=False)
+    try:
+        time.sleep(seconds)
+        return discovery.get_devices()
+    finally:
+        discovery.stop()
+
+
+# ---- recv / serve ----
+
+def _start_server(args, out: _Output, on_event=None):
+    """启动接收端，收到的文字/文件输出为事件；监听失败时抛出 OSError"""
+    if args.dir:
+        _set_receive_dir(args.dir)
+    from network.transfer import TransferServer
+    if args.engine == 'asyncio':
+        from network.aio_server import AsyncTransferServer as server_class
+    else:
+        server_class = TransferServer
+
+    def _on_text(sender: str, text: str):
+        out.emit({'event': 'text', 'sender': sender, 'text': text}, f"TEXT  {sender}: {text}")
+        if on_event:
+            on_event()
+
+    def _on_file(sender: str, name: str, path: str):
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        out.emit({'event': 'file', 'sender': sender, 'name': name, 'path': path, 'bytes': size},
+                 f"FILE  {sender}: {path}")
+        if on_event:
+            on_event()
+
+    server = server_class(args.port)
+    server.set_callbacks(on_text=_on_text, on_file=_on_file)
+    server.start()
+    try:
+        if not server.wait_started(10):
+            raise OSError(f"端口 {args.port} 未能在 10 秒内开始监听")
+    except OSError:
+        server.stop()
+        raise
+    return server
+
+
+def cmd_recv(args, out: _Output) -> int:
+    stop = threading.Event()
+    received = [0]
+
+    def _on_event():
+        received[0] += 1
+        if args.count and received[0] >= args.count:
+            stop.set()
+
+    try:
+        server = _start_server(args, out, _on_event)
+    except OSError as e:
+        print(f"recv: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    out.emit({'event': 'listening', 'port': args.port}, f"LISTEN {args.port}")
+    try:
+        finished = _wait_for_signal(stop, args.timeout)
+    finally:
+        server.stop()
+    if not finished and args.count:
+        return EXIT_TIMEOUT
+    return EXIT_OK
+
+
+def cmd_serve(args, out: _Output) -> int:
+    try:
+        server = _start_server(args, out)
+    except OSError as e:
+        print(f"serve: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    discovery = metrics = None
+    try:
+        if not args.no_discovery:
+            try:
+                from network.discovery import DeviceDiscovery
+                discovery = DeviceDiscovery(args.port)
+                discovery.start()
+            except ImportError as e:
+                print(f"serve: 未安装 zeroconf，不广播本机: {e}", file=sys.stderr)
+        if METRICS_ENABLED and not args.no_metrics:
+            from network import MetricsServer
+            try:
+                metrics = MetricsServer()
+                metrics.start()
+            except OSError as e:
+                print(f"serve: 指标端点启动失败: {e}", file=sys.stderr)
+                metrics = None
+        out.emit({'event': 'listening', 'port': args.port, 'discovery': discovery is not None,
+                  'metrics': metrics.port if metrics else None}, f"LISTEN {args.port}")
+        _wait_for_signal(threading.Event())
+    finally:
+        if discovery:
+            discovery.stop()
+        if metrics:
+            metrics.stop()
+        server.stop()
+    return EXIT_OK
+
+
+# ---- peers ----
+
+def cmd_peers(args, out: _Output) -> int:
+    try:
+        devices = _discover(args.timeout)
+    except ImportError as e:
+        print(f"peers: 需要 zeroconf ({e})", file=sys.stderr)
+        return EXIT_FAILED
+    if out.as_json:
+        out.emit({'event': 'peers', 'peers': [{'name': d.name, 'ip': d.ip, 'port': d.port}
+                                             for d in devices]}, '')
+    else:
+        for d in devices:
+            out.emit({}, f"{d.ip}:{d.port}\t{d.name}")
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true', help="每行输出一个 JSON 对象")
+    common.add_argument('--quiet', action='store_true', help="不输出网络模块的日志")
+
+    parser = argparse.ArgumentParser(prog='easyconnect', description="EasyConnect 命令行 (无界面)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    send = commands.add_parser('send', parents=[common], help="发送文件或文字")
+    send.add_argument('target', help="接收端 HOST 或 HOST:PORT")
+    send.add_argument('files', nargs='*', help="要发送的文件")
+    send.add_argument('--text', action='append', help="发送一条文字 (可重复)")
+    send.add_argument('--stdin', action='store_true', help="把标准输入作为一条文字发送")
+    send.add_argument('--streams', type=int, help="每个文件的并行连接数 (默认按大小决定)")
+    send.add_argument('--timeout', type=float, help="全部发送完成的时限 (秒)")
+    send.add_argument('--relay', metavar='HOST[:PORT],...',
+                      help="文件经 TARGET 依次中继给这些对端 (文字只发给 TARGET)")
+    send.add_argument('--relay-discovered', action='store_true',
+                      help="把局域网内发现的设备都加入中继链，按地址排序")
+    send.add_argument('--browse', type=float, default=2,
+                      help="--relay-discovered 浏览设备的秒数")
+    send.set_defaults(handler=cmd_send)
+
+    for name, help_text in (('recv', "接收，收到指定条数或超时后退出"),
+                            ('serve', "常驻接收，并通过 mDNS 广播本机")):
+        sub = commands.add_parser(name, parents=[common], help=help_text)
+        sub.add_argument('--port', type=int, default=TRANSFER_PORT)
+        sub.add_argument('--dir', help="接收目录 (默认 config.RECEIVE_DIR)")
+        sub.add_argument('--engine', choices=('thread', 'asyncio'), default=SERVER_ENGINE)
+        if name == 'recv':
+            sub.add_argument('--count', type=int, help="收到这么多条文字/文件后退出")
+            sub.add_argument('--timeout', type=float, help="最多等待的秒数")
+            sub.set_defaults(handler=cmd_recv)
+        else:
+            sub.add_argument('--no-discovery', action='store_true', help="不广播本机")
+            sub.add_argument('--no-metrics', action='store_true', help="不启动指标端点")
+            sub.set_defaults(handler=cmd_serve)
+
+    peers = commands.add_parser('peers', parents=[common], help="列出局域网内的设备")
+    peers.add_argument('--timeout', type=float, default=2, help="浏览的秒数")
+    peers.set_defaults(handler=cmd_peers)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    out = _Output(sys.stdout, args.json)
+    # 网络模块用 print 记日志，不能混进 stdout 上的结果
+    sys.stdout = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        return args.handler(args, out)
+    except KeyboardInterrupt:
+        return EXIT_FAILED
+    finally:
+        sys.stdout = out.stream
+
+
+if __name__ == '__main__':
+    sys.exit(main())
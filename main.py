@@ -1,21 +1,37 @@
-"""EasyConnect 主程序入口"""
+"""EasyConnect 主程序入口
+
+python main.py --profile-startup 打印启动时各导入和初始化步骤的耗时 (见 utils/startup.py)。
+zeroconf、指标端点、发送面板、接收气泡和 asyncio 接收端都在第一次用到时才导入。
+"""
 import sys
 import os
 import signal
 import atexit
+from typing import TYPE_CHECKING, Optional
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from PySide6.QtWidgets import QApplication
-from PySide6.QtCore import QObject, Signal, Slot, QThread
+from utils.startup import PROFILER, PROFILE_FLAG, EXIT_FLAG
+
+with PROFILER.step("import PySide6"):
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QObject, Signal, Slot, QThread, QTimer
+
+with PROFILER.step("import network"):
+    from config import APP_NAME, TRANSFER_PORT, SERVER_ENGINE, METRICS_ENABLED, get_device_name, get_local_ip
+    import network
+    from network.transfer import FileTransfer, TransferServer
 
-from config import APP_NAME, TRANSFER_PORT, get_device_name, get_local_ip
-from network.discovery import DeviceDiscovery, Device
-from network.transfer import FileTransfer, TransferServer
-from ui.main_window import MainWindow
-from ui.send_panel import SendPanel
-from ui.receive_bubble import BubbleManager
-from utils.clipboard import ClipboardManager
+with PROFILER.step("import ui"):
+    from ui.main_window import MainWindow
+    from utils.clipboard import ClipboardManager
+    from utils.services import ServiceState, ServiceStatus, StartupOrchestrator
+
+if TYPE_CHECKING:
+    from network.discovery import Device, DeviceDiscovery
+    from network.metrics import MetricsServer
+    from ui.receive_bubble import BubbleManager
+    from ui.send_panel import SendPanel
 
 
 class EasyConnectApp(QObject):
@@ -26,16 +42,22 @@ class EasyConnectApp(QObject):
     text_received_signal = Signal(str, str)  # sender, text
     file_received_signal = Signal(str, str, str)  # sender, filename, filepath
     transfer_progress_signal = Signal(str, int, int)  # filename, current, total
+    send_progress_signal = Signal(int, int)  # current, total
+    send_stats_signal = Signal(str)  # 速率/剩余时间描述
     send_success_signal = Signal()
     send_error_signal = Signal(str)
+    service_status_signal = Signal(str, str, str)  # 服务名, 状态, 错误信息
     
     def __init__(self):
         super().__init__()
         
         self._stopped = False
+        self.startup: Optional[StartupOrchestrator] = None
+        self._profile_reported = False
         
-        # 创建应用
-        self.app = QApplication(sys.argv)
+        # 创建应用 (启动分析参数不传给 Qt)
+        with PROFILER.step("QApplication"):
+            self.app = QApplication([arg for arg in sys.argv if arg not in (PROFILE_FLAG, EXIT_FLAG)])
         self.app.setApplicationName(APP_NAME)
         
         # 连接退出信号
@@ -51,45 +73,83 @@ class EasyConnectApp(QObject):
         print(f"[App] IP地址: {get_local_ip()}")
     
     def _init_network(self):
-        self.discovery = DeviceDiscovery()
-        self.discovery.set_callbacks(
-            on_found=self._on_device_found,
-            on_lost=self._on_device_lost
-        )
-        self.transfer = FileTransfer()
-        self.server = TransferServer(TRANSFER_PORT)
+        # 设备发现在 start() 中创建 (届时才导入 zeroconf)
+        self.discovery: Optional['DeviceDiscovery'] = None
+        with PROFILER.step("FileTransfer"):
+            self.transfer = FileTransfer()
+        if SERVER_ENGINE == "asyncio":
+            from network.aio_server import AsyncTransferServer as server_class
+        else:
+            server_class = TransferServer
+        self.server = server_class(TRANSFER_PORT)
+        self.server.relay_transfer = self.transfer  # 中继转发与本机发送共用连接池和限速
         self.server.set_callbacks(
             on_text=self._on_text_received,
             on_file=self._on_file_received,
             on_progress=self._on_transfer_progress
         )
+        self.metrics_server: Optional['MetricsServer'] = None  # 在 _start_metrics 中创建
     
     def _init_ui(self):
-        self.main_window = MainWindow()
-        self.send_panel = SendPanel()
-        self.bubble_manager = BubbleManager()
-        self.clipboard_manager = ClipboardManager(self.app)
+        with PROFILER.step("MainWindow"):
+            self.main_window = MainWindow()
+        with PROFILER.step("ClipboardManager"):
+            self.clipboard_manager = ClipboardManager(self.app)
+        # 发送面板和接收气泡第一次用到时才创建
+        self._send_panel: Optional['SendPanel'] = None
+        self._bubble_manager: Optional['BubbleManager'] = None
+    
+    @property
+    def send_panel(self) -> 'SendPanel':
+        if self._send_panel is None:
+            from ui.send_panel import SendPanel
+            self._send_panel = SendPanel()
+            if self.discovery:
+                self._send_panel.update_devices({d.ip: d.name for d in self.discovery.get_devices()})
+            self._send_panel.send_to_device.connect(self._on_send_panel_device_selected)
+        return self._send_panel
+    
+    @property
+    def bubble_manager(self) -> 'BubbleManager':
+        if self._bubble_manager is None:
+            from ui.receive_bubble import BubbleManager
+            self._bubble_manager = BubbleManager()
+        return self._bubble_manager
     
     def _connect_signals(self):
         self.device_found_signal.connect(self.main_window.add_device)
         self.device_lost_signal.connect(self.main_window.remove_device)
+        self.device_found_signal.connect(self._on_device_added)
+        self.device_lost_signal.connect(self._on_device_removed)
         self.text_received_signal.connect(self._handle_text_received)
         self.file_received_signal.connect(self._handle_file_received)
         self.main_window.send_text_requested.connect(self._send_text)
         self.main_window.send_file_requested.connect(self._send_file)
-        self.send_panel.send_to_device.connect(self._on_send_panel_device_selected)
+        self.main_window.rate_limit_changed.connect(self._on_rate_limit_changed)
+        self.send_progress_signal.connect(self.main_window.update_progress)
+        self.send_stats_signal.connect(self._on_send_stats)
         self.send_success_signal.connect(self._on_send_success)
         self.send_error_signal.connect(self._on_send_error)
         self.clipboard_manager.clipboard_changed.connect(self._on_clipboard_changed)
+        self.service_status_signal.connect(self._on_service_status)
     
-    def _on_device_found(self, device: Device):
-        self.send_panel.add_device(device.ip, device.name)
+    def _on_device_found(self, device: 'Device'):
         self.device_found_signal.emit(device.ip, device.name)
     
     def _on_device_lost(self, ip: str):
-        self.send_panel.remove_device(ip)
         self.device_lost_signal.emit(ip)
     
+    @Slot(str, str)
+    def _on_device_added(self, ip: str, name: str):
+        # 面板还没创建时不必更新，创建时会读取完整的设备列表
+        if self._send_panel:
+            self._send_panel.add_device(ip, name)
+    
+    @Slot(str)
+    def _on_device_removed(self, ip: str):
+        if self._send_panel:
+            self._send_panel.remove_device(ip)
+    
     def _on_text_received(self, sender: str, text: str):
         self.text_received_signal.emit(sender, text)
     
@@ -112,25 +172,26 @@ class EasyConnectApp(QObject):
         self.bubble_manager.show_file_bubble(sender, filename, filepath)
         self.main_window.add_receive_item(sender, filename, is_file=True)
     
+    def _peer_port(self, target_ip: str) -> int:
+        device = self.discovery.get_device_by_ip(target_ip) if self.discovery else None
+        return device.port if device else TRANSFER_PORT
+    
     @Slot(str, str)
     def _send_text(self, target_ip: str, text: str):
-        device = self.discovery.get_device_by_ip(target_ip)
-        port = device.port if device else TRANSFER_PORT
         self.transfer.send_text(
-            target_ip, port, text,
+            target_ip, self._peer_port(target_ip), text,
             on_success=lambda: self.send_success_signal.emit(),
             on_error=lambda e: self.send_error_signal.emit(e)
         )
     
     @Slot(str, str)
     def _send_file(self, target_ip: str, file_path: str):
-        device = self.discovery.get_device_by_ip(target_ip)
-        port = device.port if device else TRANSFER_PORT
         self.transfer.send_file(
-            target_ip, port, file_path,
-            on_progress=lambda c, t: self.main_window.update_progress(c, t),
+            target_ip, self._peer_port(target_ip), file_path,
+            on_progress=lambda c, t: self.send_progress_signal.emit(c, t),
             on_success=lambda: self.send_success_signal.emit(),
-            on_error=lambda e: self.send_error_signal.emit(e)
+            on_error=lambda e: self.send_error_signal.emit(e),
+            on_stats=lambda stats: self.send_stats_signal.emit(stats.describe())
         )
     
     @Slot(str)
@@ -141,6 +202,15 @@ class EasyConnectApp(QObject):
         else:
             self._send_file(ip, content)
     
+    @Slot(int, int)
+    def _on_rate_limit_changed(self, send_rate: int, recv_rate: int):
+        self.transfer.limiter.set_limits(rate=send_rate)
+        self.server.limiter.set_limits(rate=recv_rate)
+    
+    @Slot(str)
+    def _on_send_stats(self, text: str):
+        self.main_window.statusBar().showMessage(f"发送中: {text}", 2000)
+    
     @Slot()
     def _on_send_success(self):
         self.main_window.statusBar().showMessage("发送成功！", 3000)
@@ -154,21 +224,101 @@ class EasyConnectApp(QObject):
         preview = text[:30] + "..." if len(text) > 30 else text
         self.main_window.statusBar().showMessage(f"剪贴板: {preview}", 2000)
     
-    def start(self):
-        """启动应用"""
-        self.discovery.start()
+    # 后台服务的显示名
+    SERVICE_LABELS = {
+        'server': "接收",
+        'browse': "发现",
+        'register': "广播",
+        'metrics': "指标",
+        'clipboard': "剪贴板",
+    }
+    
+    def _start_server(self):
         self.server.start()
-        self.clipboard_manager.start_monitoring()
-        self.main_window.show()
+        if not self.server.wait_started(10):  # 端口被占用时抛出 OSError
+            raise TimeoutError("接收端未能在 10 秒内开始监听")
+    
+    def _start_browsing(self):
+        from network.discovery import DeviceDiscovery  # 此时才导入 zeroconf
+        discovery = DeviceDiscovery()
+        discovery.set_callbacks(
+            on_found=self._on_device_found,
+            on_lost=self._on_device_lost
+        )
+        discovery.start(register=False)
+        self.discovery = discovery
+    
+    def _start_metrics(self):
+        metrics_server = network.MetricsServer()
+        metrics_server.start()
+        self.metrics_server = metrics_server
+
+    def _start_services(self) -> StartupOrchestrator:
+        """接收端、mDNS 浏览与注册、指标端点、剪贴板监控同时启动，不阻塞窗口"""
+        startup = StartupOrchestrator(on_status=self._report_service_status)
+        startup.add('server', self._start_server)
+        startup.add('browse', self._start_browsing)
+        # 注册要做 mDNS 探测，可能阻塞数秒，只等 zeroconf 建好
+        startup.add('register', lambda: self.discovery.register(), after=('browse',))
+        if METRICS_ENABLED:
+            startup.add('metrics', self._start_metrics)
+        startup.add('clipboard', self.clipboard_manager.start_monitoring, main_thread=True)
+        startup.start()
+        return startup
+    
+    def _report_service_status(self, status: ServiceStatus):
+        # 在服务的启动线程里调用，转到主线程处理
+        self.service_status_signal.emit(status.name, status.state.value, status.error or "")
+    
+    @Slot(str, str, str)
+    def _on_service_status(self, name: str, state: str, error: str):
+        label = self.SERVICE_LABELS.get(name, name)
+        if state == ServiceState.READY.value:
+            PROFILER.mark(f"{name}_ready")
+            print(f"[App] {label}服务已就绪")
+        elif state == ServiceState.FAILED.value:
+            PROFILER.mark(f"{name}_failed")
+            print(f"[App] {label}服务启动失败: {error}")
+        self.main_window.set_service_status(label, state, error)
+        self._finish_profile()
+    
+    def start(self):
+        """启动应用: 先显示窗口，各后台服务随后并行启动，就绪情况显示在状态栏"""
+        with PROFILER.step("window.show"):
+            self.main_window.show()
+        PROFILER.mark("window_shown")
+        self.startup = self._start_services()
         print("[App] EasyConnect 已启动")
+        if PROFILER.enabled:
+            QTimer.singleShot(0, self._on_event_loop_started)
         return self.app.exec()
     
+    @Slot()
+    def _on_event_loop_started(self):
+        PROFILER.mark("event_loop_running")
+        self._finish_profile()
+    
+    def _finish_profile(self):
+        """窗口已可见且各服务都结束启动后，打印启动报告"""
+        if not PROFILER.enabled or self._profile_reported:
+            return
+        if "event_loop_running" not in PROFILER.marks or not self.startup.finished():
+            return
+        self._profile_reported = True
+        PROFILER.print_report()
+        if EXIT_FLAG in sys.argv:
+            self.app.quit()
+    
     def stop(self):
         """停止应用"""
         if self._stopped:
             return
         self._stopped = True
         
+        # 还在启动的服务 (如 mDNS 注册) 稍等片刻，避免与下面的停止交错
+        if self.startup:
+            self.startup.wait(timeout=2)
+        
         print("[App] 1. 开始关闭，停止剪贴板监控...")
         try:
             self.clipboard_manager.stop_monitoring()
@@ -181,15 +331,25 @@ class EasyConnectApp(QObject):
         except Exception as e:
             print(f"[App] 停止服务器出错: {e}")
         
+        try:
+            self.transfer.close()
+        except Exception as e:
+            print(f"[App] 关闭发送连接出错: {e}")
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
         print("[App] 3. 停止设备发现服务...")
         try:
-            self.discovery.stop()
+            if self.discovery:
+                self.discovery.stop()
         except Exception as e:
             print(f"[App] 停止发现服务出错: {e}")
         
         print("[App] 4. 清理气泡...")
         try:
-            self.bubble_manager.clear_all()
+            if self._bubble_manager:
+                self._bubble_manager.clear_all()
         except Exception as e:
             print(f"[App] 清理气泡出错: {e}")
         
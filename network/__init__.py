@@ -1,7 +1,14 @@
 """
 网络模块初始化
+
+各类在第一次访问时才导入: 只收发文件的进程 (命令行、基准测试) 不必加载 zeroconf 和 asyncio 服务器。
 """
-from .discovery import DeviceDiscovery
-from .transfer import FileTransfer, TransferServer
+from utils.lazy import install
 
-__all__ = ['DeviceDiscovery', 'FileTransfer', 'TransferServer']
+install(__name__, {
+    'DeviceDiscovery': '.discovery',
+    'FileTransfer': '.transfer',
+    'TransferServer': '.transfer',
+    'AsyncTransferServer': '.aio_server',
+    'MetricsServer': '.metrics',
+})
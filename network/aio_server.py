@@ -0,0 +1,254 @@
+"""asyncio 接收服务器 - 单个事件循环承载大量空闲/活跃连接"""
+import asyncio
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+import sys
+sys.path.append('..')
+from config import (TRANSFER_PORT, KEEPALIVE_TIMEOUT, MAX_HEADER_SIZE,
+                    ASYNC_MAX_CONNECTIONS, ASYNC_MAX_FILE_TRANSFERS, PARALLEL_MAX_STREAMS,
+                    MessageType, ensure_receive_dir)
+from .framing import FRAME_HEADER, PROTOCOL_VERSION, decode_frame, parse_frame_length
+from .partial import cleanup_stale
+from .protocol import RecvBuffer
+from .transfer import TransferServer, _SERVER_ACCEPTED
+from .tuning import set_nodelay
+
+
+class AsyncTransferServer(TransferServer):
+    """TransferServer 的 asyncio 引擎，回调接口 (set_callbacks) 与线程版相同
+
+    接入、长连接空闲等待、消息头解析和文字应答都在一个事件循环里完成，
+    不再为每个连接占用一个线程。消息分派与线程版共用 (TransferServer._respond)，
+    这里只负责读写连接。文件数据体交给有界线程池，复用线程版的
+    续传/并行/压缩接收逻辑；同时进行的文件传输数受 max_file_transfers 限制，
+    超出的请求在事件循环里排队，不占线程。
+    """
+
+    def __init__(self, port: int = TRANSFER_PORT,
+                 max_connections: int = ASYNC_MAX_CONNECTIONS,
+                 max_file_transfers: int = ASYNC_MAX_FILE_TRANSFERS):
+        super().__init__(port)
+        self.max_connections = max_connections
+        self.max_file_transfers = max_file_transfers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._listening.clear()
+        self.start_error = None
+        self._loop = asyncio.new_event_loop()
+        # 每个文件传输最多占用 1 条控制连接 + PARALLEL_MAX_STREAMS 条分段连接
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_file_transfers * (PARALLEL_MAX_STREAMS + 1),
+            thread_name_prefix='transfer-file'
+        )
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        print(f"[Server] 传输服务器已启动 (asyncio)，端口: {self.port}")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            print(f"[Server] 事件循环异常退出: {e}")
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        ensure_receive_dir()
+        cleanup_stale()
+        self._stop_event = asyncio.Event()
+        self._conn_slots = asyncio.Semaphore(self.max_connections)
+        self._file_slots = asyncio.Semaphore(self.max_file_transfers)
+
+        if not self._listen():
+            return
+        self.server_socket.setblocking(False)
+
+        accept_task = asyncio.ensure_future(self._accept_loop())
+        await self._stop_event.wait()
+
+        accept_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(accept_task, *self._tasks, return_exceptions=True)
+
+    async def _accept_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            await self._conn_slots.acquire()
+            try:
+                conn, addr = await loop.sock_accept(self.server_socket)
+            except asyncio.CancelledError:
+                self._conn_slots.release()
+                raise
+            except OSError as e:
+                self._conn_slots.release()
+                if self._running:
+                    print(f"[Server] 接受连接错误: {e}")
+                    await asyncio.sleep(0.1)
+                continue
+
+            _SERVER_ACCEPTED.inc()
+            conn.setblocking(False)
+            set_nodelay(conn)
+            with self._lock:
+                self._active_connections.add(conn)
+            task = asyncio.ensure_future(self._client(conn, addr))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _client(self, conn: socket.socket, addr: tuple):
+        loop = asyncio.get_running_loop()
+        buffer = RecvBuffer()
+        version = 1
+        try:
+            # 长连接: 循环处理多条消息，直到对端关闭或不再要求保持连接
+            while self._running:
+                if version == PROTOCOL_VERSION:
+                    message = await self._recv_frame(loop, conn, buffer)
+                else:
+                    message = await self._recv_message(loop, conn, buffer)
+                if message is None:
+                    break
+
+                reply = self._respond(addr, message)
+                if reply is not None:
+                    if reply.data:
+                        await loop.sock_sendall(conn, reply.data)
+                    reply.done()
+                    if reply.upgrade:
+                        version = PROTOCOL_VERSION
+                elif message.get('type') == MessageType.FILE:
+                    async with self._file_slots:
+                        await self._run_blocking(loop, conn, addr, message, buffer)
+                else:
+                    # 分段连接属于已占用名额的文件传输，不再排队，避免与控制连接互相等待
+                    await self._run_blocking(loop, conn, addr, message, buffer)
+
+                if not message.get('keep_alive'):
+                    break
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if self._running:
+                print(f"[Server] 处理客户端错误: {e}")
+        finally:
+            with self._lock:
+                self._active_connections.discard(conn)
+            try:
+                conn.close()
+            except OSError:
+                pass
+            self._conn_slots.release()
+
+    async def _recv_message(self, loop: asyncio.AbstractEventLoop, conn: socket.socket,
+                            buffer: RecvBuffer) -> Optional[dict]:
+        """异步读取一条 4 字节长度头 + JSON 消息，空闲超时或对端关闭返回 None"""
+        len_view = buffer.view(4)
+        try:
+            n = await asyncio.wait_for(loop.sock_recv_into(conn, len_view), KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        if n == 0:
+            return None
+
+        await asyncio.wait_for(_sock_recv_exact(loop, conn, len_view[n:]), 60)
+        msg_length = int.from_bytes(len_view, 'big')
+        len_view.release()
+        if msg_length > MAX_HEADER_SIZE:
+            raise ValueError(f"消息过大: {msg_length} > {MAX_HEADER_SIZE}")
+
+        view = buffer.view(msg_length)
+        try:
+            await asyncio.wait_for(_sock_recv_exact(loop, conn, view), 60)
+            return json.loads(str(view, 'utf-8'))
+        finally:
+            view.release()
+            buffer.shrink()
+
+    async def _recv_frame(self, loop: asyncio.AbstractEventLoop, conn: socket.socket,
+                          buffer: RecvBuffer) -> Optional[dict]:
+        """异步读取一个 v2 帧，空闲超时或对端关闭返回 None"""
+        header = bytearray(FRAME_HEADER.size)
+        header_view = memoryview(header)
+        try:
+            n = await asyncio.wait_for(loop.sock_recv_into(conn, header_view), KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        if n == 0:
+            return None
+
+        await asyncio.wait_for(_sock_recv_exact(loop, conn, header_view[n:]), 60)
+        view = buffer.view(parse_frame_length(header))
+        try:
+            await asyncio.wait_for(_sock_recv_exact(loop, conn, view), 60)
+            return decode_frame(header, view)
+        finally:
+            view.release()
+            buffer.shrink()
+
+    async def _run_blocking(self, loop: asyncio.AbstractEventLoop, conn: socket.socket,
+                            addr: tuple, message: dict, buffer: RecvBuffer):
+        """在线程池中以阻塞方式处理文件消息，完成后交还事件循环"""
+        conn.settimeout(60)
+        try:
+            await loop.run_in_executor(self._executor, self._handle_observed, conn, addr, message,
+                                       buffer)
+        finally:
+            conn.setblocking(False)
+
+    def stop(self):
+        """停止服务器"""
+        print("[Server] 正在停止服务器并清理连接...")
+        self._running = False
+
+        # 先断开所有连接，唤醒线程池中阻塞在 recv 上的文件传输
+        with self._lock:
+            for conn in self._active_connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        if self._loop and self._stop_event and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+            if self._thread.is_alive():
+                print("[Server] 警告: 事件循环未能及时停止")
+        self._thread = None
+
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except OSError:
+                pass
+            self.server_socket = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._close_relay()
+
+        print("[Server] 传输服务器已停止")
+
+
+async def _sock_recv_exact(loop: asyncio.AbstractEventLoop, conn: socket.socket,
+                           view: memoryview):
+    got = 0
+    size = len(view)
+    while got < size:
+        n = await loop.sock_recv_into(conn, view[got:])
+        if n == 0:
+            raise ConnectionError(f"连接已关闭: {got}/{size}")
+        got += n
@@ -0,0 +1,194 @@
+"""文字合并发送 - 短时间内发往同一对端的多条文字合成一批发送
+
+剪贴板同步等场景会在很短时间内连续发送大量小文字，逐条发送时每条都要一次请求-应答。
+这里按对端收集: 对端空闲时第一条立即发出；已有批次在途时，后续文字最多等待
+TEXT_BATCH_WINDOW 秒 (或累计达到条数/字节上限) 再整批交给发送线程池。
+同一对端同时只有一批在发送，后来的文字在下一批里，保证顺序。
+每个对端等待中的文字最多 TEXT_BATCH_MAX_PENDING 条，发送跟不上时 add() 阻塞，与发送线程池的背压一致。
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+import sys
+sys.path.append('..')
+from config import TEXT_BATCH_WINDOW, TEXT_BATCH_MAX_BYTES, TEXT_BATCH_MAX_ITEMS, TEXT_BATCH_MAX_PENDING
+from .workers import Peer, QueueFullError, TransferCancelled, TransferHandle
+
+
+@dataclass
+class TextItem:
+    text: str
+    handle: TransferHandle
+    on_success: Optional[Callable] = None
+    on_error: Optional[Callable] = None
+
+    def fail(self, error: BaseException):
+        """以 error 结束 (已结束或已取消的不变)，并回调 on_error"""
+        if self.handle.done():
+            return
+        if not self.handle.running() and not self.handle.set_running_or_notify_cancel():
+            return
+        self.handle.set_exception(error)
+        if self.on_error:
+            self.on_error(str(error))
+
+
+def settle_with(items: List[TextItem], job: TransferHandle):
+    """发送任务结束后，仍未结束的文字跟着结束
+
+    任务在队列里被取消 (关闭发送器) 时文字随之取消；提交失败或任务异常时以同一异常失败。
+    正常执行的任务已逐条给出结果，这里不会改变它们。
+    """
+    def _done(job: TransferHandle):
+        error = None if job.cancelled() else job.exception()
+        for item in items:
+            if item.handle.done():
+                continue
+            if error is None and item.handle.cancel() and item.handle.done():
+                continue
+            item.fail(error or TransferCancelled("发送已取消"))
+    job.add_done_callback(_done)
+
+
+@dataclass
+class _Pending:
+    started: float
+    items: List[TextItem] = field(default_factory=list)
+    size: int = 0
+
+
+class TextBatcher:
+    """按对端合并文字
+
+    flush(peer, items) 负责发送一批并返回其任务句柄；句柄完成后该对端的下一批才会发出。
+    flush 抛出异常时，这一批的每条文字都以该异常失败。
+    """
+
+    def __init__(self, flush: Callable[[Peer, List[TextItem]], TransferHandle],
+                 window: float = TEXT_BATCH_WINDOW, max_bytes: int = TEXT_BATCH_MAX_BYTES,
+                 max_items: int = TEXT_BATCH_MAX_ITEMS, max_pending: int = TEXT_BATCH_MAX_PENDING):
+        self._flush = flush
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.max_pending = max_pending
+        self._pending: Dict[Peer, _Pending] = {}
+        self._in_flight: Set[Peer] = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='text-batcher', daemon=True)
+        self._thread.start()
+
+    def add(self, peer: Peer, text: str, on_success: Optional[Callable] = None,
+            on_error: Optional[Callable] = None, block: bool = True,
+            timeout: Optional[float] = None) -> TransferHandle:
+        """加入该对端的下一批；等待中的文字已达上限时阻塞，block=False 或超过 timeout 抛出 QueueFullError"""
+        item = TextItem(text, TransferHandle(peer), on_success, on_error)
+        with self._cond:
+            has_room = self._cond.wait_for(
+                lambda: self._closed or self._queued(peer) < self.max_pending,
+                timeout if block else 0
+            )
+            if self._closed:
+                raise RuntimeError("发送线程池已关闭")
+            if not has_room:
+                raise QueueFullError(f"发往 {peer[0]} 的文字过多 ({self.max_pending} 条等待中)")
+            pending = self._pending.get(peer)
+            if pending is None:
+                # 该对端空闲时不等待，单条文字没有额外延迟；有批次在途时才开始收集
+                started = time.monotonic()
+                if peer not in self._in_flight:
+                    started -= self.window
+                pending = self._pending[peer] = _Pending(started)
+            pending.items.append(item)
+            pending.size += len(text)
+            self._cond.notify_all()
+        return item.handle
+
+    def _queued(self, peer: Peer) -> int:
+        pending = self._pending.get(peer)
+        return len(pending.items) if pending else 0
+
+    def _full(self, pending: _Pending) -> bool:
+        return len(pending.items) >= self.max_items or pending.size >= self.max_bytes
+
+    def _take_due(self, now: float) -> tuple:
+        """取出一个到期 (或已满) 且没有批次在途的对端
+
+        返回 (peer, 条目)；没有可发的批次时返回 (None, 最早到期时间或 None)。
+        """
+        wake = None
+        for peer, pending in self._pending.items():
+            if peer in self._in_flight:
+                continue
+            due = pending.started + self.window
+            if due <= now or self._full(pending):
+                del self._pending[peer]
+                return peer, pending.items
+            wake = due if wake is None else min(wake, due)
+        return None, wake
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    peer, result = self._take_due(time.monotonic())
+                    if peer is not None:
+                        items = result
+                        self._in_flight.add(peer)
+                        self._cond.notify_all()  # 等待中的文字减少，唤醒阻塞的 add()
+                        break
+                    wake = result
+                    self._cond.wait(None if wake is None else max(0.0, wake - time.monotonic()))
+
+            self._dispatch(peer, items)
+
+    def _dispatch(self, peer: Peer, items: List[TextItem]):
+        # 超过上限的部分留到下一批
+        batch, rest, size = [], [], 0
+        for item in items:
+            if batch and (len(batch) >= self.max_items or size + len(item.text) > self.max_bytes):
+                rest.append(item)
+            else:
+                batch.append(item)
+                size += len(item.text)
+        if rest:
+            with self._cond:
+                closed = self._closed
+                if not closed:
+                    pending = self._pending.get(peer)
+                    merged = _Pending(0.0, rest + (pending.items if pending else []))
+                    merged.size = sum(len(item.text) for item in merged.items)
+                    self._pending[peer] = merged
+            if closed:
+                # close() 已取消了排队的文字，拆出来的剩余部分同样取消
+                for item in rest:
+                    item.handle.cancel()
+
+        try:
+            handle = self._flush(peer, batch)
+        except Exception as e:
+            for item in batch:
+                item.fail(e)
+            self._done(peer)
+            return
+        handle.add_done_callback(lambda _: self._done(peer))
+
+    def _done(self, peer: Peer):
+        with self._cond:
+            self._in_flight.discard(peer)
+            self._cond.notify_all()
+
+    def close(self):
+        """取消尚未交给 flush 的文字 (已提交的批次由 flush 返回的句柄负责结束)"""
+        with self._cond:
+            self._closed = True
+            items = [item for pending in self._pending.values() for item in pending.items]
+            self._pending.clear()
+            self._cond.notify_all()
+        for item in items:
+            item.handle.cancel()
@@ -0,0 +1,152 @@
+"""流式压缩模块 - 按传输协商编码，按块决定是否压缩
+
+数据按 COMPRESS_CHUNK 切块，每块前加 9 字节块头:
+    1字节标志 (0 原样 / 1 压缩) + 4字节载荷长度 + 4字节原始长度
+压缩效果不好的块原样发送，已压缩的媒体文件在协商前就通过试压一块样本跳过。
+"""
+import struct
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import sys
+sys.path.append('..')
+from config import COMPRESS_CHUNK, COMPRESS_MIN_SAVING, COMPRESS_MIN_SIZE, COMPRESS_SAMPLE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+FRAME_HEADER = struct.Struct('>BII')
+FLAG_RAW = 0
+FLAG_COMPRESSED = 1
+
+# 连续这么多块压不动就暂停尝试，之后每隔这么多块再试一次
+_BACKOFF_CHUNKS = 8
+
+
+def _zstd_codec() -> Tuple[Callable, Callable]:
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+    return (compressor.compress,
+            lambda data, size: decompressor.decompress(data, max_output_size=size))
+
+
+def _lz4_codec() -> Tuple[Callable, Callable]:
+    return lz4_frame.compress, _lz4_decompress
+
+
+def _lz4_decompress(data: bytes, size: int) -> bytes:
+    """最多解出 size 字节；帧没有恰好在 size 处结束 (数据更长或帧后有多余字节) 时拒绝该块"""
+    decompressor = lz4_frame.LZ4FrameDecompressor()
+    out = decompressor.decompress(data, max_length=size)
+    if not decompressor.eof or decompressor.unused_data:
+        raise ValueError(f"lz4 块解压长度与块头 ({size}) 不符")
+    return out
+
+
+def _zlib_codec() -> Tuple[Callable, Callable]:
+    return (lambda data: zlib.compress(data, 1),
+            lambda data, size: zlib.decompressobj().decompress(data, size))
+
+
+# 按优先级排列
+_CODECS: Dict[str, Callable[[], Tuple[Callable, Callable]]] = {}
+if zstandard is not None:
+    _CODECS['zstd'] = _zstd_codec
+if lz4_frame is not None:
+    _CODECS['lz4'] = _lz4_codec
+_CODECS['zlib'] = _zlib_codec
+
+
+def available_codecs() -> List[str]:
+    return list(_CODECS)
+
+
+def pick_codec(offered) -> Optional[str]:
+    """接收方从发送方提供的列表中选第一个自己也支持的编码"""
+    if not isinstance(offered, list):
+        return None
+    for name in offered:
+        if name in _CODECS:
+            return name
+    return None
+
+
+def sample_saving(file_path: str, file_size: int) -> float:
+    """从文件中间取 COMPRESS_SAMPLE 字节用 zlib 最快档试压，返回省下的比例 (已压缩数据接近 0)"""
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, (file_size - COMPRESS_SAMPLE) // 2))
+        sample = f.read(COMPRESS_SAMPLE)
+    if not sample:
+        return 0.0
+    return 1 - len(zlib.compress(sample, 1)) / len(sample)
+
+
+def worth_compressing(file_path: str, file_size: int) -> bool:
+    """文件不小于 COMPRESS_MIN_SIZE 且样本至少省下 COMPRESS_MIN_SAVING 才值得协商压缩"""
+    if file_size < COMPRESS_MIN_SIZE:
+        return False
+    try:
+        return sample_saving(file_path, file_size) >= COMPRESS_MIN_SAVING
+    except OSError:
+        return False
+
+
+class ChunkEncoder:
+    """发送端: 把原始数据块编码成带块头的帧"""
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        self._compress, _ = _CODECS[codec]()
+        self._misses = 0
+        self._skip = 0
+
+    def encode(self, chunk: bytes) -> Tuple[bytes, bytes]:
+        """返回 (块头, 载荷)"""
+        if self._skip:
+            self._skip -= 1
+            return FRAME_HEADER.pack(FLAG_RAW, len(chunk), len(chunk)), chunk
+
+        packed = self._compress(chunk)
+        if len(packed) <= len(chunk) * (1 - COMPRESS_MIN_SAVING):
+            self._misses = 0
+            return FRAME_HEADER.pack(FLAG_COMPRESSED, len(packed), len(chunk)), packed
+
+        self._misses += 1
+        if self._misses >= _BACKOFF_CHUNKS:
+            self._misses = 0
+            self._skip = _BACKOFF_CHUNKS
+        return FRAME_HEADER.pack(FLAG_RAW, len(chunk), len(chunk)), chunk
+
+
+class ChunkDecoder:
+    """接收端: 解析块头并还原原始数据"""
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        _, self._decompress = _CODECS[codec]()
+
+    @staticmethod
+    def parse_header(header) -> Tuple[int, int, int]:
+        flag, stored, raw = FRAME_HEADER.unpack(header)
+        if flag not in (FLAG_RAW, FLAG_COMPRESSED) or raw > COMPRESS_CHUNK:
+            raise ValueError(f"压缩块头无效: {flag}/{stored}/{raw}")
+        if flag == FLAG_RAW and stored != raw:
+            raise ValueError("原样块长度不一致")
+        if stored > COMPRESS_CHUNK + 1024:
+            raise ValueError(f"压缩块过大: {stored}")
+        return flag, stored, raw
+
+    def decode(self, flag: int, payload, raw: int):
+        if flag == FLAG_RAW:
+            return payload
+        data = self._decompress(bytes(payload), raw)
+        if len(data) != raw:
+            raise ValueError(f"解压长度不一致: {len(data)}/{raw}")
+        return data
@@ -0,0 +1,291 @@
+"""增量传输 - rsync 式的块签名匹配，只发送变化的部分
+
+接收方已有同一发送方之前发来的同名文件时 (见 partial.ReceivedIndex)，按块计算签名 (zlib.adler32 弱校验 + 强摘要) 发给发送方；
+发送方在新文件中任意偏移处寻找与旧文件某块相同的数据，相同的块只发一条复制指令，
+其余作为字面数据发送。接收方用旧文件和指令重建新文件，再替换原文件。
+
+装了 numpy 时，发送方一次算出一个窗口内所有偏移的滚动 adler32，块可以在任意偏移处匹配
+(插入、删除数据后仍能对齐)；否则只在块对齐的位置匹配，适合原地修改的镜像和数据库文件。
+接收方的签名在线程池里按批计算 (zlib 和 hashlib 处理大块数据时释放 GIL)。
+"""
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import sys
+sys.path.append('..')
+from config import (DELTA_MIN_BLOCK, DELTA_MAX_BLOCK, DELTA_SCAN_WINDOW, DELTA_MAX_LITERAL,
+                    DELTA_HASH_THREADS)
+from .integrity import new_digest
+
+# numpy 在第一次需要向量化扫描时才导入 (导入要近百毫秒，只收发文字的进程用不到)
+np = None
+_numpy_checked = False
+
+
+def _numpy():
+    """返回 numpy 模块，未安装时返回 None"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return np
+
+# 指令: 1字节类型 + 两个 4 字节参数
+OP = struct.Struct('>BII')
+OP_END = 0
+OP_COPY = 1   # 参数: 旧文件块序号, 连续块数
+OP_DATA = 2   # 参数: 字面数据长度, 0；数据紧随其后
+
+_WEAK = struct.Struct('>I')
+_ADLER_MOD = 65521
+# 强摘要只保留前 16 字节: 块签名只用于挑选候选，整个文件另有完整摘要校验
+_STRONG_SIZE = 16
+# 弱校验预筛选位图的大小 (2 的幂)
+_FILTER_SIZE = 1 << 20
+# 每批签名覆盖的块数，批与批之间并行计算
+_BATCH_BLOCKS = 64
+
+
+def block_size(file_size: int) -> int:
+    """块大小约为文件大小的平方根 (取 2 的幂)，签名条数与每块开销之间折中"""
+    size = DELTA_MIN_BLOCK
+    while size * size < file_size and size < DELTA_MAX_BLOCK:
+        size *= 2
+    return size
+
+
+def entry_size(strong: str) -> int:
+    return _WEAK.size + min(_STRONG_SIZE, new_digest(strong).digest_size)
+
+
+def _strong(strong: str, data) -> bytes:
+    h = new_digest(strong)
+    h.update(data)
+    return h.digest()[:_STRONG_SIZE]
+
+
+def _sign_batch(data: bytes, block: int, strong: str) -> bytes:
+    view = memoryview(data)
+    parts = []
+    for pos in range(0, len(view) - block + 1, block):
+        chunk = view[pos:pos + block]
+        parts.append(_WEAK.pack(zlib.adler32(chunk)))
+        parts.append(_strong(strong, chunk))
+    return b''.join(parts)
+
+
+def compute_signatures(path: str, block: int, count: int, strong: str,
+                       emit: Callable[[bytes], None], threads: int = DELTA_HASH_THREADS):
+    """按顺序计算旧文件前 count 个完整块的签名，每算完一批就交给 emit (边算边发)
+
+    末尾不足一块的部分不参与匹配。
+    """
+    batch = block * _BATCH_BLOCKS
+    with open(path, 'rb') as f, ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        pending = []
+        for start in range(0, count * block, batch):
+            data = f.read(min(batch, count * block - start))
+            if len(data) < block:
+                raise ValueError("旧文件在计算签名时被截断")
+            pending.append(pool.submit(_sign_batch, data, block, strong))
+            # 保持有限的批次在途，按顺序输出
+            while len(pending) > 2 * max(1, threads):
+                emit(pending.pop(0).result())
+        for future in pending:
+            emit(future.result())
+
+
+class SignatureTable:
+    """发送方收到的旧文件签名: 弱校验 -> [(块序号, 强摘要)]"""
+
+    def __init__(self, blob: bytes, block: int, strong: str):
+        self.block = block
+        self.strong = strong
+        size = entry_size(strong)
+        self._table: Dict[int, List[Tuple[int, bytes]]] = {}
+        for index, pos in enumerate(range(0, len(blob) - size + 1, size)):
+            weak = _WEAK.unpack_from(blob, pos)[0]
+            self._table.setdefault(weak, []).append((index, bytes(blob[pos + _WEAK.size:pos + size])))
+        self.weak_keys = None
+        self._filter = None
+        if _numpy() is not None:
+            # 有序的弱校验表 + 位图预筛选，扫描时先用位图排除绝大多数偏移
+            self.weak_keys = np.array(sorted(self._table), dtype=np.int64)
+            self._filter = np.zeros(_FILTER_SIZE, dtype=np.bool_)
+            self._filter[_mix(self.weak_keys)] = True
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._table.values())
+
+    def candidates(self, weak) -> List[int]:
+        """weak 数组中弱校验出现在表里的下标"""
+        hits = np.nonzero(self._filter[_mix(weak)])[0]
+        if not len(hits):
+            return []
+        values = weak[hits]
+        slots = np.minimum(np.searchsorted(self.weak_keys, values), len(self.weak_keys) - 1)
+        return hits[self.weak_keys[slots] == values].tolist()
+
+    def match(self, weak: int, data, prefer: Optional[int] = None) -> Optional[int]:
+        """弱校验命中时再比强摘要，返回匹配的旧文件块序号；prefer 优先 (便于合并连续复制)"""
+        entries = self._table.get(weak)
+        if not entries:
+            return None
+        digest = _strong(self.strong, data)
+        found = None
+        for index, strong in entries:
+            if strong == digest:
+                if index == prefer:
+                    return index
+                if found is None:
+                    found = index
+        return found
+
+
+def _mix(weak):
+    return (weak ^ (weak >> 13)) & (_FILTER_SIZE - 1)
+
+
+def _rolling_adler(data, block: int):
+    """窗口内每个偏移 k 处长度为 block 的 adler32 (与 zlib.adler32 相同)，numpy 向量化计算"""
+    x = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    n = len(x) - block + 1
+    s1 = np.zeros(len(x) + 1, dtype=np.int64)
+    np.cumsum(x, out=s1[1:])
+    t = np.zeros(len(x) + 1, dtype=np.int64)
+    np.cumsum(x * np.arange(len(x), dtype=np.int64), out=t[1:])
+    k = np.arange(n, dtype=np.int64)
+    sums = s1[block:block + n] - s1[:n]
+    # b = block + sum((block - i) * x[k + i]) = block + (block + k) * sums - sum(j * x[j])
+    weighted = (block + k) * sums - (t[block:block + n] - t[:n])
+    a = (1 + sums) % _ADLER_MOD
+    b = (block + weighted) % _ADLER_MOD
+    return (b << 16) | a
+
+
+def delta_ops(f, file_size: int, table: SignatureTable) -> Iterator[Tuple[int, object]]:
+    """按文件顺序生成 (OP_COPY, (块序号, 数据)) 或 (OP_DATA, 数据)
+
+    各条指令覆盖的数据首尾相接，正好是整个新文件；复制指令也带上该块数据，供调用方计算摘要。
+    先试当前位置的整块 (未修改的区域逐块命中)，不命中再向量化扫描后面的每个偏移，
+    扫描窗口从一个块开始逐次加倍，零散的小修改只需扫描很短的一段。
+    """
+    block = table.block
+    if len(table) == 0 or file_size < block:
+        yield from _literals(f, 0, file_size)
+        return
+    if _numpy() is None:
+        yield from _aligned_ops(f, file_size, table)
+        return
+
+    pos = 0             # 下一个待匹配的偏移
+    literal_start = 0   # 尚未输出的字面数据起点
+    prev = None
+    window = block
+    while pos <= file_size - block:
+        f.seek(pos)
+        chunk = f.read(block)
+        index = table.match(zlib.adler32(chunk), chunk, prev + 1 if prev is not None else None)
+        if index is None:
+            found = _scan(f, pos + 1, min(window, file_size - block - pos), table)
+            if found is None:
+                pos += 1 + min(window, file_size - block - pos)
+                window = min(window * 2, DELTA_SCAN_WINDOW)
+                prev = None
+                continue
+            pos, index, chunk = found
+        window = block
+        if pos > literal_start:
+            yield from _literals(f, literal_start, pos - literal_start)
+        yield OP_COPY, (index, chunk)
+        prev = index
+        pos = literal_start = pos + block
+    yield from _literals(f, literal_start, file_size - literal_start)
+
+
+def _scan(f, start: int, count: int, table: SignatureTable):
+    """在 [start, start + count) 的偏移中找第一个与旧文件某块相同的位置，返回 (偏移, 块序号, 数据)"""
+    if count <= 0:
+        return None
+    block = table.block
+    f.seek(start)
+    data = f.read(count + block - 1)
+    weak = _rolling_adler(data, block)
+    for k in table.candidates(weak):
+        chunk = data[k:k + block]
+        index = table.match(int(weak[k]), chunk)
+        if index is not None:
+            return start + k, index, chunk
+    return None
+
+
+def _aligned_ops(f, file_size: int, table: SignatureTable) -> Iterator[Tuple[int, object]]:
+    """没有 numpy 时只在块对齐的位置匹配"""
+    block = table.block
+    f.seek(0)
+    prev = None
+    pos = 0
+    while pos + block <= file_size:
+        chunk = f.read(block)
+        index = table.match(zlib.adler32(chunk), chunk, prev + 1 if prev is not None else None)
+        if index is None:
+            yield OP_DATA, chunk
+        else:
+            yield OP_COPY, (index, chunk)
+        prev = index
+        pos += block
+    yield from _literals(f, pos, file_size - pos)
+
+
+def _literals(f, offset: int, length: int) -> Iterator[Tuple[int, object]]:
+    f.seek(offset)
+    while length > 0:
+        data = f.read(min(DELTA_MAX_LITERAL, length))
+        if not data:
+            raise Exception(f"文件在发送过程中被截断: {offset}")
+        offset += len(data)
+        length -= len(data)
+        yield OP_DATA, data
+
+
+class DeltaPatcher:
+    """接收方: 按指令从旧文件复制块、写入字面数据，重建到新文件，同时计算整个文件的摘要"""
+
+    def __init__(self, old_path: str, out, block: int, count: int, algorithm: str):
+        self.block = block
+        self.count = count
+        self.written = 0
+        self._old = open(old_path, 'rb')
+        self._out = out
+        self._hash = new_digest(algorithm)
+
+    def copy(self, index: int, count: int) -> int:
+        """复制旧文件第 index 块起的 count 块，返回写入的字节数"""
+        if count <= 0 or index + count > self.count:
+            raise ValueError(f"复制指令越界: {index}+{count}/{self.count}")
+        self._old.seek(index * self.block)
+        left = count * self.block
+        while left > 0:
+            data = self._old.read(min(left, DELTA_MAX_LITERAL * 4))
+            if not data:
+                raise ValueError("旧文件在重建过程中被截断")
+            self.write(data)
+            left -= len(data)
+        return count * self.block
+
+    def write(self, data):
+        self._out.write(data)
+        self._hash.update(data)
+        self.written += len(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._old.close()
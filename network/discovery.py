@@ -60,7 +60,8 @@ class DeviceListener(ServiceListener):
 class DeviceDiscovery:
     """设备发现管理器"""
     
-    def __init__(self):
+    def __init__(self, port: int = TRANSFER_PORT):
+        self.port = port  # 广播的本机接收端口
         self.zeroconf: Optional[Zeroconf] = None
         self.browser: Optional[ServiceBrowser] = None
         self.service_info: Optional[ServiceInfo] = None
@@ -100,13 +101,16 @@ class DeviceDiscovery:
             if self._on_device_lost:
                 self._on_device_lost(to_remove)
     
-    def start(self):
-        """启动设备发现服务"""
+    def start(self, register: bool = True):
+        """启动设备发现服务；register=False 时只浏览其他设备，不广播本机
+
+        注册要做 mDNS 探测，可能阻塞数秒；想先开始浏览的调用方可以
+        start(register=False) 之后在别的线程里调用 register()。
+        """
         if self._running:
             return
         self._running = True
         self.zeroconf = Zeroconf(interfaces=['0.0.0.0'])
-        self._register_service()
         
         # 开始浏览其他设备
         listener = DeviceListener(
@@ -117,6 +121,14 @@ class DeviceDiscovery:
         self.browser = ServiceBrowser(self.zeroconf, SERVICE_TYPE, listener)
         
         print(f"[Discovery] 服务已启动 - {self.device_name} ({self.local_ip})")
+        if register:
+            self.register()
+    
+    def register(self):
+        """在 mDNS 上广播本机 (需先 start)"""
+        if not self._running or self.service_info:
+            return
+        self._register_service()
     
     def _register_service(self):
         """mDNS 注册本机服务"""
@@ -124,7 +136,7 @@ class DeviceDiscovery:
             SERVICE_TYPE,
             f"{self.device_name}.{SERVICE_TYPE}",
             addresses=[socket.inet_aton(self.local_ip)],
-            port=TRANSFER_PORT,
+            port=self.port,
             properties={
                 'version': '1.0',
                 'device': self.device_name
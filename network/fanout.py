@@ -0,0 +1,195 @@
+"""多播发送 - 同一文件只读一遍，经共享环形缓冲区同时发给多个对端
+
+读取线程把文件按块读进有 FANOUT_RING_SLOTS 个槽位的环，每个对端一个游标按顺序取块发送。
+环满时读取线程等待最慢的游标，等待时间记在该游标上；某个游标累计让读取线程等了
+FANOUT_MAX_STALL 秒就把它分离，该对端改为自己从磁盘继续读，其余对端不再被它拖慢。
+协商了完整性校验时，读取线程按各对端选用的算法计算一次摘要，每块记下摘要状态的副本，
+连接在环上的对端直接用最后一块的摘要，分离的对端从分离处的副本接着算。
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import sys
+sys.path.append('..')
+from config import FANOUT_CHUNK, FANOUT_RING_SLOTS, FANOUT_MAX_STALL
+from .integrity import new_digest
+
+
+@dataclass
+class _Slot:
+    seq: int
+    offset: int
+    data: bytes
+    # 读到本块末尾时各摘要算法的状态 (只读副本，使用前先 copy)
+    digests: Dict[str, object] = field(default_factory=dict)
+
+
+class RingCursor:
+    """一个对端在环上的读取位置"""
+
+    def __init__(self, ring: 'SharedRing'):
+        self._ring = ring
+        self.seq = 0
+        self.position = 0
+        self.algorithm: Optional[str] = None
+        self.ready = False      # 已协商完毕，等待数据
+        self.left = False       # 不再从环上读取 (完成、失败或改为自己读盘)
+        self.detached = False   # 因为太慢被读取线程分离
+        self.stalled = 0.0      # 累计让读取线程等待的秒数
+        self._last: Optional[_Slot] = None
+
+    def begin(self, algorithm: Optional[str]):
+        """协商完毕，开始从环上取数据；algorithm 为该对端选用的摘要算法"""
+        self._ring._begin(self, algorithm)
+
+    def leave(self):
+        self._ring._leave(self)
+
+    def next(self) -> Optional[_Slot]:
+        """下一块数据；读完、读取出错或被分离时返回 None"""
+        slot = self._ring._next(self)
+        if slot is not None:
+            self._last = slot
+            self.position = slot.offset + len(slot.data)
+        return slot
+
+    def digest_state(self):
+        """到当前位置为止的摘要状态 (可继续 update 的新对象)"""
+        if self.algorithm is None:
+            return None
+        if self._last is None:
+            return new_digest(self.algorithm)
+        return self._last.digests[self.algorithm].copy()
+
+
+class SharedRing:
+    """共享环形缓冲区
+
+    所有游标都在读取开始前 attach()；每个游标协商完毕后 begin()，或 leave() 退出。
+    全部游标就绪 (或退出) 后读取线程才开始读文件，摘要算法在此时确定。
+    """
+
+    def __init__(self, file_path: str, size: int, slots: int = FANOUT_RING_SLOTS,
+                 chunk: int = FANOUT_CHUNK, max_stall: float = FANOUT_MAX_STALL):
+        self.file_path = file_path
+        self.size = size
+        self.chunk = chunk
+        self.max_stall = max_stall
+        self._ring: List[Optional[_Slot]] = [None] * slots
+        self._cursors: List[RingCursor] = []
+        self._produced = 0
+        self._eof = False
+        self._closed = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self) -> RingCursor:
+        cursor = RingCursor(self)
+        with self._cond:
+            self._cursors.append(cursor)
+        return cursor
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='fanout-reader', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def _begin(self, cursor: RingCursor, algorithm: Optional[str]):
+        with self._cond:
+            cursor.algorithm = algorithm
+            cursor.ready = True
+            self._cond.notify_all()
+
+    def _leave(self, cursor: RingCursor):
+        with self._cond:
+            cursor.left = True
+            self._cond.notify_all()
+
+    def _active(self) -> List[RingCursor]:
+        return [c for c in self._cursors if not c.left]
+
+    def _next(self, cursor: RingCursor) -> Optional[_Slot]:
+        with self._cond:
+            while True:
+                if cursor.left:
+                    return None
+                if cursor.seq < self._produced:
+                    slot = self._ring[cursor.seq % len(self._ring)]
+                    cursor.seq += 1
+                    self._cond.notify_all()
+                    return slot
+                if self._eof or self.error is not None or self._closed:
+                    return None
+                self._cond.wait()
+
+    def _wait_for_room(self, seq: int) -> bool:
+        """等到环里有空位，等待时间记在最慢的游标上，累计超过 max_stall 秒的游标被分离
+
+        没有游标时返回 False。
+        """
+        while True:
+            if self._closed:
+                return False
+            active = self._active()
+            if not active:
+                return False
+            lowest = min(c.seq for c in active)
+            if seq - lowest < len(self._ring):
+                return True
+            slowest = [c for c in active if c.seq == lowest]
+            budget = self.max_stall - max(c.stalled for c in slowest)
+            if budget <= 0:
+                for c in slowest:
+                    if c.stalled >= self.max_stall:
+                        c.left = c.detached = True
+                self._cond.notify_all()
+                continue
+            started = time.monotonic()
+            self._cond.wait(budget)
+            waited = time.monotonic() - started
+            for c in slowest:
+                c.stalled += waited
+
+    def _run(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or all(c.ready or c.left for c in self._cursors))
+            algorithms = {c.algorithm for c in self._active() if c.algorithm}
+        hashes = {name: new_digest(name) for name in algorithms}
+
+        seq = offset = 0
+        try:
+            with open(self.file_path, 'rb') as f:
+                while offset < self.size:
+                    with self._cond:
+                        if not self._wait_for_room(seq):
+                            return
+                    data = f.read(min(self.chunk, self.size - offset))
+                    if not data:
+                        raise Exception(f"文件在发送过程中被截断: {offset}/{self.size}")
+                    digests = {}
+                    for name, h in hashes.items():
+                        h.update(data)
+                        digests[name] = h.copy()
+                    with self._cond:
+                        self._ring[seq % len(self._ring)] = _Slot(seq, offset, data, digests)
+                        self._produced = seq + 1
+                        self._cond.notify_all()
+                    seq += 1
+                    offset += len(data)
+        except BaseException as e:
+            with self._cond:
+                self.error = e
+                self._cond.notify_all()
+            return
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
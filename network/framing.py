@@ -0,0 +1,189 @@
+"""二进制帧协议 v2
+
+新连接上发送方先用 v1 格式发一条 {"type": "HELLO", "versions": [1, 2]}。
+支持 v2 的接收方回复一个 v2 HELLO 帧 (含选定版本和能力列表)，此后该连接双向都用二进制帧；
+旧版接收方 (Android、旧桌面版) 不认识 HELLO，会直接断开或不回复，发送方记下该对端只支持 v1。
+
+帧格式 (大端序):
+    1字节类型 | 1字节标志 | 4字节流 ID | 4字节载荷长度 | 载荷
+载荷由若干字段组成: 1字节字段号 | 4字节长度 | 值。整数为 8 字节无符号数，字符串为 UTF-8，
+摘要为原始字节，扩展选项 (options/accept/caps) 仍用 JSON。不认识的字段号直接跳过。
+应答 (READY/ACK/NAK) 也是帧，带着请求的流 ID，不再是可能被拆开读取的字面量。
+文件数据紧跟在 FILE / FILE_RANGE 帧之后，长度由帧中的字段给出，与 v1 相同，
+因此 sendfile 和压缩块格式不受影响；校验摘要放在数据之后的 TRAILER 帧里。
+"""
+import json
+import socket
+import struct
+from typing import Callable, Dict, Optional, Tuple
+
+import sys
+sys.path.append('..')
+from config import MAX_HEADER_SIZE, MessageType
+from .protocol import RecvBuffer, READY, READY_EXT, ACK, NAK, encode_message, recv_into_exact
+
+PROTOCOL_VERSION = 2
+
+FRAME_HEADER = struct.Struct('>BBII')
+FIELD_HEADER = struct.Struct('>BI')
+_U64 = struct.Struct('>Q')
+
+# 帧标志
+FLAG_KEEP_ALIVE = 0x01
+
+# 帧类型
+_FRAME_TYPES: Dict[str, int] = {
+    MessageType.HELLO: 1,
+    MessageType.TEXT: 2,
+    MessageType.FILE: 3,
+    MessageType.FILE_RANGE: 4,
+    MessageType.TRAILER: 5,
+    MessageType.TEXT_BATCH: 6,
+    'READY': 16,
+    'ACK': 17,
+    'NAK': 18,
+}
+_FRAME_NAMES = {code: name for name, code in _FRAME_TYPES.items()}
+
+# 字段编码
+_INT, _STR, _JSON, _HEX = range(4)
+_FIELDS: Dict[str, Tuple[int, int]] = {
+    'sender': (1, _STR),
+    'content': (2, _STR),
+    'file_size': (3, _INT),
+    'transfer_id': (4, _STR),
+    'offset': (5, _INT),
+    'length': (6, _INT),
+    'options': (7, _JSON),
+    'accept': (8, _JSON),
+    'digest': (9, _HEX),
+    'version': (10, _INT),
+    'versions': (11, _JSON),
+    'caps': (12, _JSON),
+    'items': (13, _JSON),
+}
+_FIELD_NAMES = {fid: (name, kind) for name, (fid, kind) in _FIELDS.items()}
+
+_ENCODERS: Dict[int, Callable] = {
+    _INT: lambda v: _U64.pack(int(v)),
+    _STR: lambda v: str(v).encode('utf-8'),
+    _JSON: lambda v: json.dumps(v, ensure_ascii=False).encode('utf-8'),
+    _HEX: lambda v: bytes.fromhex(v),
+}
+_DECODERS: Dict[int, Callable] = {
+    _INT: lambda b: _U64.unpack(b)[0],
+    _STR: lambda b: str(b, 'utf-8'),
+    _JSON: lambda b: json.loads(str(b, 'utf-8')),
+    _HEX: lambda b: bytes(b).hex(),
+}
+
+# v1 应答字面量 -> 帧类型
+_REPLY_NAMES = {READY: 'READY', ACK: 'ACK', NAK: 'NAK'}
+
+
+def encode_frame(message: dict, stream_id: int) -> bytes:
+    """把 v1 风格的消息字典编码为 v2 帧"""
+    frame_type = _FRAME_TYPES.get(message.get('type'))
+    if frame_type is None:
+        raise ValueError(f"v2 不支持的消息类型: {message.get('type')}")
+    parts = []
+    for name, value in message.items():
+        field = _FIELDS.get(name)
+        if field is None or value is None:
+            continue
+        fid, kind = field
+        data = _ENCODERS[kind](value)
+        parts.append(FIELD_HEADER.pack(fid, len(data)))
+        parts.append(data)
+    payload = b''.join(parts)
+    flags = FLAG_KEEP_ALIVE if message.get('keep_alive') else 0
+    return FRAME_HEADER.pack(frame_type, flags, stream_id, len(payload)) + payload
+
+
+def decode_frame(header, payload) -> dict:
+    """解码帧为消息字典，附带 stream_id 和 version 字段"""
+    frame_type, flags, stream_id, _ = FRAME_HEADER.unpack(header)
+    name = _FRAME_NAMES.get(frame_type)
+    if name is None:
+        raise ValueError(f"未知的帧类型: {frame_type}")
+    message = {
+        'type': name,
+        'keep_alive': bool(flags & FLAG_KEEP_ALIVE),
+        'stream_id': stream_id,
+        'version': PROTOCOL_VERSION,
+    }
+    view = memoryview(payload)
+    pos = 0
+    while pos < len(view):
+        fid, length = FIELD_HEADER.unpack_from(view, pos)
+        pos += FIELD_HEADER.size
+        if pos + length > len(view):
+            raise ValueError("帧字段越界")
+        field = _FIELD_NAMES.get(fid)
+        if field is not None:
+            field_name, kind = field
+            message[field_name] = _DECODERS[kind](view[pos:pos + length])
+        pos += length
+    return message
+
+
+def parse_frame_length(header) -> int:
+    length = FRAME_HEADER.unpack(header)[3]
+    if length > MAX_HEADER_SIZE:
+        raise ValueError(f"帧过大: {length} > {MAX_HEADER_SIZE}")
+    return length
+
+
+def recv_frame(conn: socket.socket, buffer: RecvBuffer,
+               idle_timeout: Optional[float] = None,
+               timeout: Optional[float] = None) -> Optional[dict]:
+    """读取一个 v2 帧，语义同 RecvBuffer.recv_message: 干净关闭或空闲超时返回 None"""
+    header = bytearray(FRAME_HEADER.size)
+    view = memoryview(header)
+    conn.settimeout(idle_timeout)
+    try:
+        n = conn.recv_into(view)
+    except socket.timeout:
+        return None
+    if n == 0:
+        return None
+
+    conn.settimeout(timeout)
+    recv_into_exact(conn, view[n:])
+    payload = buffer.recv_exact(conn, parse_frame_length(header))
+    try:
+        return decode_frame(header, payload)
+    finally:
+        payload.release()
+        buffer.shrink()
+
+
+def is_v2(message: dict) -> bool:
+    return message.get('version') == PROTOCOL_VERSION and 'stream_id' in message
+
+
+def encode_reply(request: dict, reply: bytes, accept: Optional[dict] = None) -> bytes:
+    """按请求所用的协议版本编码应答
+
+    v1 为 READY/ACK/NAK 字面量，accept 不为 None 时为 RDYEX + JSON；
+    v2 为带相同流 ID 的 READY/ACK/NAK 帧。
+    """
+    if is_v2(request):
+        message = {'type': _REPLY_NAMES[reply]}
+        if accept is not None:
+            message['accept'] = accept
+        return encode_frame(message, request['stream_id'])
+    if accept is not None:
+        return READY_EXT + encode_message({'accept': accept})
+    return reply
+
+
+def hello_reply(caps) -> bytes:
+    return encode_frame({'type': MessageType.HELLO, 'version': PROTOCOL_VERSION,
+                         'caps': list(caps)}, 0)
+
+
+def accepts_v2(message: dict) -> bool:
+    """HELLO 中发送方是否支持 v2"""
+    versions = message.get('versions')
+    return isinstance(versions, list) and PROTOCOL_VERSION in versions
@@ -0,0 +1,130 @@
+"""完整性校验模块 - 收发数据时流式计算摘要，数据末尾的 trailer 里交换比对
+
+摘要在后台线程里增量计算 (hashlib 对大块数据会释放 GIL)，与 socket 读写重叠。
+sendfile 发送的数据不经过用户态，哈希线程用 os.preadv 从页缓存读回同一段 (复用一块缓冲区)，
+零拷贝发送不受影响。摘要覆盖整个分段: 续传时两端先把之前会话已传的部分从文件读回计入。
+"""
+import hashlib
+import os
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+import sys
+sys.path.append('..')
+from config import INTEGRITY_QUEUE_DEPTH, INTEGRITY_READ_BUFFER
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+class IntegrityError(Exception):
+    """接收方计算的摘要与发送方不一致"""
+
+
+# 按优先级排列
+_DIGESTS: Dict[str, Callable] = {}
+if xxhash is not None:
+    _DIGESTS['xxh3_128'] = xxhash.xxh3_128
+_DIGESTS['blake2b'] = lambda: hashlib.blake2b(digest_size=32)
+
+
+def available_digests() -> List[str]:
+    return list(_DIGESTS)
+
+
+def new_digest(algorithm: str):
+    """新建一个 hashlib 风格的摘要对象 (update / copy / hexdigest)"""
+    return _DIGESTS[algorithm]()
+
+
+def pick_digest(offered) -> Optional[str]:
+    """接收方从发送方提供的列表中选第一个自己也支持的算法"""
+    if not isinstance(offered, list):
+        return None
+    for name in offered:
+        if name in _DIGESTS:
+            return name
+    return None
+
+
+class StreamHasher:
+    """后台线程增量计算摘要
+
+    update(bytes) 只把数据块放进有界队列就返回，调用方可以马上去收发下一块；
+    memoryview 背后的缓冲区随后会被复用，不复制，等队列中之前的数据处理完后就地计算
+    (接收端在写盘线程里调用，不占网络线程)。
+    update_file() 让后台线程从文件描述符读回 [offset, offset + length)，
+    文件必须保持打开到 hexdigest() 或 close() 返回。state 为已有的摘要对象时从其状态继续。
+    """
+
+    _STOP = object()
+
+    def __init__(self, algorithm: str, state=None):
+        self.algorithm = algorithm
+        self._hash = state if state is not None else new_digest(algorithm)
+        self._queue: queue.Queue = queue.Queue(maxsize=INTEGRITY_QUEUE_DEPTH)
+        self._buffer: Optional[bytearray] = None
+        self._digest: Optional[str] = None
+        self._error: Optional[BaseException] = None
+        self._abandoned = False
+        self._thread = threading.Thread(target=self._run, name='stream-hasher', daemon=True)
+        self._thread.start()
+
+    def update(self, data):
+        if isinstance(data, memoryview):
+            self._queue.join()
+            self._hash.update(data)
+            return
+        self._queue.put(data)
+
+    def update_file(self, fd: int, offset: int, length: int):
+        self._queue.put((fd, offset, length))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                if self._abandoned or self._error is not None:
+                    continue
+                if isinstance(item, tuple):
+                    self._hash_file(*item)
+                else:
+                    self._hash.update(item)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _hash_file(self, fd: int, offset: int, length: int):
+        if self._buffer is None:
+            self._buffer = bytearray(INTEGRITY_READ_BUFFER)
+        view = memoryview(self._buffer)
+        end = offset + length
+        while offset < end:
+            n = os.preadv(fd, [view[:min(len(view), end - offset)]], offset)
+            if n == 0:
+                raise OSError(f"文件在校验过程中被截断: {offset}/{end}")
+            self._hash.update(view[:n])
+            offset += n
+
+    def hexdigest(self) -> str:
+        """等后台线程处理完所有数据块后返回摘要"""
+        if self._digest is None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+            self._digest = self._hash.hexdigest()
+        return self._digest
+
+    def close(self):
+        """丢弃未处理的数据并等后台线程退出，之后调用方可以关闭 update_file 用到的文件"""
+        if self._thread.is_alive():
+            self._abandoned = True
+            self._queue.put(self._STOP)
+            self._thread.join()
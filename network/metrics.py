@@ -0,0 +1,293 @@
+"""指标模块 - 进程内的计数器、仪表和直方图，经本地 HTTP 端点以 Prometheus 文本或 JSON 输出
+
+收发代码直接对模块级的 REGISTRY 中的指标 inc/set/observe，每次只是加锁改一个数；
+队列深度、活跃连接数这类现成的状态用 set_function 在采集时读取，不需要在各处维护。
+GET /metrics 返回 Prometheus 文本格式，GET /metrics.json 返回 JSON (直方图附带估算的分位数)。
+"""
+import bisect
+import json
+import math
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+import sys
+sys.path.append('..')
+from config import METRICS_HOST, METRICS_PORT
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 延迟 (秒) 与吞吐 (字节/秒) 直方图的默认分桶
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 300)
+THROUGHPUT_BUCKETS = tuple(float(2 ** n) for n in range(16, 34, 2))  # 64 KB/s ~ 8 GB/s
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} 的标签应为 {self.labels}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(指标名, 标签, 值) 列表，用于 Prometheus 文本输出"""
+        raise NotImplementedError
+
+    def snapshot(self) -> list:
+        """JSON 输出: 每组标签一项"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labels, key)), value) for key, value in items]
+
+    def snapshot(self):
+        return [{'labels': labels, 'value': value} for _, labels, value in self.samples()]
+
+
+class Gauge(Counter):
+    """可增可减的当前值；set_function 之后采集时调用函数取值 (不带标签)"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            return [(self.name, {}, float(self._function()))]
+        return super().samples()
+
+
+class _HistogramData:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """按分桶统计的分布 (延迟、吞吐)，分位数由分桶线性插值估算"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._data: Dict[LabelValues, _HistogramData] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                data = self._data[key] = _HistogramData(len(self.buckets) + 1)
+            data.counts[index] += 1
+            data.sum += value
+            data.count += 1
+
+    def _copy(self) -> List[Tuple[LabelValues, List[int], float, int]]:
+        with self._lock:
+            return [(key, list(d.counts), d.sum, d.count) for key, d in self._data.items()]
+
+    def quantile(self, q: float, counts: List[int]) -> Optional[float]:
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                if i >= len(self.buckets):
+                    return self.buckets[-1]  # 超出最大分桶，只能给出下界
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def samples(self):
+        result = []
+        for key, counts, total, count in self._copy():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                result.append((self.name + '_bucket', dict(labels, le=_format_value(bound)),
+                               cumulative))
+            result.append((self.name + '_sum', labels, total))
+            result.append((self.name + '_count', labels, count))
+        return result
+
+    def snapshot(self):
+        result = []
+        for key, counts, total, count in self._copy():
+            result.append({
+                'labels': dict(zip(self.labels, key)),
+                'count': count,
+                'sum': total,
+                'p50': self.quantile(0.5, counts),
+                'p90': self.quantile(0.9, counts),
+                'p99': self.quantile(0.99, counts),
+            })
+        return result
+
+
+class Registry:
+    """指标集合，同名指标只注册一次 (重复注册返回已有的对象)"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labels, buckets)
+
+    def metrics(self) -> List[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> dict:
+        return {metric.name: {'type': metric.kind, 'help': metric.help, 'values': metric.snapshot()}
+                for metric in self.metrics()}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """本地指标端点: /metrics (Prometheus 文本) 与 /metrics.json"""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = METRICS_HOST,
+                 port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._httpd: Optional['ThreadingHTTPServer'] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # 收发代码导入本模块只为了记录指标，http.server 等到真正启动端点时才导入
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.to_dict(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-http',
+                                        daemon=True)
+        self._thread.start()
+        print(f"[Metrics] 指标端点: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
@@ -0,0 +1,296 @@
+"""断点续传模块 - 接收中的 .part 文件及其检查点，以及已收文件的来源记录"""
+import json
+import os
+import re
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+import sys
+sys.path.append('..')
+from config import RECEIVE_DIR, PARTIAL_DIR_NAME, PARTIAL_MAX_AGE, DELTA_INDEX_MAX
+from .pipeline import preallocate
+
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{16,64}$')
+RECEIVED_INDEX = 'received.json'  # 已收文件的来源记录，不随 .part 文件过期清理
+
+
+def partial_dir() -> str:
+    return os.path.join(RECEIVE_DIR, PARTIAL_DIR_NAME)
+
+
+def valid_key(key) -> bool:
+    """续传标识会被用作文件名，只接受十六进制串"""
+    return isinstance(key, str) and bool(_KEY_PATTERN.match(key))
+
+
+def split_ranges(file_size: int, streams: int) -> List[List[int]]:
+    """把文件均分为 streams 段 [offset, length]"""
+    step = max(1, -(-file_size // max(1, streams)))
+    return [[offset, min(step, file_size - offset)] for offset in range(0, file_size, step)]
+
+
+class PartialFile:
+    """一个正在接收的文件
+
+    数据先写入 .partial/<key>.part，每段已落盘的字节数记录在 <key>.json 检查点中。
+    检查点只在 fsync 之后更新，所以任一端重启后都可以从检查点记录的位置继续。
+    """
+
+    def __init__(self, key: str, sender: str, file_name: str, file_size: int,
+                 ranges: List[List[int]], committed: List[int]):
+        self.key = key
+        self.sender = sender
+        self.file_name = file_name
+        self.file_size = file_size
+        self.ranges = ranges            # [offset, length]
+        self.committed = committed      # 每段已 fsync 的字节数
+        self.written = list(committed)  # 每段已写入的字节数
+        self.received = sum(committed)
+        self.codec: Optional[str] = None  # 本次会话协商的压缩编码
+        self.progress = None              # 本次会话的 ProgressReporter
+        self.integrity: Optional[str] = None  # 本次会话协商的摘要算法
+        self.relay = None                 # 本次会话边收边转发时的 RelaySource
+        self.last_activity = time.monotonic()
+        self.complete = threading.Event()
+        self._aborted = False
+        self._conns: Set[socket.socket] = set()
+        self._cond = threading.Condition()
+
+        base = os.path.join(partial_dir(), key)
+        self.part_path = base + '.part'
+        self.ckpt_path = base + '.json'
+        if self.is_complete():
+            self.complete.set()
+
+    @classmethod
+    def open(cls, key: str, sender: str, file_name: str, file_size: int,
+             streams: int) -> 'PartialFile':
+        """加载匹配的检查点，没有则新建并预分配 .part 文件 (空间不足时抛出 OSError)"""
+        os.makedirs(partial_dir(), exist_ok=True)
+        partial = cls._load(key, sender, file_size)
+        if partial is not None:
+            partial.file_name = file_name
+            return partial
+
+        ranges = split_ranges(file_size, streams)
+        partial = cls(key, sender, file_name, file_size, ranges, [0] * len(ranges))
+        try:
+            with open(partial.part_path, 'wb') as f:
+                f.truncate(file_size)
+                preallocate(f, file_size)
+        except OSError:
+            try:
+                os.remove(partial.part_path)
+            except OSError:
+                pass
+            raise
+        partial.save()
+        return partial
+
+    @classmethod
+    def _load(cls, key: str, sender: str, file_size: int) -> Optional['PartialFile']:
+        base = os.path.join(partial_dir(), key)
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if (state.get('sender') != sender or state.get('file_size') != file_size
+                    or os.path.getsize(base + '.part') != file_size):
+                return None
+            ranges = [[int(o), int(l)] for o, l in state['ranges']]
+            committed = [min(int(c), l) for c, (_, l) in zip(state['committed'], ranges)]
+            if len(committed) != len(ranges):
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return cls(key, sender, state.get('file_name', ''), file_size, ranges, committed)
+
+    def save(self):
+        """原子地写入检查点"""
+        state = {
+            'key': self.key,
+            'sender': self.sender,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'ranges': self.ranges,
+            'committed': self.committed,
+        }
+        tmp_path = self.ckpt_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.ckpt_path)
+
+    def remaining(self) -> List[int]:
+        """尚未写完的分段序号"""
+        return [i for i, (_, length) in enumerate(self.ranges) if self.written[i] < length]
+
+    def range_for(self, offset: int) -> int:
+        """根据发送方给出的续传位置找到对应分段"""
+        for i, (start, length) in enumerate(self.ranges):
+            if start + self.written[i] == offset and self.written[i] < length:
+                return i
+        raise ValueError(f"分段位置不匹配: {offset}")
+
+    def contiguous(self) -> int:
+        """从文件开头起连续写入的字节数"""
+        with self._cond:
+            for (start, length), written in zip(self.ranges, self.written):
+                if written < length:
+                    return start + written
+            return self.file_size
+
+    def state(self) -> List[List[int]]:
+        """回复给发送方的 [offset, length, committed] 列表"""
+        return [[o, l, c] for (o, l), c in zip(self.ranges, self.committed)]
+
+    def advance(self, index: int, n: int) -> int:
+        with self._cond:
+            self.written[index] += n
+            self.received += n
+            self.last_activity = time.monotonic()
+            return self.received
+
+    def commit(self, index: int, position: int):
+        """该段 position 之前的数据已 fsync，更新检查点"""
+        with self._cond:
+            self.committed[index] = position
+            self.save()
+
+    def range_done(self):
+        """一个分段已收完 (且通过校验)，所有分段都完成时唤醒控制连接"""
+        with self._cond:
+            if self.is_complete():
+                self.complete.set()
+
+    def rewind(self, index: int, position: int):
+        """丢弃该段 position 之后未通过校验的数据，下次从 position 重传"""
+        with self._cond:
+            self.received -= self.written[index] - position
+            self.written[index] = position
+            self.committed[index] = min(self.committed[index], position)
+            self.save()
+
+    def is_complete(self) -> bool:
+        return all(c >= l for c, (_, l) in zip(self.committed, self.ranges))
+
+    def finish(self, final_path: str):
+        """接收完成: .part 改名为最终文件并删除检查点"""
+        os.replace(self.part_path, final_path)
+        try:
+            os.remove(self.ckpt_path)
+        except OSError:
+            pass
+
+    # 连接管理: 同一文件重连时接管旧会话，先断开仍挂着的旧连接
+
+    def attach(self, conn: socket.socket):
+        with self._cond:
+            if self._aborted:
+                raise ConnectionError("传输已被新的连接接管")
+            self._conns.add(conn)
+
+    def detach(self, conn: socket.socket):
+        with self._cond:
+            self._conns.discard(conn)
+            self._cond.notify_all()
+
+    @property
+    def aborted(self) -> bool:
+        return self._aborted
+
+    def abort(self, timeout: float = 5):
+        """断开所有挂在此文件上的连接并等待它们写完检查点"""
+        with self._cond:
+            self._aborted = True
+            for conn in self._conns:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._cond.wait_for(lambda: not self._conns, timeout)
+
+
+class ReceivedIndex:
+    """已收文件的来源记录 (.partial/received.json)，增量传输据此选择旧文件
+
+    按 (发送方 IP, 设备名, 文件名) 记录最终路径、大小和修改时间。只有同一发送方再次发送同名文件、
+    且记录的文件之后没有被改动或替换时才作为增量基准，其他发送方的同名文件不会被覆盖。
+    """
+
+    def __init__(self, max_entries: int = DELTA_INDEX_MAX):
+        self.max_entries = max_entries
+        self._entries: Optional[Dict[str, dict]] = None  # 第一次用到时从磁盘加载
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ip: str, sender: str, file_name: str) -> str:
+        return json.dumps([ip, sender, os.path.basename(file_name)], ensure_ascii=False)
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(os.path.join(partial_dir(), RECEIVED_INDEX), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self._entries = {k: v for k, v in state.items() if isinstance(v, dict)}
+            except (OSError, ValueError, AttributeError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, ip: str, sender: str, file_name: str) -> Optional[str]:
+        """该发送方上次发来的同名文件仍原样在接收目录中时返回其路径"""
+        with self._lock:
+            entry = self._load().get(self._key(ip, sender, file_name))
+        if entry is None:
+            return None
+        path = entry.get('path')
+        try:
+            if os.path.dirname(path) != RECEIVE_DIR:
+                return None
+            st = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        if st.st_size != entry.get('size') or st.st_mtime_ns != entry.get('mtime_ns'):
+            return None
+        return path
+
+    def record(self, ip: str, sender: str, file_name: str, path: str):
+        """接收完成后记录文件来源，超出上限时丢弃最早的记录"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            entries = self._load()
+            key = self._key(ip, sender, file_name)
+            entries.pop(key, None)
+            entries[key] = {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            while len(entries) > self.max_entries:
+                del entries[next(iter(entries))]
+            index_path = os.path.join(partial_dir(), RECEIVED_INDEX)
+            try:
+                os.makedirs(partial_dir(), exist_ok=True)
+                with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(index_path + '.tmp', index_path)
+            except OSError as e:
+                print(f"[Server] 保存接收记录失败: {e}")
+
+
+def cleanup_stale(max_age: float = PARTIAL_MAX_AGE):
+    """删除长时间没有续传的 .part 文件和检查点"""
+    directory = partial_dir()
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    for name in os.listdir(directory):
+        if name == RECEIVED_INDEX:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
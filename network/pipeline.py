@@ -0,0 +1,128 @@
+"""接收流水线 - 网络读取与磁盘写入分离
+
+连接线程只负责把数据读进池化缓冲区并放入有界队列，写盘线程按顺序取出写入文件。
+磁盘偶尔变慢时网络继续收 (直到缓冲区用完)，网络变慢时磁盘也不会被逐块的小写入拖住。
+"""
+import errno
+import os
+import queue
+import shutil
+import threading
+from typing import Callable, List, Optional
+
+import sys
+sys.path.append('..')
+from config import PIPELINE_BUFFER, PIPELINE_DEPTH, PIPELINE_POOL_MAX
+
+
+def preallocate(f, size: int):
+    """预分配文件空间，减少碎片，并在开始接收前发现磁盘空间不足"""
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            # 文件系统不支持预分配，退回到剩余空间检查
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(f.name))).free
+    if free < size:
+        raise OSError(errno.ENOSPC, f"磁盘空间不足: 需要 {size} 字节，剩余 {free} 字节")
+
+
+class BufferPool:
+    """全局复用的接收缓冲区，避免每个分段重新分配大块内存"""
+
+    def __init__(self, buffer_size: int = PIPELINE_BUFFER, max_spare: int = PIPELINE_POOL_MAX):
+        self.buffer_size = buffer_size
+        self._max_spare = max_spare
+        self._spare: List[bytearray] = []
+        self._lock = threading.Lock()
+
+    def get(self, size: int) -> bytearray:
+        if size < self.buffer_size:
+            return bytearray(size)
+        with self._lock:
+            if self._spare:
+                return self._spare.pop()
+        return bytearray(self.buffer_size)
+
+    def put(self, buf: bytearray):
+        if len(buf) != self.buffer_size:
+            return
+        with self._lock:
+            if len(self._spare) < self._max_spare:
+                self._spare.append(buf)
+
+
+_pool = BufferPool()
+
+
+class DiskWriter:
+    """写盘线程
+
+    acquire() 取一块缓冲区 (最多 depth 块在途，用完时阻塞，对网络形成背压)，
+    读满后 submit() 入队；写盘线程写入文件后调用 on_written(data)，再归还缓冲区。
+    写盘出错后丢弃后续数据，网络线程在下一次 acquire() 时收到异常。
+    """
+
+    def __init__(self, f, on_written: Callable[[memoryview], None],
+                 size_hint: int = PIPELINE_BUFFER, depth: int = PIPELINE_DEPTH):
+        self._f = f
+        self._on_written = on_written
+        self._buffer_size = max(1, min(size_hint, PIPELINE_BUFFER))
+        self._slots = threading.Semaphore(depth)
+        self._queue: queue.Queue = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='disk-writer', daemon=True)
+        self._thread.start()
+
+    def acquire(self) -> bytearray:
+        self._slots.acquire()
+        if self.error is not None:
+            self._slots.release()
+            raise self.error
+        return _pool.get(self._buffer_size)
+
+    def release(self, buf: bytearray):
+        """归还未提交的缓冲区"""
+        _pool.put(buf)
+        self._slots.release()
+
+    def submit(self, buf: bytearray, n: int):
+        """写入 buf 的前 n 字节，写完后缓冲区自动归还"""
+        self._queue.put((buf, n))
+
+    def submit_bytes(self, data: bytes):
+        """写入一块不属于缓冲池的数据 (如解压结果)"""
+        self._slots.acquire()
+        self._queue.put((None, data))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            buf, n = item
+            try:
+                if self.error is None:
+                    data = memoryview(buf)[:n] if buf is not None else memoryview(n)
+                    self._f.write(data)
+                    self._on_written(data)
+            except BaseException as e:
+                self.error = e
+            finally:
+                if buf is not None:
+                    _pool.put(buf)
+                self._slots.release()
+
+    def close(self):
+        """等待已提交的数据全部写完"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,143 @@
+"""连接池模块 - 按 (ip, port) 复用 TCP 长连接"""
+import select
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import sys
+sys.path.append('..')
+from config import POOL_IDLE_TIMEOUT, POOL_MAX_IDLE_PER_PEER
+
+
+class PooledConnection:
+    """池中的一条长连接"""
+
+    def __init__(self, sock: socket.socket, key: Tuple[str, int]):
+        self.sock = sock
+        self.key = key
+        self.last_used = time.monotonic()
+        self.uses = 0
+        self.replied = False  # 本次借出后是否已收到过对端回复
+        self.version: Optional[int] = None  # 协商后的协议版本，None 表示尚未协商
+        self.caps: Set[str] = set()         # 对端在 HELLO 中声明的能力
+        self.stream_id = 0                  # v2: 当前请求的流 ID
+        self.request: Optional[tuple] = None  # 进行中的请求 (类型, 负载字节数, 开始时间)，用于指标
+
+    @property
+    def reused(self) -> bool:
+        return self.uses > 0
+
+    def sendall(self, data: bytes):
+        self.sock.sendall(data)
+
+    def recv_exact(self, size: int) -> bytes:
+        """读满 size 字节，长连接上不能把半个回复留给下一条消息"""
+        buf = bytearray(size)
+        view = memoryview(buf)
+        got = 0
+        while got < size:
+            n = self.sock.recv_into(view[got:])
+            if n == 0:
+                raise ConnectionError("连接已被对端关闭")
+            got += n
+            self.replied = True
+        return bytes(buf)
+
+    def is_alive(self) -> bool:
+        """健康检查: 空闲连接上不应有任何可读数据，可读说明对端已关闭或协议错位"""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """每个对端保留少量空闲长连接，空闲超时后由后台线程回收"""
+
+    def __init__(self, idle_timeout: float = POOL_IDLE_TIMEOUT,
+                 max_idle_per_peer: int = POOL_MAX_IDLE_PER_PEER):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_peer = max_idle_per_peer
+        self._idle: Dict[Tuple[str, int], List[PooledConnection]] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._reaper.start()
+
+    def acquire(self, ip: str, port: int, connect_timeout: float = 10) -> PooledConnection:
+        """借出一条连接: 优先复用通过健康检查的空闲连接，否则新建"""
+        key = (ip, port)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                break
+            if conn.is_alive():
+                conn.replied = False
+                return conn
+            conn.close()
+
+        sock = socket.create_connection(key, timeout=connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return PooledConnection(sock, key)
+
+    def release(self, conn: PooledConnection):
+        """归还连接，超过每个对端的空闲上限则直接关闭"""
+        conn.uses += 1
+        conn.last_used = time.monotonic()
+        if self._closed.is_set():
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.key, [])
+            if len(idle) < self.max_idle_per_peer:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+    def discard(self, conn: PooledConnection):
+        """出错的连接不再放回池中"""
+        conn.close()
+
+    def _reap_loop(self):
+        interval = max(self.idle_timeout / 2, 1)
+        while not self._closed.wait(interval):
+            self.evict_idle()
+
+    def evict_idle(self, max_idle: Optional[float] = None):
+        """关闭空闲超时或已失效的连接"""
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        now = time.monotonic()
+        expired: List[PooledConnection] = []
+        with self._lock:
+            for key in list(self._idle):
+                keep = []
+                for conn in self._idle[key]:
+                    if now - conn.last_used > max_idle or not conn.is_alive():
+                        expired.append(conn)
+                    else:
+                        keep.append(conn)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for conn in expired:
+            conn.close()
+
+    def close(self):
+        """关闭连接池及所有空闲连接"""
+        self._closed.set()
+        self.evict_idle(max_idle=-1)
@@ -0,0 +1,101 @@
+"""进度合并模块 - 把逐块的字节计数合并成低频的进度事件"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import sys
+sys.path.append('..')
+from config import PROGRESS_INTERVAL, PROGRESS_STEP, PROGRESS_SMOOTHING
+
+
+@dataclass
+class ProgressStats:
+    current: int
+    total: int
+    rate: float                 # 距上次事件的瞬时速率 (字节/秒)
+    avg_rate: float             # 指数平滑后的速率 (字节/秒)
+    eta: Optional[float]        # 预计剩余秒数，速率未知时为 None
+    elapsed: float
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.current / self.total if self.total else 100.0
+
+    def describe(self) -> str:
+        """状态栏用的简短描述，如 "42% 12.5 MB/s 剩余 0:31" """
+        text = f"{self.percent:.0f}% {format_rate(self.avg_rate)}"
+        if self.eta is not None and self.current < self.total:
+            minutes, seconds = divmod(int(self.eta), 60)
+            text += f" 剩余 {minutes}:{seconds:02d}"
+        return text
+
+
+def format_rate(rate: float) -> str:
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if rate < 1024:
+            return f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB/s"
+
+
+class ProgressReporter:
+    """线程安全的进度合并器
+
+    每次 add/update 只更新计数；距上次事件超过 interval 秒、
+    或进度又前进了 step (比例) 时才真正回调一次，完成时必定回调。
+    """
+
+    def __init__(self, total: int, callback: Callable[[ProgressStats], None],
+                 interval: float = PROGRESS_INTERVAL, step: float = PROGRESS_STEP):
+        self.total = total
+        self._callback = callback
+        self._interval = interval
+        self._step_bytes = max(1, int(total * step))
+        self._lock = threading.Lock()
+        self.start(0)
+
+    def start(self, current: int):
+        """设置起点 (如续传的已完成字节)，速率从这里开始计算"""
+        with self._lock:
+            now = time.monotonic()
+            self.current = current
+            self._started = now
+            self._last_time = now
+            self._last_bytes = current
+            self._avg_rate = 0.0
+
+    def add(self, n: int):
+        with self._lock:
+            self.current += n
+            stats = self._poll()
+        if stats:
+            self._callback(stats)
+
+    def update(self, current: int):
+        with self._lock:
+            self.current = max(self.current, current)
+            stats = self._poll()
+        if stats:
+            self._callback(stats)
+
+    def _poll(self) -> Optional[ProgressStats]:
+        now = time.monotonic()
+        dt = now - self._last_time
+        done = self.current >= self.total
+        if not done and dt < self._interval and self.current - self._last_bytes < self._step_bytes:
+            return None
+
+        delta = self.current - self._last_bytes
+        rate = delta / dt if dt > 0 else 0.0
+        if dt > 0:
+            # 按时间加权的指数平滑，事件间隔不均匀时也稳定
+            alpha = 1 - math.exp(-dt / PROGRESS_SMOOTHING)
+            self._avg_rate = rate if not self._avg_rate else self._avg_rate + alpha * (rate - self._avg_rate)
+        eta = (self.total - self.current) / self._avg_rate if self._avg_rate > 0 else None
+
+        self._last_time = now
+        self._last_bytes = self.current
+        return ProgressStats(self.current, self.total, rate, self._avg_rate, eta,
+                             now - self._started)
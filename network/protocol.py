@@ -0,0 +1,103 @@
+"""传输协议工具 - 消息帧的读写
+
+FILE 消息可带 "options" 字段请求扩展功能 (如多路并行)。新版接收方回复
+RDYEX 并附带它接受的选项；旧版接收方忽略该字段、照常回复 READY，
+发送方据此退回基础协议，因此与 Android 端保持兼容。
+"""
+import json
+import socket
+from typing import Optional
+
+import sys
+sys.path.append('..')
+from config import BUFFER_SIZE, MAX_HEADER_SIZE, RECV_BUFFER_KEEP
+
+# 固定长度的应答
+READY = b'READY'
+READY_EXT = b'RDYEX'  # READY + 4字节长度头 + JSON，仅在请求带 options 时使用
+ACK = b'ACK'
+NAK = b'NAK'
+
+
+class RecvBuffer:
+    """每个连接复用的接收缓冲区
+
+    所有数据都用 recv_into 读进同一块 bytearray，不再逐块拼接 bytes；
+    遇到更大的消息只扩容一次，处理完后如超过 RECV_BUFFER_KEEP 则释放，
+    避免空闲长连接长期占着大块内存。
+    """
+
+    def __init__(self, size: int = BUFFER_SIZE):
+        self._initial = size
+        self._buf = bytearray(size)
+        self._len_buf = bytearray(4)
+
+    def view(self, size: int) -> memoryview:
+        """返回至少 size 字节的可写视图"""
+        if size > len(self._buf):
+            self._buf = bytearray(size)
+        return memoryview(self._buf)[:size]
+
+    def recv_exact(self, conn: socket.socket, size: int) -> memoryview:
+        """读满 size 字节到缓冲区，对端提前关闭则抛出 ConnectionError"""
+        view = self.view(size)
+        recv_into_exact(conn, view)
+        return view
+
+    def recv_message(self, conn: socket.socket,
+                     idle_timeout: Optional[float] = None,
+                     timeout: Optional[float] = None) -> Optional[dict]:
+        """读取一条 4 字节长度头 + JSON 消息
+
+        等待长度头首字节时使用 idle_timeout；连接被干净关闭或空闲超时返回 None。
+        """
+        len_view = memoryview(self._len_buf)
+        conn.settimeout(idle_timeout)
+        try:
+            n = conn.recv_into(len_view)
+        except socket.timeout:
+            return None
+        if n == 0:
+            return None
+
+        conn.settimeout(timeout)
+        recv_into_exact(conn, len_view[n:])
+        msg_length = int.from_bytes(self._len_buf, 'big')
+        if msg_length > MAX_HEADER_SIZE:
+            raise ValueError(f"消息过大: {msg_length} > {MAX_HEADER_SIZE}")
+
+        view = self.recv_exact(conn, msg_length)
+        try:
+            return json.loads(str(view, 'utf-8'))
+        finally:
+            view.release()
+            self.shrink()
+
+    def shrink(self):
+        """释放处理大消息时扩容出来的内存"""
+        if len(self._buf) > RECV_BUFFER_KEEP:
+            self._buf = bytearray(self._initial)
+
+
+def recv_into_exact(conn: socket.socket, view: memoryview):
+    got = recv_fill(conn, view)
+    if got < len(view):
+        raise ConnectionError(f"连接已关闭: {got}/{len(view)}")
+
+
+def recv_fill(conn: socket.socket, view: memoryview) -> int:
+    """尽量读满 view，返回读到的字节数，小于 len(view) 表示对端已关闭"""
+    got = 0
+    size = len(view)
+    while got < size:
+        n = conn.recv_into(view[got:])
+        if n == 0:
+            break
+        got += n
+    return got
+
+
+def encode_message(message: dict) -> bytes:
+    """4字节长度头 + JSON"""
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return len(data).to_bytes(4, 'big') + data
@@ -0,0 +1,110 @@
+"""限速模块 - 全局与按对端的令牌桶，用于发送和接收两个方向
+
+收发线程每处理完一块数据调用 throttle(peer, n)，按令牌桶预约这 n 字节的发送时间，
+没有足够令牌时睡眠到预约时刻。各连接按 chunk_limit() 给出的小块推进，
+预约按先后排队，并发的传输因此轮流拿到令牌，平分限速带宽。
+限速值可在运行中随时修改 (set_limits / set_peer_limit)，下一块数据即生效。
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+import sys
+sys.path.append('..')
+from config import RATE_LIMIT_BURST, RATE_LIMIT_SLICE, TUNE_MIN_CHUNK
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 字节，最多积攒 burst 秒的令牌；rate 为 0 表示不限速
+
+    用虚拟时间实现 (GCRA)，不需要定时补充令牌的线程: _tat 是按当前速率
+    之前所有预约都发完的时刻，预约 n 字节就把它往后推 n / rate 秒。
+    """
+
+    def __init__(self, rate: int = 0, burst: float = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: int):
+        with self._lock:
+            self.rate = max(0, int(rate or 0))
+            # 旧速率下积累的预约不带到新速率
+            self._tat = min(self._tat, time.monotonic())
+
+    def reserve(self, n: int, now: float) -> float:
+        """预约 n 字节，返回还需等待的秒数"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._tat = max(self._tat, now) + n / self.rate
+            return max(0.0, self._tat - self.burst - now)
+
+
+class RateLimiter:
+    """全局限速 + 每个对端限速 (可按对端单独覆盖)，单位字节/秒，0 表示不限"""
+
+    def __init__(self, rate: int = 0, peer_rate: int = 0):
+        self._global = TokenBucket(rate)
+        self.peer_rate = peer_rate
+        self._peers: Dict[str, TokenBucket] = {}
+        self._overrides: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> int:
+        return self._global.rate
+
+    def set_limits(self, rate: Optional[int] = None, peer_rate: Optional[int] = None):
+        """修改全局和 (未单独设置的) 每对端限速，None 表示保持不变"""
+        if rate is not None:
+            self._global.set_rate(rate)
+        if peer_rate is not None:
+            with self._lock:
+                self.peer_rate = max(0, int(peer_rate))
+                buckets = [(peer, bucket) for peer, bucket in self._peers.items()
+                           if peer not in self._overrides]
+            for _, bucket in buckets:
+                bucket.set_rate(self.peer_rate)
+
+    def set_peer_limit(self, peer: str, rate: Optional[int]):
+        """单独设置某个对端的限速，rate 为 None 时恢复为 peer_rate"""
+        with self._lock:
+            if rate is None:
+                self._overrides.pop(peer, None)
+            else:
+                self._overrides[peer] = max(0, int(rate))
+        self._bucket(peer).set_rate(self._peer_limit(peer))
+
+    def _peer_limit(self, peer: str) -> int:
+        with self._lock:
+            return self._overrides.get(peer, self.peer_rate)
+
+    def _bucket(self, peer: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._peers.get(peer)
+            if bucket is None:
+                bucket = self._peers[peer] = TokenBucket(self._overrides.get(peer, self.peer_rate))
+            return bucket
+
+    def limit(self, peer: str) -> int:
+        """对该对端生效的限速 (全局与对端中较小的非零值)，0 表示不限"""
+        limits = [rate for rate in (self._global.rate, self._peer_limit(peer)) if rate]
+        return min(limits) if limits else 0
+
+    def chunk_limit(self, peer: str) -> Optional[int]:
+        """限速时每块数据的上限 (约 RATE_LIMIT_SLICE 秒的量)，不限速时返回 None"""
+        rate = self.limit(peer)
+        if not rate:
+            return None
+        return max(TUNE_MIN_CHUNK, int(rate * RATE_LIMIT_SLICE))
+
+    def throttle(self, peer: str, n: int):
+        """收发完 n 字节后调用，超出限速时睡眠"""
+        if not self._global.rate and not self._peer_limit(peer):
+            return
+        now = time.monotonic()
+        delay = max(self._global.reserve(n, now), self._bucket(peer).reserve(n, now))
+        if delay > 0:
+            time.sleep(delay)
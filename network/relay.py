@@ -0,0 +1,123 @@
+"""链式中继 - 文件沿一串对端逐跳转发，每一跳边收边发
+
+发送方只把文件发给链上第一个对端，并在 FILE 的 options.relay 中带上其余对端。
+中继节点一边把收到的数据写入 .part 文件，一边由转发线程从 .part 中读出已落盘的部分
+发给下一跳，发送方的上行带宽只用一份，总耗时接近单次传输。
+转发线程读的是磁盘上的文件而不是内存中的数据块，因此下一跳断开后可以跳过它，
+对再下一跳从其检查点续传。
+"""
+import io
+import ipaddress
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+
+def build_chain(first: Tuple[str, int], peers: Iterable[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """组成中继链: first 在链首，其余对端去重后按地址排序
+
+    peers 通常取自 DeviceDiscovery.get_devices() ([(d.ip, d.port) ...])。
+    顺序固定，同一组设备重发同一文件时每一跳的上游不变，能从各自的检查点续传。
+    """
+    rest = {tuple(peer) for peer in peers} - {tuple(first)}
+    return [tuple(first)] + sorted(rest, key=lambda peer: (_address_key(peer[0]), peer[1]))
+
+
+def _address_key(host: str) -> tuple:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return (1, 0, host)  # 主机名排在 IP 之后
+    return (0, address.version, int(address))
+
+
+@dataclass
+class RelayHop:
+    """发往一跳的状态: READY 之后 decided 置位，relaying 表示对方接手了后续对端"""
+    peer: Tuple[str, int]
+    decided: threading.Event = field(default_factory=threading.Event)
+    relaying: bool = False
+    report: Optional[dict] = None
+    error: Optional[BaseException] = None
+
+
+class RelaySource:
+    """供转发读取的文件: 从开头起连续 available 字节已经落盘
+
+    已有的完整文件 available 直接等于 size；正在接收的文件由接收方在每块写入后调用 advance()。
+    key 是传给下一跳的续传标识，为 None 时下一跳从头接收。
+    """
+
+    def __init__(self, path: str, size: int, key: Optional[str], available: int = 0):
+        self.path = path
+        self.size = size
+        self.key = key
+        self.available = available
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def advance(self, available: int):
+        with self._cond:
+            if available > self.available:
+                self.available = available
+                self._cond.notify_all()
+
+    def fail(self, error: BaseException):
+        """接收中断或校验失败: 正在等待数据的转发立即出错"""
+        with self._cond:
+            self.error = error
+            self._cond.notify_all()
+
+    def wait(self, position: int, timeout: Optional[float] = None) -> int:
+        """等到 position 之后至少有一个字节可读，返回当前可读的位置上限"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.error is not None or self.available > position, timeout)
+            if self.error is not None:
+                raise ConnectionError(f"上游传输中断: {self.error}")
+            if self.available <= position:
+                raise TimeoutError("等待上游数据超时")
+            return self.available
+
+    def open(self) -> '_SourceReader':
+        return _SourceReader(self)
+
+
+class _SourceReader:
+    """只读文件对象，read() 阻塞到数据落盘
+
+    没有 fileno()，发送时不会走 sendfile (sendfile 会越过尚未写入的部分)。
+    """
+
+    def __init__(self, source: RelaySource, timeout: float = 60):
+        self._source = source
+        self._timeout = timeout
+        self._f = open(source.path, 'rb')
+        self._pos = 0
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    def seek(self, position: int, whence: int = os.SEEK_SET):
+        if whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("只支持绝对定位")
+        self._pos = position
+        return self._f.seek(position)
+
+    def read(self, n: int) -> bytes:
+        if self._pos >= self._source.size:
+            return b''
+        available = self._source.wait(self._pos, self._timeout)
+        data = self._f.read(min(n, available - self._pos))
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -1,15 +1,117 @@
 """数据传输模块 - 文件和文字的发送与接收"""
 import os
 import json
+import hashlib
+import select
 import socket
+import stat
 import threading
-from typing import Callable, Optional
+import time
+import uuid
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
 import sys
 sys.path.append('..')
-from config import TRANSFER_PORT, BUFFER_SIZE, RECEIVE_DIR, MessageType, get_device_name
+from config import (TRANSFER_PORT, SERVER_BACKLOG, BUFFER_SIZE, MAX_HEADER_SIZE, SENDFILE_CHUNK, RECEIVE_DIR, KEEPALIVE_TIMEOUT,
+                    PARALLEL_MAX_STREAMS, PARALLEL_BYTES_PER_STREAM, PARALLEL_IDLE_TIMEOUT,
+                    CHECKPOINT_INTERVAL, RESUME_RETRIES, RESUME_RETRY_DELAY,
+                    COMPRESS_CHUNK, COMPRESSION_ENABLED, INTEGRITY_ENABLED, INTEGRITY_READ_BUFFER,
+                    HELLO_TIMEOUT, V1_PEER_RECHECK, TEXT_BATCH_ENABLED, RELAY_ACK_TIMEOUT,
+                    DELTA_ENABLED, DELTA_MIN_SIZE, DELTA_MAX_LITERAL, DELTA_MAX_COPY,
+                    RATE_LIMIT_SEND, RATE_LIMIT_SEND_PER_PEER, RATE_LIMIT_RECV, RATE_LIMIT_RECV_PER_PEER,
+                    MessageType, ensure_receive_dir, get_device_name)
+from .batching import TextBatcher, TextItem, settle_with
+from .delta import (OP as DELTA_OP, OP_COPY, OP_DATA, OP_END, DeltaPatcher, SignatureTable,
+                    block_size, compute_signatures, delta_ops, entry_size)
+from .fanout import RingCursor, SharedRing
+from .compression import (ChunkDecoder, ChunkEncoder, FRAME_HEADER, FLAG_RAW, available_codecs,
+                          pick_codec, worth_compressing)
+from .framing import (FRAME_HEADER as V2_HEADER, PROTOCOL_VERSION, accepts_v2, decode_frame,
+                      encode_frame, encode_reply, hello_reply, is_v2, parse_frame_length,
+                      recv_frame)
+from .integrity import IntegrityError, StreamHasher, available_digests, pick_digest
+from .metrics import REGISTRY, THROUGHPUT_BUCKETS
+from .partial import PartialFile, ReceivedIndex, cleanup_stale, partial_dir, valid_key
+from .pipeline import DiskWriter, preallocate
+from .pool import ConnectionPool, PooledConnection
+from .progress import ProgressReporter, ProgressStats
+from .ratelimit import RateLimiter
+from .relay import RelayHop, RelaySource
+from .tuning import LinkTuner, SocketTuning, set_nodelay, tcp_rtt
+from .protocol import RecvBuffer, READY, READY_EXT, ACK, NAK, encode_message, recv_fill, recv_into_exact
+from .workers import Priority, QueueFullError, SendExecutor, TransferHandle
+
+
+# 指标: 按对端和消息类型统计请求数、负载字节数、延迟和每个文件的吞吐
+_SENT = REGISTRY.counter('easyconnect_sent_requests_total', '发出的请求数',
+                         ('peer', 'type', 'result'))
+_SENT_BYTES = REGISTRY.counter('easyconnect_sent_payload_bytes_total', '对方已确认的文件/文字字节数',
+                               ('peer', 'type'))
+_SEND_LATENCY = REGISTRY.histogram('easyconnect_send_latency_seconds', '请求从发出到收到 ACK 的时间',
+                                   ('peer', 'type'))
+_SEND_THROUGHPUT = REGISTRY.histogram('easyconnect_send_file_throughput_bytes_per_second',
+                                      '每个文件请求的发送吞吐', ('peer',), THROUGHPUT_BUCKETS)
+_RECEIVED = REGISTRY.counter('easyconnect_received_requests_total', '处理的请求数',
+                             ('peer', 'type', 'result'))
+_RECV_BYTES = REGISTRY.counter('easyconnect_received_payload_bytes_total', '接收完成的文件/文字字节数',
+                               ('peer', 'type'))
+_RECV_DURATION = REGISTRY.histogram('easyconnect_receive_duration_seconds', '处理一个请求的时间',
+                                    ('peer', 'type'))
+_RECV_THROUGHPUT = REGISTRY.histogram('easyconnect_receive_file_throughput_bytes_per_second',
+                                      '每个文件请求的接收吞吐', ('peer',), THROUGHPUT_BUCKETS)
+_CONNECT_FAILURES = REGISTRY.counter('easyconnect_connect_failures_total', '连接对端失败次数', ('peer',))
+_SERVER_ACCEPTED = REGISTRY.counter('easyconnect_server_connections_total', '接收端接受的连接数')
+
+# 带指标的请求类型，其余 (HELLO、未知类型) 不单独统计
+_TRACKED_TYPES = (MessageType.TEXT, MessageType.TEXT_BATCH, MessageType.FILE, MessageType.FILE_RANGE)
+
+# 仪表在采集时汇总所有实例的当前状态
+_transfers: 'weakref.WeakSet[FileTransfer]' = weakref.WeakSet()
+_servers: 'weakref.WeakSet[TransferServer]' = weakref.WeakSet()
+REGISTRY.gauge('easyconnect_send_queue_depth', '排队等待的发送任务数').set_function(
+    lambda: sum(t.executor.pending() for t in list(_transfers)))
+REGISTRY.gauge('easyconnect_send_active', '正在执行的发送任务数').set_function(
+    lambda: sum(t.executor.active() for t in list(_transfers)))
+REGISTRY.gauge('easyconnect_pool_idle_connections', '连接池中的空闲长连接数').set_function(
+    lambda: sum(t.pool.idle_count() for t in list(_transfers)))
+REGISTRY.gauge('easyconnect_server_active_connections', '接收端当前的连接数').set_function(
+    lambda: sum(len(s._active_connections) for s in list(_servers)))
+REGISTRY.gauge('easyconnect_partial_transfers', '进行中的可续传接收数').set_function(
+    lambda: sum(len(s._partials) for s in list(_servers)))
+
+
+def _payload_size(message: dict) -> int:
+    """请求携带的负载: 文件 (分段) 字节数或文字字符数"""
+    msg_type = message.get('type')
+    if msg_type == MessageType.FILE:
+        return int(message.get('file_size') or 0)
+    if msg_type == MessageType.FILE_RANGE:
+        return int(message.get('length') or 0)
+    if msg_type == MessageType.TEXT:
+        return len(message.get('content') or '')
+    if msg_type == MessageType.TEXT_BATCH:
+        return sum(len(item) for item in message.get('items') or () if isinstance(item, str))
+    return 0
+
+
+def _finish_request(conn: PooledConnection, result: str):
+    """请求结束 (收到 ACK/NAK 或出错)，记录该请求的指标"""
+    if conn.request is None:
+        return
+    msg_type, size, started = conn.request
+    conn.request = None
+    peer = conn.key[0]
+    elapsed = time.monotonic() - started
+    _SENT.inc(peer=peer, type=msg_type, result=result)
+    if result != 'ok':
+        return
+    _SEND_LATENCY.observe(elapsed, peer=peer, type=msg_type)
+    _SENT_BYTES.inc(size, peer=peer, type=msg_type)
+    if msg_type == MessageType.FILE and elapsed > 0:
+        _SEND_THROUGHPUT.observe(size / elapsed, peer=peer)
 
 
 @dataclass
@@ -21,111 +123,1062 @@ class TransferData:
     file_data: bytes = b''
 
 
+@dataclass
+class _Reply:
+    """不带数据体的消息 (HELLO、文字) 的处理结果: 引擎把 data 写到连接上，再调用 done()"""
+    data: Optional[bytes]
+    done: Callable[[], None]
+    upgrade: bool = False  # HELLO 协商成功，此后该连接改用 v2 二进制帧
+
+
+def _can_sendfile(f) -> bool:
+    """普通文件且系统支持 sendfile 时走内核零拷贝"""
+    if not hasattr(os, 'sendfile'):
+        return False
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+    except OSError:
+        return False
+
+
+def _send_range(sock: socket.socket, f, offset: int, length: int,
+                advance: Callable[[int], None], codec: Optional[str] = None,
+                tuning: Optional[SocketTuning] = None, hasher: Optional[StreamHasher] = None):
+    """发送文件中 [offset, offset + length) 这一段
+
+    协商了压缩时按块编码发送；否则普通文件分段调用 sendfile (每段约 BULK_SLICE_TIME 秒的数据)，
+    每段回报一次进度，其他来源退回逐块读取发送，块大小由 tuning 按链路估计决定。
+    advance 在段与段之间调用，发送方可以在这里为交互消息让路。
+    需要计算摘要时 sendfile 照常发送，每段发出后交给 hasher 的后台线程从页缓存读回计算。
+    """
+    end = offset + length
+    if codec:
+        _send_compressed(sock, f, offset, length, advance, codec, tuning, hasher)
+        return
+    if _can_sendfile(f) and (hasher is None or hasattr(os, 'preadv')):
+        fd = f.fileno()
+        pos = offset
+        while pos < end:
+            size = tuning.slice() if tuning else SENDFILE_CHUNK
+            n = sock.sendfile(f, pos, min(size, end - pos))
+            if n == 0:
+                raise Exception(f"文件在发送过程中被截断: {pos}/{end}")
+            if hasher:
+                hasher.update_file(fd, pos, n)
+            pos += n
+            advance(n)
+        return
+    
+    if offset:
+        f.seek(offset)
+    remaining = length
+    while remaining > 0:
+        size = tuning.chunk() if tuning else BUFFER_SIZE
+        chunk = f.read(min(size, remaining))
+        if not chunk:
+            raise Exception(f"文件在发送过程中被截断: {end - remaining}/{end}")
+        if hasher:
+            hasher.update(chunk)
+        sock.sendall(chunk)
+        remaining -= len(chunk)
+        advance(len(chunk))
+
+
+def _send_compressed(sock: socket.socket, f, offset: int, length: int,
+                     advance: Callable[[int], None], codec: str,
+                     tuning: Optional[SocketTuning] = None, hasher: Optional[StreamHasher] = None):
+    encoder = ChunkEncoder(codec)
+    f.seek(offset)
+    remaining = length
+    while remaining > 0:
+        if tuning:
+            tuning.chunk()  # 压缩块大小是协议的一部分，这里只调缓冲区
+        chunk = f.read(min(COMPRESS_CHUNK, remaining))
+        if not chunk:
+            raise Exception(f"文件在发送过程中被截断: {offset + length - remaining}/{offset + length}")
+        if hasher:
+            hasher.update(chunk)
+        header, payload = encoder.encode(chunk)
+        sock.sendall(header)
+        sock.sendall(payload)
+        remaining -= len(chunk)
+        advance(len(chunk))
+
+
+def _read_range(conn: socket.socket, buffer: RecvBuffer, length: int,
+                codec: Optional[str], writer: DiskWriter,
+                limiter: Optional[RateLimiter] = None):
+    """网络一级: 把一个分段的数据读进池化缓冲区交给写盘线程，压缩块在这里解码
+
+    接收限速时按小块读取，每块之后由 limiter 决定是否暂停；
+    暂停期间不读 socket，TCP 流量控制让发送方随之放慢。
+    """
+    peer = conn.getpeername()[0] if limiter else None
+    left = length
+    if codec is None:
+        while left > 0:
+            buf = writer.acquire()
+            size = min(len(buf), left)
+            if limiter:
+                size = min(size, limiter.chunk_limit(peer) or size)
+            try:
+                got = recv_fill(conn, memoryview(buf)[:size])
+            except BaseException:
+                writer.release(buf)
+                raise
+            writer.submit(buf, got)
+            left -= got
+            if got < size:
+                raise ConnectionError(f"分段数据不完整，还差 {left} 字节")
+            if limiter:
+                limiter.throttle(peer, got)
+        return
+    
+    decoder = ChunkDecoder(codec)
+    while left > 0:
+        flag, stored, raw = decoder.parse_header(buffer.recv_exact(conn, FRAME_HEADER.size))
+        if raw == 0 or raw > left:
+            raise ValueError(f"压缩块长度越界: {raw}/{left}")
+        buf = writer.acquire()
+        try:
+            payload = memoryview(buf)[:stored]
+            recv_into_exact(conn, payload)
+            if flag == FLAG_RAW:
+                writer.submit(buf, raw)
+            else:
+                data = decoder.decode(flag, payload, raw)
+                payload.release()
+                writer.release(buf)
+                writer.submit_bytes(data)
+        except BaseException:
+            writer.release(buf)
+            raise
+        left -= raw
+        if limiter:
+            limiter.throttle(peer, FRAME_HEADER.size + stored)
+
+
+def default_streams(file_size: int) -> int:
+    """按文件大小决定并行连接数，小文件只用一条连接"""
+    return max(1, min(PARALLEL_MAX_STREAMS, file_size // PARALLEL_BYTES_PER_STREAM))
+
+
+def _resume_key(file_path: str, st: os.stat_result) -> str:
+    """同一文件 (路径、大小、修改时间不变) 在发送端重启后得到相同的续传标识"""
+    ident = f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+
+def _remaining_work(resume: Optional[dict], file_size: int) -> List[Tuple[int, int, int]]:
+    """接收方在 accept.resume 中返回各分段已落盘的字节数，只需发送剩余部分
+
+    返回 (offset, length, done)，done 为该分段在 offset 之前已落盘的字节数 (摘要要覆盖到)。
+    """
+    if not resume:
+        return [(0, file_size, 0)]
+    return [(o + c, l - c, c) for o, l, c in resume['ranges'] if c < l]
+
+
+def _hash_existing(f, offset: int, length: int, hasher: StreamHasher):
+    """把 [offset, offset + length) 计入摘要: 续传时分段中之前会话已传的部分也要校验
+
+    能取得文件描述符时交给哈希线程用 os.preadv 读，否则 (中继的 .part 读取器等) 在这里逐块读出。
+    """
+    if length <= 0:
+        return
+    if hasattr(os, 'preadv'):
+        try:
+            fd = f.fileno()
+        except (OSError, ValueError):
+            fd = None
+        if fd is not None:
+            hasher.update_file(fd, offset, length)
+            return
+    f.seek(offset)
+    while length > 0:
+        chunk = f.read(min(length, INTEGRITY_READ_BUFFER))
+        if not chunk:
+            raise OSError(f"文件在校验过程中被截断: 还差 {length} 字节")
+        hasher.update(chunk)
+        length -= len(chunk)
+
+
+class _ProgressCounter:
+    """多条连接共用的发送进度，每个数据块顺带检查任务是否被取消，并调用 pace(n) 控制节奏
+
+    回调经 ProgressReporter 合并，不再每个数据块触发一次。
+    """
+    
+    def __init__(self, total: int, on_progress: Optional[Callable] = None,
+                 on_stats: Optional[Callable[[ProgressStats], None]] = None,
+                 check_cancelled: Optional[Callable[[], None]] = None,
+                 pace: Optional[Callable[[int], None]] = None):
+        self.total = total
+        self._on_progress = on_progress
+        self._on_stats = on_stats
+        self._check_cancelled = check_cancelled
+        self._pace = pace
+        self._reporter = ProgressReporter(total, self._emit)
+    
+    def reset(self, done: int):
+        self._reporter.start(done)
+    
+    def advance(self, n: int):
+        if self._check_cancelled:
+            self._check_cancelled()
+        self._reporter.add(n)
+        if self._pace:
+            self._pace(n)
+    
+    def skip(self, n: int):
+        """不经网络发送就已完成的字节 (增量传输中接收方从旧文件复制的块)，不参与限速"""
+        if self._check_cancelled:
+            self._check_cancelled()
+        self._reporter.add(n)
+    
+    def _emit(self, stats: ProgressStats):
+        if self._on_progress:
+            self._on_progress(stats.current, stats.total)
+        if self._on_stats:
+            self._on_stats(stats)
+
+
 class FileTransfer:
-    """TCP 发送器"""
+    """TCP 发送器，按对端复用长连接"""
     
     def __init__(self):
         self.device_name = get_device_name()
+        self.pool = ConnectionPool()
+        self.executor = SendExecutor()
+        self.tuner = LinkTuner()
+        self.limiter = RateLimiter(RATE_LIMIT_SEND, RATE_LIMIT_SEND_PER_PEER)
+        self.batcher = TextBatcher(self._send_batch)
+        # 判定为只支持 v1 的对端 -> 重新尝试协商 v2 的时间
+        self._v1_peers: Dict[Tuple[str, int], float] = {}
+        _transfers.add(self)
+    
+    def _submit(self, target_ip: str, target_port: int, job: Callable[[TransferHandle], None],
+                on_error: Optional[Callable], block: bool, timeout: Optional[float],
+                priority: Priority = Priority.BULK) -> TransferHandle:
+        """把发送任务交给有界线程池；队列已满时返回已失败的句柄并回调 on_error"""
+        peer = (target_ip, target_port)
+        try:
+            return self.executor.submit(peer, job, block=block, timeout=timeout, priority=priority)
+        except (QueueFullError, RuntimeError) as e:
+            print(f"[Transfer] 无法提交发送任务: {e}")
+            if on_error:
+                on_error(str(e))
+            handle = TransferHandle(peer)
+            handle.set_exception(e)
+            return handle
+    
+    def _request(self, target_ip: str, target_port: int, timeout: float,
+                 exchange: Callable[[PooledConnection], None]):
+        """在池化连接上完成一次请求-应答
+
+        复用的连接可能已被对端关闭 (空闲超时或旧版本对端一条消息即断开)，
+        如果在收到任何回复之前失败，则换一条新连接重试一次。
+        """
+        while True:
+            try:
+                conn = self.pool.acquire(target_ip, target_port)
+            except OSError:
+                _CONNECT_FAILURES.inc(peer=target_ip)
+                raise
+            if conn.version is None and not self._negotiate(conn):
+                self.pool.discard(conn)
+                continue
+            try:
+                conn.sock.settimeout(timeout)
+                exchange(conn)
+            except ConnectionError:
+                _finish_request(conn, 'error')
+                self.pool.discard(conn)
+                if conn.reused and not conn.replied:
+                    continue
+                raise
+            except BaseException:
+                _finish_request(conn, 'error')
+                self.pool.discard(conn)
+                raise
+            self.pool.release(conn)
+            return
+    
+    def _negotiate(self, conn: PooledConnection) -> bool:
+        """新连接上用 HELLO 协商协议版本
+
+        旧版对端不认识 HELLO，会断开或不回复；此时记下该对端只支持 v1 并返回 False，
+        由调用方换一条新连接按 v1 通信。
+        """
+        if self._v1_peers.get(conn.key, 0) > time.monotonic():
+            conn.version = 1
+            return True
+        try:
+            conn.sock.settimeout(HELLO_TIMEOUT)
+            self._send_message(conn, {
+                'type': MessageType.HELLO,
+                'sender': self.device_name,
+                'versions': [1, PROTOCOL_VERSION],
+                'keep_alive': True
+            })
+            reply = self._recv_frame(conn)
+            if reply['type'] == MessageType.HELLO and reply.get('version') == PROTOCOL_VERSION:
+                conn.version = PROTOCOL_VERSION
+                conn.caps = set(reply.get('caps') or [])
+                conn.replied = False
+                return True
+        except (OSError, ValueError):
+            pass
+        print(f"[Transfer] {conn.key[0]} 不支持 v2 协议，使用 v1")
+        self._v1_peers[conn.key] = time.monotonic() + V1_PEER_RECHECK
+        return False
+    
+    @staticmethod
+    def _send_message(conn: PooledConnection, message: dict):
+        msg_type = message.get('type')
+        if msg_type in _TRACKED_TYPES:
+            conn.request = (msg_type, _payload_size(message), time.monotonic())
+        elif msg_type != MessageType.TRAILER:
+            conn.request = None
+        if conn.version == PROTOCOL_VERSION:
+            # 每个请求一个新的流 ID，trailer 沿用所属请求的流 ID
+            if message.get('type') != MessageType.TRAILER:
+                conn.stream_id += 1
+            conn.sendall(encode_frame(message, conn.stream_id))
+        else:
+            # 消息协议: 4字节长度头 + JSON
+            conn.sendall(encode_message(message))
+    
+    @staticmethod
+    def _recv_frame(conn: PooledConnection) -> dict:
+        header = conn.recv_exact(V2_HEADER.size)
+        return decode_frame(header, conn.recv_exact(parse_frame_length(header)))
+    
+    @classmethod
+    def _recv_reply(cls, conn: PooledConnection) -> dict:
+        """v2: 读取一个应答帧并核对流 ID"""
+        reply = cls._recv_frame(conn)
+        if reply['stream_id'] != conn.stream_id:
+            raise Exception(f"应答流 ID 不匹配: {reply['stream_id']}/{conn.stream_id}")
+        return reply
+    
+    @classmethod
+    def _recv_ready(cls, conn: PooledConnection) -> dict:
+        """读取 READY，返回接收方接受的扩展选项 (旧版接收方为空)"""
+        if conn.version == PROTOCOL_VERSION:
+            reply = cls._recv_reply(conn)
+            if reply['type'] == 'NAK':
+                raise Exception("接收方拒绝接收 (磁盘空间不足或无法写入)")
+            if reply['type'] != 'READY':
+                raise Exception("接收方未准备好")
+            return reply.get('accept') or {}
+        
+        reply = conn.recv_exact(3)
+        if reply == NAK:
+            raise Exception("接收方拒绝接收 (磁盘空间不足或无法写入)")
+        reply += conn.recv_exact(2)
+        if reply == READY:
+            return {}
+        if reply == READY_EXT:
+            length = int.from_bytes(conn.recv_exact(4), 'big')
+            return json.loads(conn.recv_exact(length)).get('accept', {})
+        raise Exception("接收方未准备好")
+    
+    @classmethod
+    def _recv_ack(cls, conn: PooledConnection) -> dict:
+        """读取 ACK，返回其中附带的信息 (v2 中继报告等，v1 为空)"""
+        accept = {}
+        if conn.version == PROTOCOL_VERSION:
+            frame = cls._recv_reply(conn)
+            reply = frame['type'].encode()
+            accept = frame.get('accept') or {}
+        else:
+            reply = conn.recv_exact(3)
+        if reply == NAK:
+            _finish_request(conn, 'nak')
+            raise IntegrityError("接收方校验失败")
+        if reply != ACK:
+            raise Exception("未收到确认")
+        _finish_request(conn, 'ok')
+        return accept
+    
+    def _send_data(self, conn: PooledConnection, f, offset: int, length: int,
+                   progress: '_ProgressCounter', codec: Optional[str], digest: Optional[str],
+                   peer: str, done: int = 0):
+        """发送一个分段的数据，协商了摘要时在数据后附上 trailer
+
+        摘要覆盖整个分段: done 为接收方在 offset 之前已有的字节数 (续传)，这部分从本地文件读回计入。
+        """
+        hasher = StreamHasher(digest) if digest else None
+        try:
+            if hasher:
+                _hash_existing(f, offset - done, done, hasher)
+            _send_range(conn.sock, f, offset, length, progress.advance, codec,
+                        self.tuner.tune(conn.sock, peer, self.limiter), hasher)
+            if hasher:
+                self._send_message(conn, {'type': MessageType.TRAILER,
+                                          'digest': hasher.hexdigest()})
+        finally:
+            if hasher:
+                hasher.close()
     
     def send_text(self, target_ip: str, target_port: int, text: str, 
-                  on_success: Optional[Callable] = None, on_error: Optional[Callable] = None):
-        def _send():
+                  on_success: Optional[Callable] = None, on_error: Optional[Callable] = None,
+                  block: bool = True, timeout: Optional[float] = None) -> TransferHandle:
+        """发送文字，返回可等待/取消的句柄
+
+        默认与同一对端短时间内的其他文字合并发送 (见 TextBatcher)；该对端等待合并的文字已达
+        TEXT_BATCH_MAX_PENDING 条 (关闭合并时为发送队列已满) 则阻塞等待，
+        block=False 或超过 timeout 则返回已失败的句柄。
+        """
+        peer = (target_ip, target_port)
+        if TEXT_BATCH_ENABLED:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(10)
-                    s.connect((target_ip, target_port))
-                    
-                    # 构造消息
-                    message = {
-                        'type': MessageType.TEXT,
+                return self.batcher.add(peer, text, on_success, on_error, block, timeout)
+            except (QueueFullError, RuntimeError) as e:
+                print(f"[Transfer] 无法提交发送任务: {e}")
+                if on_error:
+                    on_error(str(e))
+                handle = TransferHandle(peer)
+                handle.set_exception(e)
+                return handle
+        
+        item = TextItem(text, TransferHandle(peer), on_success, on_error)
+        # 提交失败 (队列已满、已关闭) 或排队时被取消，文字的句柄随任务句柄结束
+        settle_with([item], self._submit(target_ip, target_port, self._text_job(peer, [item]),
+                                         None, block, timeout, Priority.INTERACTIVE))
+        return item.handle
+    
+    def _send_batch(self, peer: Tuple[str, int], items: List[TextItem]) -> TransferHandle:
+        """TextBatcher 的发送回调: 一批文字作为一个交互任务提交
+        
+        任务在队列里被取消 (close() 时 executor.shutdown) 的话，这批文字的句柄随之结束。
+        """
+        handle = self.executor.submit(peer, self._text_job(peer, items), priority=Priority.INTERACTIVE)
+        settle_with(items, handle)
+        return handle
+    
+    def _text_job(self, peer: Tuple[str, int], items: List[TextItem]) -> Callable[[TransferHandle], None]:
+        """发送一批文字的任务
+
+        对端声明支持 text_batch 时合成一条 TEXT_BATCH 消息，只需一次应答；
+        否则 (旧版对端) 逐条发送 TEXT。
+        """
+        target_ip, target_port = peer
+        
+        def _send(handle: TransferHandle):
+            live = [item for item in items if item.handle.set_running_or_notify_cancel()]
+            done = 0
+            
+            def _exchange(conn: PooledConnection):
+                nonlocal done
+                if 'text_batch' in conn.caps and len(live) - done > 1:
+                    self._send_message(conn, {
+                        'type': MessageType.TEXT_BATCH,
                         'sender': self.device_name,
-                        'content': text
-                    }
-                    
-                    # 消息协议: 4字节长度头 + JSON
-                    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
-                    s.sendall(len(data).to_bytes(4, 'big'))
-                    s.sendall(data)
-                    
-                    # 等待确认
-                    ack = s.recv(3)
-                    if ack == b'ACK':
-                        print(f"[Transfer] 文字发送成功到 {target_ip}")
-                        if on_success:
-                            on_success()
-                    else:
-                        raise Exception("未收到确认")
-                        
+                        'items': [item.text for item in live[done:]],
+                        'keep_alive': True
+                    })
+                    self._recv_ack(conn)
+                    done = len(live)
+                    return
+                
+                self._send_message(conn, {
+                    'type': MessageType.TEXT,
+                    'sender': self.device_name,
+                    'content': live[done].text,
+                    'keep_alive': True
+                })
+                
+                # 等待确认
+                self._recv_ack(conn)
+                done += 1
+            
+            error = None
+            try:
+                # 旧版对端一条消息一个连接，每条文字单独走一次请求
+                while done < len(live):
+                    self._request(target_ip, target_port, 10, _exchange)
+                if live:
+                    print(f"[Transfer] {len(live)} 条文字发送成功到 {target_ip}" if len(live) > 1
+                          else f"[Transfer] 文字发送成功到 {target_ip}")
             except Exception as e:
                 print(f"[Transfer] 发送文字失败: {e}")
-                if on_error:
-                    on_error(str(e))
+                error = e
+            
+            # 出错前已确认的文字算作成功
+            for i, item in enumerate(live):
+                if error is None or i < done:
+                    item.handle.set_result(None)
+                    if item.on_success:
+                        item.on_success()
+                else:
+                    item.handle.set_exception(error)
+                    if item.on_error:
+                        item.on_error(str(error))
+            if error is not None:
+                raise error
         
-        # 异步发送
-        threading.Thread(target=_send, daemon=True).start()
+        return _send
     
     def send_file(self, target_ip: str, target_port: int, file_path: str,
                   on_progress: Optional[Callable] = None, on_success: Optional[Callable] = None, 
-                  on_error: Optional[Callable] = None):
-        def _send():
+                  on_error: Optional[Callable] = None, streams: Optional[int] = None,
+                  compress: Optional[bool] = None, block: bool = True,
+                  timeout: Optional[float] = None,
+                  on_stats: Optional[Callable[[ProgressStats], None]] = None) -> TransferHandle:
+        """发送文件，返回可等待/取消的句柄
+
+        streams 为并行连接数，默认按文件大小决定 (见 default_streams)；
+        compress 默认在对端声明支持压缩时试压一块样本，自动决定是否协商压缩。
+        on_progress(current, total) 与 on_stats(ProgressStats) 按时间/百分比合并触发，
+        后者附带瞬时、平滑速率和剩余时间。
+        文件属于批量任务: 同一对端有文字等交互消息待发时，在数据块之间暂停让路；
+        发送速率受 self.limiter 的全局和每对端限速约束。
+        接收方不支持这些扩展时自动退回单连接、原样发送。
+        """
+        def _send(handle: TransferHandle):
             try:
                 if not os.path.exists(file_path):
                     raise FileNotFoundError(f"文件不存在: {file_path}")
                 
-                file_name = os.path.basename(file_path)
-                file_size = os.path.getsize(file_path)
-                
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(60)  # 文件传输给更多时间
-                    s.connect((target_ip, target_port))
-                    
-                    file_info = {
-                        'type': MessageType.FILE,
-                        'sender': self.device_name,
-                        'content': file_name,
-                        'file_size': file_size
-                    }
-                    
-                    info_data = json.dumps(file_info, ensure_ascii=False).encode('utf-8')
-                    s.sendall(len(info_data).to_bytes(4, 'big'))
-                    s.sendall(info_data)
-                    
-                    ready = s.recv(5)
-                    if ready != b'READY':
-                        raise Exception("接收方未准备好")
-                    
-                    # 发送文件数据
-                    sent = 0
-                    with open(file_path, 'rb') as f:
-                        while True:
-                            chunk = f.read(BUFFER_SIZE)
-                            if not chunk:
-                                break
-                            s.sendall(chunk)
-                            sent += len(chunk)
-                            if on_progress:
-                                on_progress(sent, file_size)
-                    
-                    # 等待确认
-                    ack = s.recv(3)
-                    if ack == b'ACK':
-                        print(f"[Transfer] 文件发送成功: {file_name}")
-                        if on_success:
-                            on_success()
-                    else:
-                        raise Exception("未收到确认")
-                        
+                self._send_file(target_ip, target_port, file_path, on_progress,
+                                on_stats, streams, compress, handle)
+                print(f"[Transfer] 文件发送成功: {os.path.basename(file_path)}")
+                if on_success:
+                    on_success()
             except Exception as e:
                 print(f"[Transfer] 发送文件失败: {e}")
                 if on_error:
                     on_error(str(e))
+                raise
+        
+        return self._submit(target_ip, target_port, _send, on_error, block, timeout, Priority.BULK)
+    
+    def _send_file(self, target_ip: str, target_port: int, file_path: str,
+                   on_progress: Optional[Callable], on_stats: Optional[Callable],
+                   streams: Optional[int], compress: Optional[bool], handle: TransferHandle):
+        st = os.stat(file_path)
+        file_name = os.path.basename(file_path)
+        file_size = st.st_size
         
-        threading.Thread(target=_send, daemon=True).start()
+        def _on_stats(stats: ProgressStats):
+            # 传输过程中持续更新吞吐估计，分块和缓冲区随之调整
+            self.tuner.observe_rate(target_ip, stats.avg_rate)
+            if on_stats:
+                on_stats(stats)
+        
+        peer = (target_ip, target_port)
+        
+        def _pace(n: int):
+            self.executor.yield_to_interactive(peer)
+            self.limiter.throttle(target_ip, n)
+        
+        progress = _ProgressCounter(file_size, on_progress, _on_stats, handle.check_cancelled, _pace)
+        
+        # 普通文件请求断点续传 (及多路并行)；管道等无法定位的来源只走基础协议
+        options = {}
+        if stat.S_ISREG(st.st_mode):
+            options['resume'] = _resume_key(file_path, st)
+            if streams is None:
+                streams = default_streams(file_size)
+            if streams > 1:
+                options['parallel'] = {'streams': streams}
+            if INTEGRITY_ENABLED:
+                options['integrity'] = available_digests()
+            if DELTA_ENABLED and file_size >= DELTA_MIN_SIZE:
+                # 接收方已有同名文件时可改为只发变化的块
+                options['delta'] = {'strong': available_digests()}
+        
+        resumable = False
+        
+        def _exchange(conn: PooledConnection):
+            nonlocal resumable, compress
+            if compress is None and 'compression' in conn.caps:
+                # HELLO 表明对端支持压缩后才采样，重试时沿用第一次的结论
+                compress = COMPRESSION_ENABLED and worth_compressing(file_path, file_size)
+            if compress and options:
+                options['compression'] = available_codecs()
+            header = {
+                'type': MessageType.FILE,
+                'sender': self.device_name,
+                'content': file_name,
+                'file_size': file_size,
+                'keep_alive': True
+            }
+            if options:
+                header['options'] = options
+            started = time.monotonic()
+            self._send_message(conn, header)
+            accept = self._recv_ready(conn)
+            self.tuner.observe_rtt(target_ip, tcp_rtt(conn.sock) or time.monotonic() - started)
+            
+            codec = accept.get('compression')
+            if codec not in available_codecs():
+                codec = None
+            digest = accept.get('integrity')
+            if digest not in available_digests():
+                digest = None
+            
+            # 接收方返回各分段已落盘的字节数，只发送剩余部分
+            resume = accept.get('resume')
+            resumable = bool(resume)
+            work = _remaining_work(resume, file_size)
+            progress.reset(file_size - sum(length for _, length, _ in work))
+            
+            # 发送文件数据
+            if isinstance(accept.get('delta'), dict):
+                progress.reset(0)
+                self._send_delta(conn, file_path, file_size, accept['delta'], progress, target_ip)
+            elif len(work) > 1:
+                self._send_ranges(target_ip, target_port, file_path, resume['id'],
+                                  work, progress, codec, digest)
+            else:
+                with open(file_path, 'rb') as f:
+                    for offset, length, done in work:
+                        self._send_data(conn, f, offset, length, progress, codec, digest, target_ip,
+                                        done)
+            
+            # 等待确认
+            self._recv_ack(conn)
+        
+        attempt = 0
+        while True:
+            try:
+                self._request(target_ip, target_port, 60, _exchange)  # 文件传输给更多时间
+                return
+            except (ConnectionError, TimeoutError, IntegrityError) as e:
+                if isinstance(e, IntegrityError) and options.pop('delta', None):
+                    # 增量重建的结果与新文件不一致 (接收方的旧文件在此期间被修改等)，整份重发
+                    print(f"[Transfer] 增量传输校验失败，改为完整发送: {e}")
+                    continue
+                # 校验失败的分段已被接收方回退到本次会话的起点，续传会重发它
+                if not resumable or attempt >= RESUME_RETRIES:
+                    raise
+                attempt += 1
+                resumable = False
+                print(f"[Transfer] 连接中断，{RESUME_RETRY_DELAY * attempt}s 后续传: {e}")
+                time.sleep(RESUME_RETRY_DELAY * attempt)
+    
+    def _send_delta(self, conn: PooledConnection, file_path: str, file_size: int, delta: dict,
+                    progress: _ProgressCounter, peer: str):
+        """增量发送: 读入接收方旧文件的块签名，只发送匹配不上的数据，其余发复制指令
+
+        最后附上整个新文件的摘要，接收方用它核对重建结果。
+        """
+        strong = delta.get('strong')
+        if strong not in available_digests():
+            raise Exception(f"接收方选择了不支持的摘要算法: {strong}")
+        block, count = int(delta['block']), int(delta['count'])
+        if count * entry_size(strong) > MAX_HEADER_SIZE:
+            raise ValueError(f"块签名过大: {count} 块")
+        table = SignatureTable(conn.recv_exact(count * entry_size(strong)), block, strong)
+        
+        hasher = StreamHasher(strong)
+        tuning = self.tuner.tune(conn.sock, peer, self.limiter)
+        copy_start = copy_count = 0
+        literal = sent = 0
+        
+        def _flush_copy():
+            nonlocal copy_count
+            if copy_count:
+                conn.sendall(DELTA_OP.pack(OP_COPY, copy_start, copy_count))
+                progress.skip(copy_count * block)
+                copy_count = 0
+        
+        try:
+            with open(file_path, 'rb') as f:
+                for op, value in delta_ops(f, file_size, table):
+                    if op == OP_COPY:
+                        index, data = value
+                        hasher.update(data)
+                        sent += len(data)
+                        # 连续的块合并成一条复制指令
+                        if (copy_count and index == copy_start + copy_count
+                                and (copy_count + 1) * block <= DELTA_MAX_COPY):
+                            copy_count += 1
+                        else:
+                            _flush_copy()
+                            copy_start, copy_count = index, 1
+                    else:
+                        _flush_copy()
+                        tuning.chunk()
+                        hasher.update(value)
+                        conn.sendall(DELTA_OP.pack(OP_DATA, len(value), 0))
+                        conn.sendall(value)
+                        literal += len(value)
+                        sent += len(value)
+                        progress.advance(len(value))
+            if sent != file_size:
+                raise Exception(f"文件在发送过程中被修改: {sent}/{file_size}")
+            _flush_copy()
+            conn.sendall(DELTA_OP.pack(OP_END, 0, 0))
+            self._send_message(conn, {'type': MessageType.TRAILER, 'digest': hasher.hexdigest()})
+        finally:
+            hasher.close()
+        print(f"[Transfer] 增量发送: {os.path.basename(file_path)} "
+              f"实际发送 {literal}/{file_size} 字节")
+    
+    def _send_ranges(self, target_ip: str, target_port: int, file_path: str,
+                     transfer_id: str, work: List[Tuple[int, int]],
+                     progress: _ProgressCounter, codec: Optional[str], digest: Optional[str],
+                     opener: Optional[Callable] = None):
+        """多条连接并行发送各个分段，全部分段确认后由控制连接等待最终 ACK
+
+        opener 用于打开数据来源 (默认按路径打开文件，中继时为 RelaySource.open)。
+        """
+        errors: List[Exception] = []
+        if opener is None:
+            opener = lambda: open(file_path, 'rb')
+        
+        def _send_one(offset: int, length: int, done: int):
+            def _exchange(conn: PooledConnection):
+                self._send_message(conn, {
+                    'type': MessageType.FILE_RANGE,
+                    'sender': self.device_name,
+                    'transfer_id': transfer_id,
+                    'offset': offset,
+                    'length': length,
+                    'keep_alive': True
+                })
+                with opener() as f:
+                    self._send_data(conn, f, offset, length, progress, codec, digest, target_ip,
+                                    done)
+                self._recv_ack(conn)
+            
+            try:
+                self._request(target_ip, target_port, 60, _exchange)
+            except Exception as e:
+                errors.append(e)
+        
+        workers = [threading.Thread(target=_send_one, args=r, daemon=True) for r in work]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        if errors:
+            raise errors[0]
+    
+    def send_file_fanout(self, targets: List[Tuple[str, int]], file_path: str,
+                         on_progress: Optional[Callable[[Tuple[str, int], int, int], None]] = None,
+                         on_stats: Optional[Callable[[Tuple[str, int], ProgressStats], None]] = None,
+                         on_peer_done: Optional[Callable[[Tuple[str, int], Optional[str]], None]] = None,
+                         block: bool = True, timeout: Optional[float] = None) -> TransferHandle:
+        """把同一文件同时发给多个对端，文件只从磁盘读一遍 (见 fanout.SharedRing)
+
+        每个对端一条连接，进度回调带上对端 (ip, port)；某个对端完成或失败时调用
+        on_peer_done(对端, None 或错误信息)。太慢的对端被分离后自己读盘继续，
+        中途断开的对端按续传流程单独重试。句柄结果为 {对端: None 或错误信息}。
+        """
+        def _send(handle: TransferHandle):
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"文件不存在: {file_path}")
+            results = self._send_fanout(list(dict.fromkeys(targets)), file_path,
+                                        on_progress, on_stats, on_peer_done, handle)
+            failed = sum(1 for error in results.values() if error)
+            print(f"[Transfer] 多播发送完成: {os.path.basename(file_path)} "
+                  f"({len(results) - failed}/{len(results)} 个对端成功)")
+            return results
+        
+        # 多播任务不属于单个对端
+        return self._submit('*', 0, _send, None, block, timeout, Priority.BULK)
+    
+    def _send_fanout(self, targets: List[Tuple[str, int]], file_path: str,
+                     on_progress: Optional[Callable], on_stats: Optional[Callable],
+                     on_peer_done: Optional[Callable],
+                     handle: TransferHandle) -> Dict[Tuple[str, int], Optional[str]]:
+        st = os.stat(file_path)
+        ring = SharedRing(file_path, st.st_size)
+        cursors = {peer: ring.attach() for peer in targets}
+        results: Dict[Tuple[str, int], Optional[str]] = {}
+        
+        def _run(peer: Tuple[str, int]):
+            error = None
+            try:
+                self._fanout_peer(peer, file_path, st, cursors[peer], on_progress, on_stats, handle)
+            except Exception as e:
+                print(f"[Transfer] 多播发送到 {peer[0]} 失败: {e}")
+                error = str(e)
+            finally:
+                cursors[peer].leave()
+            results[peer] = error
+            if on_peer_done:
+                on_peer_done(peer, error)
+        
+        ring.start()
+        workers = [threading.Thread(target=_run, args=(peer,), daemon=True) for peer in targets]
+        try:
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+        finally:
+            ring.close()
+        return results
+    
+    def _fanout_peer(self, peer: Tuple[str, int], file_path: str, st: os.stat_result,
+                     cursor: RingCursor, on_progress: Optional[Callable],
+                     on_stats: Optional[Callable], handle: TransferHandle):
+        """多播中的一个对端: 协商后从共享环取数据发送，续传或被分离时改为自己读盘"""
+        target_ip, target_port = peer
+        file_name = os.path.basename(file_path)
+        file_size = st.st_size
+        
+        def _on_stats(stats: ProgressStats):
+            self.tuner.observe_rate(target_ip, stats.avg_rate)
+            if on_stats:
+                on_stats(peer, stats)
+        
+        def _pace(n: int):
+            self.executor.yield_to_interactive(peer)
+            self.limiter.throttle(target_ip, n)
+        
+        progress = _ProgressCounter(file_size, on_progress and (lambda c, t: on_progress(peer, c, t)),
+                                    _on_stats, handle.check_cancelled, _pace)
+        options = {'resume': _resume_key(file_path, st)}
+        if INTEGRITY_ENABLED:
+            options['integrity'] = available_digests()
+        resumable = False
+        
+        def _exchange(conn: PooledConnection):
+            nonlocal resumable
+            started = time.monotonic()
+            self._send_message(conn, {
+                'type': MessageType.FILE,
+                'sender': self.device_name,
+                'content': file_name,
+                'file_size': file_size,
+                'options': options,
+                'keep_alive': True
+            })
+            accept = self._recv_ready(conn)
+            self.tuner.observe_rtt(target_ip, tcp_rtt(conn.sock) or time.monotonic() - started)
+            digest = accept.get('integrity')
+            if digest not in available_digests():
+                digest = None
+            resume = accept.get('resume')
+            resumable = bool(resume)
+            work = _remaining_work(resume, file_size)
+            progress.reset(file_size - sum(length for _, length, _ in work))
+            
+            if work == [(0, file_size, 0)]:
+                self._send_from_ring(conn, cursor, file_path, progress, digest, target_ip)
+            else:
+                # 接收方已有部分数据，不等共享环，直接续传剩余部分
+                cursor.leave()
+                if len(work) > 1:
+                    self._send_ranges(target_ip, target_port, file_path, resume['id'],
+                                      work, progress, None, digest)
+                else:
+                    offset, length, done = work[0]
+                    with open(file_path, 'rb') as f:
+                        self._send_data(conn, f, offset, length, progress, None, digest, target_ip,
+                                        done)
+            self._recv_ack(conn)
+        
+        try:
+            self._request(target_ip, target_port, 60, _exchange)
+        except (ConnectionError, TimeoutError, IntegrityError) as e:
+            cursor.leave()
+            if not resumable:
+                raise
+            print(f"[Transfer] 多播连接中断，单独续传到 {target_ip}: {e}")
+            time.sleep(RESUME_RETRY_DELAY)
+            self._send_file(target_ip, target_port, file_path,
+                            on_progress and (lambda c, t: on_progress(peer, c, t)),
+                            on_stats and (lambda stats: on_stats(peer, stats)),
+                            1, False, handle)
+    
+    def _send_from_ring(self, conn: PooledConnection, cursor: RingCursor, file_path: str,
+                        progress: _ProgressCounter, digest: Optional[str], peer: str):
+        """从共享环取块发送；被分离 (或环提前结束) 时从当前位置起自己读盘发完"""
+        cursor.begin(digest)
+        tuning = self.tuner.tune(conn.sock, peer, self.limiter)
+        while True:
+            slot = cursor.next()
+            if slot is None:
+                break
+            tuning.chunk()  # 只用来同步 socket 缓冲区
+            conn.sendall(slot.data)
+            progress.advance(len(slot.data))
+        
+        state = cursor.digest_state()
+        hasher = StreamHasher(digest, state) if state is not None else None
+        try:
+            rest = progress.total - cursor.position
+            if rest:
+                if cursor.detached:
+                    print(f"[Transfer] {peer} 跟不上多播进度，改为单独读盘发送")
+                with open(file_path, 'rb') as f:
+                    _send_range(conn.sock, f, cursor.position, rest, progress.advance, None, tuning,
+                                hasher)
+                    if hasher is not None:
+                        hasher.hexdigest()  # 文件关闭前算完从页缓存读回的部分
+            if hasher is not None:
+                self._send_message(conn, {'type': MessageType.TRAILER, 'digest': hasher.hexdigest()})
+        finally:
+            if hasher is not None:
+                hasher.close()
+    
+    def send_file_relay(self, chain: List[Tuple[str, int]], file_path: str,
+                        on_progress: Optional[Callable] = None,
+                        on_stats: Optional[Callable[[ProgressStats], None]] = None,
+                        block: bool = True, timeout: Optional[float] = None) -> TransferHandle:
+        """沿一条链中继发送: 只发给 chain[0]，由它边收边转发给 chain[1]，依此类推
+
+        chain 通常取自 DeviceDiscovery.get_devices() ([(d.ip, d.port) ...])。
+        某一跳连不上或中途断开时跳过它，直接发给其后的对端 (从其检查点续传)；
+        不支持中继的对端只作为终点接收，其后的对端由上一跳继续发送。
+        进度是发往第一跳的进度；句柄结果为 {'delivered': [...], 'failed': [...]}。
+        """
+        def _send(handle: TransferHandle):
+            st = os.stat(file_path)
+            if not stat.S_ISREG(st.st_mode):
+                raise ValueError(f"只能中继普通文件: {file_path}")
+            source = RelaySource(file_path, st.st_size, _resume_key(file_path, st), st.st_size)
+            report = self.relay(source, os.path.basename(file_path), chain,
+                                on_progress, on_stats, handle.check_cancelled)
+            print(f"[Transfer] 中继发送完成: {os.path.basename(file_path)} "
+                  f"({len(report['delivered'])}/{len(chain)} 个对端收到)")
+            return report
+        
+        # 中继任务不属于单个对端
+        return self._submit('*', 0, _send, None, block, timeout, Priority.BULK)
+    
+    def relay(self, source: RelaySource, file_name: str, chain: List[Tuple[str, int]],
+              on_progress: Optional[Callable] = None, on_stats: Optional[Callable] = None,
+              check_cancelled: Optional[Callable[[], None]] = None) -> dict:
+        """把 source 发给链上第一个可达的对端，其余对端交给它转发
+
+        也由 TransferServer 在中继节点上调用，source 此时是仍在接收中的 .part 文件。
+        对方不支持中继 (只作为终点) 时，不等它收完就接着发下一跳；
+        连不上或中途断开的对端被跳过，其后的对端由本节点继续发送。
+        """
+        report = {'delivered': [], 'failed': []}
+        remaining = [(str(ip), int(port)) for ip, port in chain]
+        leaves: List[Tuple[RelayHop, threading.Thread]] = []
+        first = True
+        while remaining:
+            hop = RelayHop(remaining.pop(0))
+            # 进度只反映第一跳
+            args = (source, file_name, hop, list(remaining), on_progress if first else None,
+                    on_stats if first else None, check_cancelled)
+            first = False
+            thread = threading.Thread(target=self._relay_hop, args=args, daemon=True)
+            thread.start()
+            hop.decided.wait()
+            if not hop.relaying:
+                leaves.append((hop, thread))
+                continue
+            thread.join()
+            if hop.error is None:
+                # 下一跳接手了其余对端
+                report['delivered'].append(list(hop.peer))
+                report['delivered'] += hop.report.get('delivered', [])
+                report['failed'] += hop.report.get('failed', [])
+                break
+            print(f"[Transfer] 中继节点 {hop.peer[0]} 中途失败，跳过该对端: {hop.error}")
+            report['failed'].append(list(hop.peer))
+        
+        for hop, thread in leaves:
+            thread.join()
+            if hop.error is None:
+                report['delivered'].append(list(hop.peer))
+            else:
+                print(f"[Transfer] 中继到 {hop.peer[0]} 失败，跳过该对端: {hop.error}")
+                report['failed'].append(list(hop.peer))
+        if check_cancelled:
+            check_cancelled()
+        return report
+    
+    def _relay_hop(self, source: RelaySource, file_name: str, hop: RelayHop,
+                   rest: List[Tuple[str, int]], on_progress: Optional[Callable],
+                   on_stats: Optional[Callable], check_cancelled: Optional[Callable[[], None]]):
+        """发给一跳，结果记在 hop 上；对方接手转发时 hop.report 为其中继报告"""
+        try:
+            self._send_hop(source, file_name, hop, rest, on_progress, on_stats, check_cancelled)
+        except Exception as e:
+            hop.error = e
+        finally:
+            hop.decided.set()
+    
+    def _send_hop(self, source: RelaySource, file_name: str, hop: RelayHop,
+                  rest: List[Tuple[str, int]], on_progress: Optional[Callable],
+                  on_stats: Optional[Callable], check_cancelled: Optional[Callable[[], None]]):
+        peer = hop.peer
+        target_ip, target_port = peer
+        
+        def _on_stats(stats: ProgressStats):
+            self.tuner.observe_rate(target_ip, stats.avg_rate)
+            if on_stats:
+                on_stats(stats)
+        
+        def _pace(n: int):
+            self.executor.yield_to_interactive(peer)
+            self.limiter.throttle(target_ip, n)
+        
+        progress = _ProgressCounter(source.size, on_progress, _on_stats, check_cancelled, _pace)
+        
+        def _exchange(conn: PooledConnection):
+            relay = bool(rest) and 'relay' in conn.caps
+            options = {}
+            if source.key:
+                options['resume'] = source.key
+            if INTEGRITY_ENABLED:
+                options['integrity'] = available_digests()
+            if relay:
+                options['relay'] = {'chain': [list(p) for p in rest]}
+            started = time.monotonic()
+            self._send_message(conn, {
+                'type': MessageType.FILE,
+                'sender': self.device_name,
+                'content': file_name,
+                'file_size': source.size,
+                'options': options,
+                'keep_alive': True
+            })
+            accept = self._recv_ready(conn)
+            self.tuner.observe_rtt(target_ip, tcp_rtt(conn.sock) or time.monotonic() - started)
+            hop.relaying = relay and bool(accept.get('relay'))
+            hop.decided.set()
+            digest = accept.get('integrity')
+            if digest not in available_digests():
+                digest = None
+            resume = accept.get('resume')
+            work = _remaining_work(resume, source.size)
+            progress.reset(source.size - sum(length for _, length, _ in work))
+            
+            if len(work) > 1:
+                self._send_ranges(target_ip, target_port, source.path, resume['id'],
+                                  work, progress, None, digest, source.open)
+            else:
+                with source.open() as f:
+                    for offset, length, done in work:
+                        self._send_data(conn, f, offset, length, progress, None, digest, target_ip,
+                                        done)
+            
+            # 中继节点等下游全部结束后才回复 ACK
+            if hop.relaying:
+                conn.sock.settimeout(RELAY_ACK_TIMEOUT)
+            ack = self._recv_ack(conn)
+            if hop.relaying:
+                hop.report = ack.get('relay') or {'delivered': [], 'failed': [list(p) for p in rest]}
+        
+        self._request(target_ip, target_port, 60, _exchange)
+    
+    def close(self):
+        """取消未完成的发送任务并关闭所有池化连接"""
+        self.batcher.close()
+        self.executor.shutdown()
+        self.pool.close()
 
 
 class TransferServer:
     """TCP 接收服务器"""
     
+    # HELLO 应答中声明的能力
+    capabilities = ('resume', 'parallel', 'compression', 'integrity', 'text_batch', 'relay')
+    
     def __init__(self, port: int = TRANSFER_PORT):
         self.port = port
         self.server_socket: Optional[socket.socket] = None
@@ -138,33 +1191,90 @@ class TransferServer:
         self._on_text_received = None
         self._on_file_received = None
         self._on_progress = None
+        self._on_stats = None
+        
+        # 进行中的可续传接收: 续传标识 -> PartialFile
+        self._partials: Dict[str, PartialFile] = {}
+        # 已收文件的来源，增量传输只以同一发送方发来的文件为基准
+        self._received = ReceivedIndex()
+        self.limiter = RateLimiter(RATE_LIMIT_RECV, RATE_LIMIT_RECV_PER_PEER)
+        # 中继转发用的发送器 (未设置时按需创建)，以及转发过的数据未通过校验的续传标识
+        self.relay_transfer: Optional[FileTransfer] = None
+        self._own_relay_transfer = False
+        self._relay_tainted: set = set()
+        # 监听结果: start() 在后台线程里 bind，调用方用 wait_started 等待成功或失败
+        self._listening = threading.Event()
+        self.start_error: Optional[OSError] = None
+        _servers.add(self)
     
     def set_callbacks(self, 
                       on_text: Callable[[str, str], None],  # (sender, text)
                       on_file: Callable[[str, str, str], None],  # (sender, filename, filepath)
-                      on_progress: Optional[Callable[[str, int, int], None]] = None):
+                      on_progress: Optional[Callable[[str, int, int], None]] = None,
+                      on_stats: Optional[Callable[[str, ProgressStats], None]] = None):  # (filename, stats)
         self._on_text_received = on_text
         self._on_file_received = on_file
         self._on_progress = on_progress
+        self._on_stats = on_stats
+    
+    def _reporter(self, file_name: str, total: int) -> ProgressReporter:
+        """接收进度合并器，按时间和百分比步长触发 on_progress / on_stats"""
+        def _emit(stats: ProgressStats):
+            if self._on_progress:
+                self._on_progress(file_name, stats.current, stats.total)
+            if self._on_stats:
+                self._on_stats(file_name, stats)
+        return ProgressReporter(total, _emit)
     
     def start(self):
         if self._running:
             return
         self._running = True
+        self._listening.clear()
+        self.start_error = None
         self._thread = threading.Thread(target=self._run_server, daemon=True)
         self._thread.start()
         print(f"[Server] 传输服务器已启动，端口: {self.port}")
     
+    def wait_started(self, timeout: Optional[float] = None) -> bool:
+        """等到开始监听，超时返回 False；监听失败 (如端口被占用) 时抛出原来的 OSError"""
+        if not self._listening.wait(timeout):
+            return False
+        if self.start_error:
+            raise self.start_error
+        return True
+    
+    def _listen(self) -> bool:
+        """绑定并监听端口，失败时记录到 start_error"""
+        try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind(('0.0.0.0', self.port))
+            self.server_socket.listen(SERVER_BACKLOG)
+            return True
+        except OSError as e:
+            print(f"[Server] 监听端口 {self.port} 失败: {e}")
+            self.start_error = e
+            self._running = False
+            if self.server_socket is not None:  # socket() 本身失败时还没有创建
+                self.server_socket.close()
+            self.server_socket = None
+            return False
+        finally:
+            self._listening.set()
+    
     def _run_server(self):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind(('0.0.0.0', self.port))
-        self.server_socket.listen(5)
+        ensure_receive_dir()
+        cleanup_stale()
+        if not self._listen():
+            return
         self.server_socket.settimeout(1)  # 超时便于优雅退出
         
         while self._running:
             try:
                 conn, addr = self.server_socket.accept()
+                _SERVER_ACCEPTED.inc()
+                set_nodelay(conn)
                 with self._lock:
                     self._active_connections.add(conn)
                 threading.Thread(
@@ -180,62 +1290,31 @@ class TransferServer:
     
     def _handle_client(self, conn: socket.socket, addr: tuple):
         try:
-            conn.settimeout(60)
-            length_data = conn.recv(4)
-            if not length_data:
-                return
-            
-            msg_length = int.from_bytes(length_data, 'big')
-            msg_data = b''
-            while len(msg_data) < msg_length:
-                chunk = conn.recv(min(BUFFER_SIZE, msg_length - len(msg_data)))
-                if not chunk:
+            # 长连接: 循环处理多条消息，直到对端关闭或不再要求保持连接
+            buffer = RecvBuffer()
+            version = 1
+            while self._running:
+                if version == PROTOCOL_VERSION:
+                    message = recv_frame(conn, buffer, idle_timeout=KEEPALIVE_TIMEOUT, timeout=60)
+                else:
+                    message = buffer.recv_message(conn, idle_timeout=KEEPALIVE_TIMEOUT, timeout=60)
+                if message is None:
+                    break
+                reply = self._respond(addr, message)
+                if reply is None:
+                    self._handle_observed(conn, addr, message, buffer)
+                else:
+                    if reply.data:
+                        conn.sendall(reply.data)
+                    reply.done()
+                    if reply.upgrade:
+                        version = PROTOCOL_VERSION
+                if not message.get('keep_alive'):
                     break
-                msg_data += chunk
-            
-            message = json.loads(msg_data.decode('utf-8'))
-            msg_type = message.get('type')
-            sender = message.get('sender', 'Unknown')
-            content = message.get('content', '')
-            
-            if msg_type == MessageType.TEXT:
-                print(f"[Server] 收到文字来自 {sender}: {content[:50]}...")
-                conn.sendall(b'ACK')
-                if self._on_text_received:
-                    self._on_text_received(sender, content)
-                    
-            elif msg_type == MessageType.FILE:
-                file_size = message.get('file_size', 0)
-                file_name = content
-                conn.sendall(b'READY')
-                
-                # 生成唯一文件名
-                file_path = os.path.join(RECEIVE_DIR, file_name)
-                base, ext = os.path.splitext(file_path)
-                counter = 1
-                while os.path.exists(file_path):
-                    file_path = f"{base}_{counter}{ext}"
-                    counter += 1
-                
-                received = 0
-                with open(file_path, 'wb') as f:
-                    while received < file_size:
-                        chunk = conn.recv(min(BUFFER_SIZE, file_size - received))
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        received += len(chunk)
-                        if self._on_progress:
-                            self._on_progress(file_name, received, file_size)
-                
-                conn.sendall(b'ACK')
-                print(f"[Server] 文件接收完成: {file_path}")
-                
-                if self._on_file_received:
-                    self._on_file_received(sender, file_name, file_path)
                     
         except Exception as e:
-            print(f"[Server] 处理客户端错误: {e}")
+            if self._running:
+                print(f"[Server] 处理客户端错误: {e}")
         finally:
             with self._lock:
                 if conn in self._active_connections:
@@ -245,6 +1324,478 @@ class TransferServer:
             except:
                 pass
     
+    def _hello(self, message: dict) -> Optional[bytes]:
+        """发送方支持 v2 时返回 HELLO 应答帧，此后该连接改用二进制帧"""
+        if not accepts_v2(message):
+            return None
+        return hello_reply(self.capabilities)
+    
+    def _respond(self, addr: tuple, message: dict) -> Optional[_Reply]:
+        """两种引擎共用的消息分派
+        
+        HELLO 和文字消息没有数据体: 返回应答及应答发出后要做的事 (交给回调、记录指标)，
+        引擎只负责把应答写到连接上；文件消息还要读数据体，返回 None，
+        由引擎以阻塞方式调用 _handle_observed。
+        """
+        msg_type = message.get('type')
+        if msg_type in (MessageType.FILE, MessageType.FILE_RANGE):
+            return None
+        if msg_type == MessageType.HELLO:
+            data = self._hello(message)
+            return _Reply(data, lambda: None, upgrade=data is not None)
+        
+        started = time.monotonic()
+        
+        def _done():
+            try:
+                self._deliver_text(message)
+            except BaseException:
+                self._observe(addr[0], message, started, 'error')
+                raise
+            self._observe(addr[0], message, started, 'ok')
+        
+        ack = None
+        if msg_type in (MessageType.TEXT, MessageType.TEXT_BATCH):
+            ack = encode_reply(message, ACK)
+        return _Reply(ack, _done)
+    
+    def _handle_observed(self, conn: socket.socket, addr: tuple, message: dict, buffer: RecvBuffer):
+        """处理一条文件消息并记录指标"""
+        started = time.monotonic()
+        try:
+            self._handle_message(conn, message, buffer)
+        except BaseException:
+            self._observe(addr[0], message, started, 'error')
+            raise
+        self._observe(addr[0], message, started, 'ok')
+    
+    @staticmethod
+    def _observe(peer: str, message: dict, started: float, result: str):
+        msg_type = message.get('type')
+        if msg_type not in _TRACKED_TYPES:
+            msg_type = 'other'  # 类型来自网络，不让任意字符串变成标签
+        _RECEIVED.inc(peer=peer, type=msg_type, result=result)
+        if result != 'ok':
+            return
+        elapsed = time.monotonic() - started
+        size = _payload_size(message)
+        _RECV_DURATION.observe(elapsed, peer=peer, type=msg_type)
+        _RECV_BYTES.inc(size, peer=peer, type=msg_type)
+        if msg_type == MessageType.FILE and elapsed > 0:
+            _RECV_THROUGHPUT.observe(size / elapsed, peer=peer)
+    
+    def _handle_message(self, conn: socket.socket, message: dict, buffer: RecvBuffer):
+        msg_type = message.get('type')
+        sender = message.get('sender', 'Unknown')
+        content = message.get('content', '')
+        
+        if msg_type == MessageType.FILE:
+            self._handle_file(conn, message, buffer, sender, content)
+        
+        elif msg_type == MessageType.FILE_RANGE:
+            self._handle_file_range(conn, message, buffer)
+    
+    def _deliver_text(self, message: dict):
+        """ACK 发出后把文字 (或一批文字，按顺序逐条) 交给 on_text"""
+        msg_type = message.get('type')
+        sender = message.get('sender', 'Unknown')
+        if msg_type == MessageType.TEXT:
+            content = message.get('content', '')
+            print(f"[Server] 收到文字来自 {sender}: {content[:50]}...")
+            if self._on_text_received:
+                self._on_text_received(sender, content)
+        
+        elif msg_type == MessageType.TEXT_BATCH:
+            items = message.get('items')
+            if not isinstance(items, list):
+                return
+            print(f"[Server] 收到 {len(items)} 条文字来自 {sender}")
+            for text in items:
+                if isinstance(text, str) and self._on_text_received:
+                    self._on_text_received(sender, text)
+    
+    @staticmethod
+    def _send_ready(conn: socket.socket, message: dict, accept: dict):
+        """请求带 options 时回复 RDYEX + 接受的选项，否则回复普通 READY (v2 为 READY 帧)"""
+        conn.sendall(encode_reply(message, READY, accept if 'options' in message else None))
+    
+    @staticmethod
+    def _unique_path(file_name: str) -> str:
+        # 生成唯一文件名
+        file_path = os.path.join(RECEIVE_DIR, file_name)
+        base, ext = os.path.splitext(file_path)
+        counter = 1
+        while os.path.exists(file_path):
+            file_path = f"{base}_{counter}{ext}"
+            counter += 1
+        return file_path
+    
+    def _handle_file(self, conn: socket.socket, message: dict, buffer: RecvBuffer,
+                     sender: str, file_name: str):
+        file_size = message.get('file_size', 0)
+        options = message.get('options')
+        sender_ip = conn.getpeername()[0]
+        if options and file_size > 0:
+            base_path = self._delta_base(message, sender_ip, sender, file_name, file_size, options)
+            if base_path:
+                self._receive_delta(conn, message, buffer, sender, file_name, file_size,
+                                    options, base_path)
+            else:
+                self._receive_partial(conn, message, buffer, sender, file_name, file_size, options)
+            return
+        
+        # 旧版发送方: 直接写入目标文件
+        file_path = self._unique_path(file_name)
+        progress = self._reporter(file_name, file_size)
+        received = 0
+        
+        def _written(data: memoryview):
+            nonlocal received
+            received += len(data)
+            progress.add(len(data))
+        
+        with open(file_path, 'wb') as f:
+            try:
+                preallocate(f, file_size)
+            except OSError:
+                conn.sendall(encode_reply(message, NAK))  # 磁盘空间不足，开始接收前就拒绝
+                raise
+            self._send_ready(conn, message, {})
+            writer = DiskWriter(f, _written, file_size)
+            try:
+                _read_range(conn, buffer, file_size, None, writer, self.limiter)
+            finally:
+                writer.close()
+                if received < file_size:
+                    f.truncate(received)  # 去掉预分配但未收到的部分
+            writer.check()
+        
+        self._received.record(sender_ip, sender, file_name, file_path)
+        conn.sendall(encode_reply(message, ACK))
+        print(f"[Server] 文件接收完成: {file_path}")
+        
+        if self._on_file_received:
+            self._on_file_received(sender, file_name, file_path)
+    
+    def _delta_base(self, message: dict, sender_ip: str, sender: str, file_name: str,
+                    file_size: int, options: dict) -> Optional[str]:
+        """发送方提供增量传输，且它之前发来的同名文件原样还在 (至少一整块) 时返回该文件路径
+
+        只看来源记录，不按文件名匹配: 别的设备发来的同名文件不会被当作基准并被替换。
+        """
+        delta = options.get('delta')
+        if not DELTA_ENABLED or not isinstance(delta, dict) or not pick_digest(delta.get('strong')):
+            return None
+        if self._relay_chain(message, options):
+            return None  # 中继要边收边转发 .part 文件，走普通接收
+        path = self._received.lookup(sender_ip, sender, file_name)
+        try:
+            if path is not None and os.path.getsize(path) >= block_size(file_size):
+                return path
+        except OSError:
+            pass
+        return None
+    
+    def _receive_delta(self, conn: socket.socket, message: dict, buffer: RecvBuffer,
+                       sender: str, file_name: str, file_size: int, options: dict, base_path: str):
+        """增量接收: 发出旧文件的块签名，按发送方的指令重建新文件，校验通过后替换旧文件"""
+        strong = pick_digest(options['delta'].get('strong'))
+        block = block_size(file_size)
+        count = os.path.getsize(base_path) // block
+        os.makedirs(partial_dir(), exist_ok=True)
+        temp_path = os.path.join(partial_dir(), f"{uuid.uuid4().hex}.delta")
+        progress = self._reporter(file_name, file_size)
+        try:
+            with open(temp_path, 'wb') as out:
+                try:
+                    preallocate(out, file_size)
+                    patcher = DeltaPatcher(base_path, out, block, count, strong)
+                except OSError:
+                    conn.sendall(encode_reply(message, NAK))  # 磁盘空间不足等，开始接收前就拒绝
+                    raise
+                try:
+                    self._send_ready(conn, message,
+                                     {'delta': {'block': block, 'count': count, 'strong': strong}})
+                    print(f"[Server] 增量接收: {file_name} (旧文件 {count} 块 × {block})")
+                    compute_signatures(base_path, block, count, strong, conn.sendall)
+                    self._apply_delta(conn, buffer, patcher, file_size, progress)
+                finally:
+                    patcher.close()
+                    buffer.shrink()
+                
+                trailer = self._recv_trailer(conn, buffer, message)
+                if patcher.written != file_size or trailer.get('digest') != patcher.hexdigest():
+                    conn.sendall(encode_reply(message, NAK))
+                    raise IntegrityError(f"增量重建校验失败: {file_name}")
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temp_path, base_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        
+        self._received.record(conn.getpeername()[0], sender, file_name, base_path)
+        conn.sendall(encode_reply(message, ACK))
+        print(f"[Server] 文件接收完成 (增量): {base_path}")
+        
+        if self._on_file_received:
+            self._on_file_received(sender, file_name, base_path)
+    
+    def _apply_delta(self, conn: socket.socket, buffer: RecvBuffer, patcher: DeltaPatcher,
+                     file_size: int, progress: ProgressReporter):
+        """读取增量指令直到 END，复制块或写入字面数据；字面数据受接收限速约束"""
+        peer = conn.getpeername()[0]
+        max_literal = max(DELTA_MAX_LITERAL, patcher.block)
+        while True:
+            op, a, b = DELTA_OP.unpack(buffer.recv_exact(conn, DELTA_OP.size))
+            if op == OP_END:
+                return
+            if op == OP_COPY:
+                n = patcher.copy(a, b)
+            elif op == OP_DATA:
+                if not 0 < a <= max_literal:
+                    raise ValueError(f"字面数据长度越界: {a}")
+                patcher.write(buffer.recv_exact(conn, a))
+                self.limiter.throttle(peer, a)
+                n = a
+            else:
+                raise ValueError(f"未知的增量指令: {op}")
+            if patcher.written > file_size:
+                raise ValueError(f"增量数据超出文件大小: {patcher.written}/{file_size}")
+            progress.add(n)
+    
+    @staticmethod
+    def _recv_trailer(conn: socket.socket, buffer: RecvBuffer, request: dict) -> dict:
+        """读取数据之后的 {"digest": ...} trailer (v2 为 TRAILER 帧)"""
+        if is_v2(request):
+            trailer = recv_frame(conn, buffer, idle_timeout=60, timeout=60)
+        else:
+            trailer = buffer.recv_message(conn, idle_timeout=60, timeout=60)
+        if trailer is None:
+            raise ConnectionError("缺少校验信息")
+        return trailer
+    
+    def _claim_partial(self, key: str, sender: str, file_name: str, file_size: int,
+                       streams: int) -> PartialFile:
+        """打开续传状态；同一文件仍有旧会话挂着时先断开它，再从磁盘检查点继续"""
+        with self._lock:
+            old = self._partials.pop(key, None)
+        if old is not None:
+            old.abort()
+        partial = PartialFile.open(key, sender, file_name, file_size, streams)
+        with self._lock:
+            self._partials[key] = partial
+        return partial
+    
+    def _receive_partial(self, conn: socket.socket, message: dict, buffer: RecvBuffer,
+                         sender: str, file_name: str, file_size: int, options: dict):
+        """控制连接: 写入 .part 并记录检查点，单段时数据直接走本连接，
+        多段时等待各 FILE_RANGE 连接写完，最后回复唯一一个 ACK"""
+        key = options.get('resume')
+        if not valid_key(key):
+            key = uuid.uuid4().hex
+        streams = 1
+        if isinstance(options.get('parallel'), dict):
+            streams = max(1, min(int(options['parallel'].get('streams', 1)), PARALLEL_MAX_STREAMS))
+        
+        try:
+            partial = self._claim_partial(key, sender, file_name, file_size, streams)
+        except OSError:
+            conn.sendall(encode_reply(message, NAK))  # 磁盘空间不足等，开始接收前就拒绝
+            raise
+        partial.codec = pick_codec(options.get('compression'))
+        partial.integrity = pick_digest(options.get('integrity'))
+        partial.progress = self._reporter(file_name, file_size)
+        partial.progress.start(partial.received)
+        chain = self._relay_chain(message, options)
+        forwarder = None
+        partial.attach(conn)
+        try:
+            remaining = partial.remaining()
+            resumed = partial.received
+            accept = {'resume': {'id': key, 'ranges': partial.state()}}
+            if partial.codec:
+                accept['compression'] = partial.codec
+            if partial.integrity:
+                accept['integrity'] = partial.integrity
+            if chain:
+                accept['relay'] = True
+            self._send_ready(conn, message, accept)
+            if chain:
+                forwarder = self._start_relay(partial, chain)
+            if resumed:
+                print(f"[Server] 续传: {file_name} 从 {resumed}/{file_size}")
+            elif len(remaining) > 1:
+                print(f"[Server] 开始并行接收: {file_name} ({len(remaining)} 路)")
+            
+            if len(remaining) == 1:
+                self._receive_range(conn, buffer, partial, remaining[0], message)
+            while not partial.complete.wait(0.5):
+                if not self._running or partial.aborted:
+                    raise ConnectionError("传输已中止")
+                if time.monotonic() - partial.last_activity > PARALLEL_IDLE_TIMEOUT:
+                    raise TimeoutError("分段传输超时")
+                # 等待期间控制连接上不应有数据，可读说明发送方已断开
+                readable, _, _ = select.select([conn], [], [], 0)
+                if readable:
+                    raise ConnectionError("发送方已断开")
+            if forwarder:
+                # 本地收完后等下游全部结束，ACK 中附上中继报告
+                partial.relay.advance(file_size)
+                forwarder.join()
+        except BaseException as e:
+            # 断开其余分段连接 (和下游转发)，已落盘的部分留给下次续传
+            if partial.relay:
+                partial.relay.fail(e)
+            partial.detach(conn)
+            partial.abort()
+            raise
+        finally:
+            partial.detach(conn)
+            with self._lock:
+                if self._partials.get(key) is partial:
+                    del self._partials[key]
+        
+        file_path = self._unique_path(file_name)
+        partial.finish(file_path)
+        self._received.record(conn.getpeername()[0], sender, file_name, file_path)
+        if forwarder:
+            self._relay_tainted.discard(key)
+            conn.sendall(encode_reply(message, ACK, {'relay': forwarder.report}))
+        else:
+            conn.sendall(encode_reply(message, ACK))
+        print(f"[Server] 文件接收完成: {file_path}")
+        
+        if self._on_file_received:
+            self._on_file_received(sender, file_name, file_path)
+    
+    @staticmethod
+    def _relay_chain(message: dict, options: dict) -> List[Tuple[str, int]]:
+        """请求中要求转发的后续对端，只在 v2 连接上接受 (ACK 要带回中继报告)"""
+        relay = options.get('relay')
+        if not is_v2(message) or not isinstance(relay, dict) or not isinstance(relay.get('chain'), list):
+            return []
+        chain = []
+        for hop in relay['chain']:
+            if (isinstance(hop, list) and len(hop) == 2 and isinstance(hop[0], str)
+                    and isinstance(hop[1], int)):
+                chain.append((hop[0], hop[1]))
+        return chain
+    
+    def _start_relay(self, partial: PartialFile, chain: List[Tuple[str, int]]) -> threading.Thread:
+        """启动转发线程: 从 .part 文件读出已落盘的数据发给下一跳"""
+        if self.relay_transfer is None:
+            self.relay_transfer = FileTransfer()
+            self._own_relay_transfer = True
+        # 之前转发出去的数据未通过校验时，下游不能续传，要从头接收
+        key = None if partial.key in self._relay_tainted else partial.key
+        partial.relay = RelaySource(partial.part_path, partial.file_size, key, partial.contiguous())
+        print(f"[Server] 中继转发: {partial.file_name} -> {', '.join(ip for ip, _ in chain)}")
+        
+        def _forward():
+            thread.report = self.relay_transfer.relay(partial.relay, partial.file_name, chain)
+        
+        thread = threading.Thread(target=_forward, name='relay-forward', daemon=True)
+        thread.report = {'delivered': [], 'failed': [list(hop) for hop in chain]}
+        thread.start()
+        return thread
+    
+    def _handle_file_range(self, conn: socket.socket, message: dict, buffer: RecvBuffer):
+        """分段连接: 把数据写到 .part 文件中该分段的续传位置"""
+        with self._lock:
+            partial = self._partials.get(message.get('transfer_id'))
+        if partial is None:
+            raise ValueError("未知的并行传输")
+        index = partial.range_for(int(message.get('offset', -1)))
+        start, length = partial.ranges[index]
+        if int(message.get('length', -1)) != length - partial.written[index]:
+            raise ValueError("分段长度不匹配")
+        
+        partial.attach(conn)
+        try:
+            self._receive_range(conn, buffer, partial, index, message)
+        except IntegrityError:
+            # 中断整个传输 (包括控制连接)，发送方从检查点重新续传
+            partial.detach(conn)
+            partial.abort()
+            raise
+        finally:
+            partial.detach(conn)
+        conn.sendall(encode_reply(message, ACK))
+    
+    def _receive_range(self, conn: socket.socket, buffer: RecvBuffer,
+                       partial: PartialFile, index: int, request: dict):
+        """接收一个分段，每 CHECKPOINT_INTERVAL 秒 fsync 并更新检查点
+
+        按时间而不是字节数落盘: 快速链路上 fsync 次数不随吞吐增加，
+        中断时最多重传约 CHECKPOINT_INTERVAL 秒的数据。
+        协商了摘要时，数据之后还有一条 {"digest": ...} trailer，摘要覆盖整个分段:
+        之前会话已落盘的部分先从 .part 读回计入。不一致时无法判断坏在哪一部分，
+        该段整段丢弃并回复 NAK，发送方从分段起点重传。
+        """
+        start, length = partial.ranges[index]
+        pos = partial.written[index]
+        committed_at = time.monotonic()
+        digest = None
+        
+        def _written(data: memoryview):
+            # 在写盘线程中执行: 数据已写入文件
+            nonlocal pos, committed_at
+            if hasher:
+                hasher.update(data)
+            pos += len(data)
+            total = partial.advance(index, len(data))
+            if partial.progress:
+                partial.progress.update(total)
+            if partial.relay:
+                # 转发线程另外打开文件读取，先把缓冲区写出
+                f.flush()
+                partial.relay.advance(partial.contiguous())
+            now = time.monotonic()
+            if now - committed_at >= CHECKPOINT_INTERVAL:
+                f.flush()
+                os.fsync(f.fileno())
+                partial.commit(index, pos)
+                committed_at = now
+        
+        with open(partial.part_path, 'r+b') as f:
+            hasher = StreamHasher(partial.integrity) if partial.integrity else None
+            try:
+                if hasher:
+                    _hash_existing(f, start, pos, hasher)
+                f.seek(start + pos)
+                writer = DiskWriter(f, _written, length - pos)
+                try:
+                    _read_range(conn, buffer, length - pos, partial.codec, writer, self.limiter)
+                finally:
+                    # 中断时也把已收到的数据写完并落盘，续传从这里开始
+                    writer.close()
+                    try:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        partial.commit(index, pos)
+                    except OSError as e:
+                        print(f"[Server] 保存检查点失败: {e}")
+                writer.check()
+                if hasher:
+                    digest = hasher.hexdigest()  # 文件关闭前算完从 .part 读回的部分
+            finally:
+                if hasher:
+                    hasher.close()
+        
+        if hasher:
+            trailer = self._recv_trailer(conn, buffer, request)
+            if trailer.get('digest') != digest:
+                if partial.relay:
+                    self._relay_tainted.add(partial.key)
+                partial.rewind(index, 0)
+                conn.sendall(encode_reply(request, NAK))
+                raise IntegrityError(f"校验失败: {partial.file_name} 分段 {index}")
+        partial.range_done()
+    
     def stop(self):
         """ 停止服务器"""
         print("[Server] 正在停止服务器并清理连接...")
@@ -282,5 +1833,13 @@ class TransferServer:
             if self._thread.is_alive():
                 print("[Server] 警告: 服务器线程未能及时停止")
         self._thread = None
+        self._close_relay()
         
         print("[Server] 传输服务器已停止")
+    
+    def _close_relay(self):
+        """关闭按需创建的中继发送器 (外部传入的由其所有者关闭)"""
+        if self._own_relay_transfer and self.relay_transfer is not None:
+            self.relay_transfer.close()
+            self.relay_transfer = None
+            self._own_relay_transfer = False
@@ -0,0 +1,173 @@
+"""链路调优模块 - 按测得的 RTT 和吞吐 (带宽时延积) 选择分块大小与 socket 缓冲区
+
+发送端在每次传输开始时测一次 RTT (Linux 读内核 TCP_INFO，其他平台用
+文件头到 READY 的往返时间)，传输过程中用平滑速率持续更新吞吐估计。
+估计值按对端保存，下一次传输一开始就用上次的结果。
+"""
+import socket
+import struct
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional
+
+import sys
+sys.path.append('..')
+from config import (TUNE_INITIAL_CHUNK, TUNE_MIN_CHUNK, TUNE_MAX_CHUNK,
+                    TUNE_CHUNK_TIME, TUNE_MAX_SOCK_BUF, SENDFILE_CHUNK,
+                    BULK_SLICE_TIME, BULK_NOTSENT_LOWAT)
+
+if TYPE_CHECKING:
+    from .ratelimit import RateLimiter
+
+# struct tcp_info 中 tcpi_rtt (微秒) 的偏移
+_TCPI_RTT_OFFSET = 68
+
+
+def tcp_rtt(sock: socket.socket) -> Optional[float]:
+    """读取内核平滑 RTT (秒)，不支持 TCP_INFO 的平台返回 None"""
+    if not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+    except OSError:
+        return None
+    if len(info) < _TCPI_RTT_OFFSET + 4:
+        return None
+    rtt_us = struct.unpack_from('I', info, _TCPI_RTT_OFFSET)[0]
+    return rtt_us / 1e6 if rtt_us else None
+
+
+def set_nodelay(sock: socket.socket):
+    """协议是请求-应答式的 (READY/ACK 等短回复)，关闭 Nagle 避免与延迟确认叠加"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+
+def set_notsent_lowat(sock: socket.socket, size: int = BULK_NOTSENT_LOWAT):
+    """限制内核中排队未发出的数据量
+
+    文件连接的发送缓冲区按带宽时延积调大后，暂停发送时内核里仍可能积压大量数据，
+    交互消息要排在它们后面才能通过瓶颈链路。这里只限制未发出的部分，不影响在途窗口。
+    """
+    option = getattr(socket, 'TCP_NOTSENT_LOWAT', None)
+    if option is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, option, size)
+    except OSError:
+        pass
+
+
+def _pow2_clamp(value: float, low: int, high: int) -> int:
+    size = low
+    while size < value and size < high:
+        size *= 2
+    return min(size, high)
+
+
+@dataclass
+class LinkEstimate:
+    rtt: Optional[float] = None  # 最小 RTT (秒)，缓慢老化
+    rate: float = 0.0            # 平滑吞吐 (字节/秒)
+
+    @property
+    def bdp(self) -> float:
+        return self.rate * (self.rtt or 0.0)
+
+
+class LinkTuner:
+    """按对端记录链路估计，给出发送分块大小和 socket 缓冲区大小"""
+
+    def __init__(self):
+        self._links: Dict[str, LinkEstimate] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, peer: str) -> LinkEstimate:
+        with self._lock:
+            link = self._links.get(peer)
+            return LinkEstimate(link.rtt, link.rate) if link else LinkEstimate()
+
+    def observe_rtt(self, peer: str, rtt: Optional[float]):
+        if not rtt or rtt <= 0:
+            return
+        with self._lock:
+            link = self._links.setdefault(peer, LinkEstimate())
+            # 取最小值过滤排队抖动，同时允许路径变化后慢慢升高
+            link.rtt = rtt if link.rtt is None else min(rtt, link.rtt * 1.25)
+
+    def observe_rate(self, peer: str, rate: float):
+        if rate <= 0:
+            return
+        with self._lock:
+            self._links.setdefault(peer, LinkEstimate()).rate = rate
+
+    def chunk_size(self, peer: str) -> int:
+        """每次读写的字节数: 约为 1/4 带宽时延积，且至少够 TUNE_CHUNK_TIME 秒的数据"""
+        link = self.estimate(peer)
+        if not link.rate:
+            return TUNE_INITIAL_CHUNK
+        return _pow2_clamp(max(link.bdp / 4, link.rate * TUNE_CHUNK_TIME),
+                           TUNE_MIN_CHUNK, TUNE_MAX_CHUNK)
+
+    def slice_size(self, peer: str) -> int:
+        """sendfile 每次调用的字节数: 约 BULK_SLICE_TIME 秒的数据，两次调用之间可以让路"""
+        link = self.estimate(peer)
+        if not link.rate:
+            return TUNE_MAX_CHUNK
+        return _pow2_clamp(link.rate * BULK_SLICE_TIME, TUNE_MIN_CHUNK, SENDFILE_CHUNK)
+
+    def sock_buffer(self, peer: str) -> Optional[int]:
+        """发送缓冲区目标: 两倍带宽时延积，尚无估计时返回 None (保持系统默认)"""
+        bdp = self.estimate(peer).bdp
+        if not bdp:
+            return None
+        return int(min(2 * bdp, TUNE_MAX_SOCK_BUF))
+
+    def tune(self, sock: socket.socket, peer: str,
+             limiter: Optional['RateLimiter'] = None) -> 'SocketTuning':
+        return SocketTuning(self, sock, peer, limiter)
+
+
+class SocketTuning:
+    """一条发送连接上的调优状态
+
+    每个数据块前调用 chunk() (sendfile 用 slice())，估计值变大时随之调大 SO_SNDBUF。
+    只增不减: 系统默认值 (或自动调节的结果) 已经够大时不去覆盖它。
+    TCP_NODELAY 由连接池在建连时设置，文件连接在这里设置 TCP_NOTSENT_LOWAT。
+    限速时块大小不超过 limiter 给出的上限，以便并发传输轮流发送。
+    """
+
+    def __init__(self, tuner: LinkTuner, sock: socket.socket, peer: str,
+                 limiter: Optional['RateLimiter'] = None):
+        self._tuner = tuner
+        self._sock = sock
+        self._peer = peer
+        self._limiter = limiter
+        try:
+            self._sndbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        except OSError:
+            self._sndbuf = 0
+        set_notsent_lowat(sock)
+
+    def _sync_buffer(self):
+        target = self._tuner.sock_buffer(self._peer)
+        if target and target > self._sndbuf:
+            try:
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, target)
+            except OSError:
+                pass
+            self._sndbuf = target
+
+    def _cap(self, size: int) -> int:
+        limit = self._limiter.chunk_limit(self._peer) if self._limiter else None
+        return min(size, limit) if limit else size
+
+    def chunk(self) -> int:
+        self._sync_buffer()
+        return self._cap(self._tuner.chunk_size(self._peer))
+
+    def slice(self) -> int:
+        self._sync_buffer()
+        return self._cap(self._tuner.slice_size(self._peer))
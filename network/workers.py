@@ -0,0 +1,210 @@
+"""发送任务调度 - 固定数量的工作线程、有界队列、每个对端的并发上限和优先级通道"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+
+import sys
+sys.path.append('..')
+from config import (SEND_WORKERS, SEND_QUEUE_SIZE, SEND_PER_PEER_LIMIT,
+                    SEND_INTERACTIVE_WORKERS, BULK_MAX_YIELD)
+
+Peer = Tuple[str, int]
+
+
+class Priority(IntEnum):
+    """发送优先级: 交互消息 (文字/剪贴板) 先于批量传输 (文件)"""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class QueueFullError(Exception):
+    """发送队列已满 (背压)"""
+
+
+class TransferCancelled(Exception):
+    """发送任务被取消"""
+
+
+class TransferHandle(Future):
+    """发送任务句柄
+
+    可以 result()/add_done_callback()，也可以在协程里直接 await。
+    排队中的任务 cancel() 后不会执行；已在发送的任务会在下一个数据块处停止，
+    并以 TransferCancelled 结束。
+    """
+
+    def __init__(self, peer: Peer, priority: Priority = Priority.BULK):
+        super().__init__()
+        self.peer = peer
+        self.priority = priority
+        self._cancel_requested = threading.Event()
+
+    def cancel(self) -> bool:
+        if super().cancel():
+            return True
+        if self.done():
+            return False
+        self._cancel_requested.set()
+        return True
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set() or self.cancelled()
+
+    def check_cancelled(self):
+        if self._cancel_requested.is_set():
+            raise TransferCancelled("发送已取消")
+
+    def __await__(self):
+        import asyncio  # 只有在协程里等待句柄时才需要，不放到启动路径上
+        return asyncio.wrap_future(self).__await__()
+
+
+class SendExecutor:
+    """有界发送线程池
+
+    任务按优先级、再按提交顺序执行，同一对端每个优先级同时最多执行 per_peer 个，
+    其余任务留在队列里，不占用工作线程。批量任务最多占用 workers - interactive_workers
+    个线程，交互任务总有空闲线程可用。队列满时 submit 阻塞 (或超时后失败)，
+    把压力传回调用方，而不是无限制地创建线程和连接。
+
+    交互任务从提交到完成期间，同一对端的批量传输在每个数据块之间调用
+    yield_to_interactive() 暂停 (最多 BULK_MAX_YIELD 秒)，把链路让给交互消息。
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS, max_pending: int = SEND_QUEUE_SIZE,
+                 per_peer: int = SEND_PER_PEER_LIMIT,
+                 interactive_workers: int = SEND_INTERACTIVE_WORKERS):
+        self.max_pending = max_pending
+        self.per_peer = per_peer
+        self.bulk_workers = max(1, workers - interactive_workers)
+        self._queues: Dict[Priority, Deque[Tuple[TransferHandle, Callable]]] = {
+            priority: deque() for priority in Priority
+        }
+        self._active: Dict[Tuple[Peer, Priority], int] = {}
+        self._running: Set[TransferHandle] = set()
+        self._running_bulk = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        # 每个对端尚未完成的交互任务数
+        self._interactive: Dict[Peer, int] = {}
+        self._lanes = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'send-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, peer: Peer, fn: Callable[[TransferHandle], object],
+               block: bool = True, timeout: Optional[float] = None,
+               priority: Priority = Priority.BULK) -> TransferHandle:
+        """提交任务，fn 在工作线程中以句柄为参数执行"""
+        handle = TransferHandle(peer, priority)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("发送线程池已关闭")
+            has_room = self._cond.wait_for(
+                lambda: self._pending_count() < self.max_pending or self._closed,
+                timeout if block else 0
+            )
+            if not has_room or self._closed:
+                raise QueueFullError(f"发送队列已满 ({self.max_pending})")
+            self._queues[priority].append((handle, fn))
+            self._cond.notify_all()
+        if priority == Priority.INTERACTIVE:
+            self._begin_interactive(peer)
+            handle.add_done_callback(lambda _: self._end_interactive(peer))
+        return handle
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending_count()
+
+    def active(self) -> int:
+        with self._cond:
+            return len(self._running)
+
+    def _pending_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _take(self) -> Optional[Tuple[TransferHandle, Callable]]:
+        """先交互后批量，取出最早的、其对端在该优先级未达并发上限的任务"""
+        for priority in Priority:
+            if priority == Priority.BULK and self._running_bulk >= self.bulk_workers:
+                continue
+            queue = self._queues[priority]
+            for i, (handle, fn) in enumerate(queue):
+                if self._active.get((handle.peer, priority), 0) < self.per_peer:
+                    del queue[i]
+                    return handle, fn
+        return None
+
+    # 优先级通道: 交互任务未完成时，同一对端的批量传输在数据块之间让路
+
+    def _begin_interactive(self, peer: Peer):
+        with self._lanes:
+            self._interactive[peer] = self._interactive.get(peer, 0) + 1
+
+    def _end_interactive(self, peer: Peer):
+        with self._lanes:
+            self._interactive[peer] -= 1
+            if not self._interactive[peer]:
+                del self._interactive[peer]
+            self._lanes.notify_all()
+
+    def yield_to_interactive(self, peer: Peer, max_wait: float = BULK_MAX_YIELD):
+        """批量传输在每个数据块之间调用: 该对端有交互任务时暂停，最多 max_wait 秒"""
+        if peer not in self._interactive:
+            return
+        with self._lanes:
+            self._lanes.wait_for(lambda: peer not in self._interactive, max_wait)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._closed:
+                    job = self._take()
+                    if job:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    return
+                handle, fn = job
+                lane = (handle.peer, handle.priority)
+                self._active[lane] = self._active.get(lane, 0) + 1
+                if handle.priority == Priority.BULK:
+                    self._running_bulk += 1
+                self._running.add(handle)
+                self._cond.notify_all()  # 队列腾出了位置
+
+            try:
+                if handle.set_running_or_notify_cancel():
+                    try:
+                        handle.set_result(fn(handle))
+                    except BaseException as e:
+                        handle.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running.discard(handle)
+                    self._active[lane] -= 1
+                    if not self._active[lane]:
+                        del self._active[lane]
+                    if handle.priority == Priority.BULK:
+                        self._running_bulk -= 1
+                    self._cond.notify_all()
+
+    def shutdown(self):
+        """取消所有排队任务，正在执行的任务收到取消请求"""
+        with self._cond:
+            self._closed = True
+            handles = [handle for queue in self._queues.values() for handle, _ in queue]
+            handles += list(self._running)
+            for queue in self._queues.values():
+                queue.clear()
+            self._cond.notify_all()
+        for handle in handles:
+            handle.cancel()
@@ -1,8 +1,13 @@
 """
 UI 模块初始化
+
+各类在第一次访问时才导入: 启动时只加载主窗口，发送面板和气泡用到时再加载。
 """
-from .main_window import MainWindow
-from .send_panel import SendPanel
-from .receive_bubble import ReceiveBubble, BubbleManager
+from utils.lazy import install
 
-__all__ = ['MainWindow', 'SendPanel', 'ReceiveBubble', 'BubbleManager']
+install(__name__, {
+    'MainWindow': '.main_window',
+    'SendPanel': '.send_panel',
+    'ReceiveBubble': '.receive_bubble',
+    'BubbleManager': '.receive_bubble',
+})
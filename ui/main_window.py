@@ -5,19 +5,21 @@ from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QLabel, QPushButton, QListWidget, QListWidgetItem,
     QTextEdit, QFileDialog, QProgressBar, QSplitter,
-    QFrame, QSystemTrayIcon, QMenu, QApplication
+    QFrame, QSystemTrayIcon, QMenu, QApplication, QSpinBox
 )
 from PySide6.QtCore import Qt, Signal, Slot, QSize
 from PySide6.QtGui import QIcon, QDragEnterEvent, QDropEvent, QAction
 
 import sys
 sys.path.append('..')
-from config import APP_NAME, WINDOW_WIDTH, WINDOW_HEIGHT, RECEIVE_DIR, get_local_ip, get_device_name
+from config import (APP_NAME, WINDOW_WIDTH, WINDOW_HEIGHT, RATE_LIMIT_SEND,
+                    RATE_LIMIT_RECV, ensure_receive_dir, get_local_ip, get_device_name)
 
 
 class MainWindow(QMainWindow):
     send_text_requested = Signal(str, str)  # target_ip, text
     send_file_requested = Signal(str, str)  # target_ip, file_path
+    rate_limit_changed = Signal(int, int)  # 上传、下载限速 (字节/秒，0 为不限)
     
     def __init__(self):
         super().__init__()
@@ -47,6 +49,10 @@ class MainWindow(QMainWindow):
         splitter.setSizes([150, 200, 200])
         main_layout.addWidget(splitter)
         self.statusBar().showMessage(f"本机IP: {get_local_ip()}")
+        # 后台服务启动状态 (见 set_service_status)
+        self._services = {}
+        self.service_label = QLabel()
+        self.statusBar().addPermanentWidget(self.service_label)
     
     def _create_receive_panel(self) -> QFrame:
         frame = QFrame()
@@ -245,7 +251,7 @@ class MainWindow(QMainWindow):
         layout.addSpacing(10)
         
         file_label = QLabel("发送文件:")
-        file_label.setStyleSheet("color: #e65100; font-weight: bold;"))
+        file_label.setStyleSheet("color: #e65100; font-weight: bold;")
         layout.addWidget(file_label)
         
         self.file_path_label = QLabel("未选择文件")
@@ -309,10 +315,33 @@ class MainWindow(QMainWindow):
         """)
         layout.addWidget(self.progress_bar)
         
+        # 限速 (MB/s，0 为不限)，修改后立即生效
+        limit_layout = QHBoxLayout()
+        self.send_limit_spin = self._create_limit_spin("上传", RATE_LIMIT_SEND)
+        self.recv_limit_spin = self._create_limit_spin("下载", RATE_LIMIT_RECV)
+        limit_layout.addWidget(self.send_limit_spin)
+        limit_layout.addWidget(self.recv_limit_spin)
+        layout.addLayout(limit_layout)
+        
         layout.addStretch()
         
         return frame
     
+    def _create_limit_spin(self, label: str, rate: int) -> QSpinBox:
+        spin = QSpinBox()
+        spin.setRange(0, 10000)
+        spin.setPrefix(f"{label}限速 ")
+        spin.setSuffix(" MB/s")
+        spin.setSpecialValueText(f"{label}不限速")
+        spin.setValue(rate // (1024 * 1024))
+        spin.setStyleSheet("color: #e65100;")
+        spin.valueChanged.connect(self._on_rate_limit_changed)
+        return spin
+    
+    def _on_rate_limit_changed(self):
+        self.rate_limit_changed.emit(self.send_limit_spin.value() * 1024 * 1024,
+                                     self.recv_limit_spin.value() * 1024 * 1024)
+    
     def _init_tray(self):
         if not QSystemTrayIcon.isSystemTrayAvailable():
             return
@@ -372,10 +401,11 @@ class MainWindow(QMainWindow):
                     """)
                     break
         elif mime.hasText():
+            self.text_input.setPlainText(mime.text())
 
     def _open_receive_folder(self):
-        if os.path.exists(RECEIVE_DIR):
-            os.startfile(RECEIVE_DIR) if os.name == 'nt' else os.system(f'open "{RECEIVE_DIR}"')
+        receive_dir = ensure_receive_dir()
+        os.startfile(receive_dir) if os.name == 'nt' else os.system(f'open "{receive_dir}"')
     
     def _refresh_devices(self):
         pass
@@ -455,6 +485,15 @@ class MainWindow(QMainWindow):
                     self.device_list.takeItem(i)
                     break
     
+    @Slot(str, str, str)
+    def set_service_status(self, name: str, state: str, error: str):
+        """更新状态栏中的服务状态，state 为 starting / ready / failed"""
+        self._services[name] = state
+        icons = {'starting': '…', 'ready': '✓', 'failed': '✗'}
+        self.service_label.setText('  '.join(f"{n} {icons.get(s, '')}" for n, s in self._services.items()))
+        if state == 'failed':
+            self.statusBar().showMessage(f"{name}启动失败: {error}", 5000)
+    
     @Slot(str, str)
     def add_receive_item(self, sender: str, content: str, is_file: bool = False):
         icon = "📁" if is_file else "📝"
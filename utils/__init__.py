@@ -1,6 +1,10 @@
 """
 工具模块初始化
+
+ClipboardManager 在第一次访问时才导入 (依赖 PySide6)，不依赖界面的工具模块可以单独使用。
 """
-from .clipboard import ClipboardManager
+from .lazy import install
 
-__all__ = ['ClipboardManager']
+install(__name__, {
+    'ClipboardManager': '.clipboard',
+})
@@ -0,0 +1,24 @@
+"""包的延迟导出 (PEP 562) - 包级名字在第一次访问时才导入所在子模块"""
+import importlib
+import sys
+from typing import Dict
+
+
+def install(module_name: str, exports: Dict[str, str]):
+    """为包 module_name 设置 __all__ 和 __getattr__
+
+    exports 为 {名字: 相对子模块}，如 {'FileTransfer': '.transfer'}。
+    导入后的对象写回包的命名空间，之后的访问不再经过 __getattr__。
+    """
+    module = sys.modules[module_name]
+
+    def __getattr__(name):
+        target = exports.get(name)
+        if target is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(target, module_name), name)
+        setattr(module, name, value)
+        return value
+
+    module.__all__ = list(exports)
+    module.__getattr__ = __getattr__
@@ -0,0 +1,115 @@
+"""启动编排 - 各后台服务并行启动，逐个汇报就绪或失败
+
+每个服务一个线程: start() 返回 (或抛出异常) 后即为就绪 (或失败)，耗时各自计算，
+慢的服务 (如 mDNS 注册要做探测) 不耽误其他服务和主窗口。after 指定依赖的服务，
+依赖就绪后才开始；依赖失败时该服务也记为失败。必须在主线程运行的服务 (Qt 定时器等)
+用 main_thread=True 登记，在 start() 的调用线程里依次启动，应当很快返回。
+状态变化通过 on_status 回调 (在服务线程里调用，界面需要自己转到主线程)。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class ServiceState(Enum):
+    PENDING = "pending"
+    STARTING = "starting"
+    READY = "ready"
+    FAILED = "failed"
+
+
+@dataclass
+class ServiceStatus:
+    name: str
+    state: ServiceState
+    elapsed: float = 0.0          # 从编排开始到进入此状态的秒数
+    error: Optional[str] = None
+
+
+class _Service:
+    def __init__(self, name: str, start: Callable[[], None], after: Sequence[str],
+                 main_thread: bool):
+        self.name = name
+        self.start = start
+        self.after = tuple(after)
+        self.main_thread = main_thread
+        self.status = ServiceStatus(name, ServiceState.PENDING)
+        self.done = threading.Event()
+
+
+class StartupOrchestrator:
+    def __init__(self, on_status: Optional[Callable[[ServiceStatus], None]] = None):
+        self._on_status = on_status
+        self._services: Dict[str, _Service] = {}
+        self._started = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: Callable[[], None], after: Sequence[str] = (),
+            main_thread: bool = False):
+        """登记一个服务；start 阻塞到服务可用为止，失败时抛出异常"""
+        if main_thread and after:
+            raise ValueError(f"主线程服务 {name} 不能有依赖")
+        for dependency in after:
+            if dependency not in self._services:
+                raise ValueError(f"服务 {name} 依赖未登记的服务 {dependency}")
+        self._services[name] = _Service(name, start, after, main_thread)
+
+    def start(self):
+        """在后台线程中启动各服务，主线程服务就地启动，随后返回"""
+        self._started = time.perf_counter()
+        for service in self._services.values():
+            if not service.main_thread:
+                threading.Thread(target=self._run, args=(service,), name=f'start-{service.name}',
+                                 daemon=True).start()
+        for service in self._services.values():
+            if service.main_thread:
+                self._run(service)
+
+    def _set(self, service: _Service, state: ServiceState, error: Optional[str] = None):
+        with self._lock:
+            service.status = ServiceStatus(service.name, state, time.perf_counter() - self._started,
+                                           error)
+        if self._on_status:
+            try:
+                self._on_status(service.status)
+            except Exception as e:
+                print(f"[Startup] 状态回调出错: {e}")
+
+    def _run(self, service: _Service):
+        try:
+            for name in service.after:
+                dependency = self._services[name]
+                dependency.done.wait()
+                if dependency.status.state != ServiceState.READY:
+                    self._set(service, ServiceState.FAILED, f"依赖的 {name} 未能启动")
+                    return
+            self._set(service, ServiceState.STARTING)
+            try:
+                service.start()
+            except Exception as e:
+                print(f"[Startup] {service.name} 启动失败: {e}")
+                self._set(service, ServiceState.FAILED, str(e))
+                return
+            self._set(service, ServiceState.READY)
+        finally:
+            service.done.set()
+
+    def statuses(self) -> List[ServiceStatus]:
+        with self._lock:
+            return [service.status for service in self._services.values()]
+
+    def finished(self) -> bool:
+        """所有服务都已就绪或失败"""
+        return all(status.state in (ServiceState.READY, ServiceState.FAILED)
+                   for status in self.statuses())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等所有服务结束启动 (就绪或失败)，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for service in self._services.values():
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not service.done.wait(left):
+                return False
+        return True
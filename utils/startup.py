@@ -0,0 +1,100 @@
+"""启动耗时分析 - 记录每个导入和初始化步骤的耗时，以及到主窗口显示的时间
+
+python main.py --profile-startup (或设置环境变量 EASYCONNECT_PROFILE_STARTUP=1) 时启用:
+main.py 用 PROFILER.step() 包住各个导入和初始化步骤，用 mark() 记下关键时刻，
+同时替换 builtins.__import__，记录每个模块第一次导入的耗时。
+窗口显示、后台服务都启动完后打印耗时表，最后一行是 JSON (benchmarks/startup_bench.py 读取)。
+未启用时 step/mark 只是空操作。
+"""
+import builtins
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+PROFILE_FLAG = '--profile-startup'
+EXIT_FLAG = '--exit-after-window'  # 窗口显示、打印报告后立即退出，供基准测试使用
+
+
+class StartupProfiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.wall_started = time.time()  # 基准测试据此加上解释器自身的启动时间
+        self.steps: List[Tuple[str, float, float]] = []  # (名称, 开始时刻, 耗时)
+        self.marks: Dict[str, float] = {}                 # 名称 -> 距开始的秒数
+        self.imports: List[Tuple[str, float, int]] = []   # 首次导入 (模块, 含子导入的耗时, 嵌套深度)
+        self._depth = 0
+        self._original_import = None
+        if enabled:
+            self._install_import_hook()
+
+    def _install_import_hook(self):
+        original = self._original_import = builtins.__import__
+
+        def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            depth = self._depth
+            self._depth += 1
+            started = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._depth = depth
+                self.imports.append((name, time.perf_counter() - started, depth))
+
+        builtins.__import__ = _timed_import
+
+    def _remove_import_hook(self):
+        if self._original_import:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def step(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, started - self.started, time.perf_counter() - started))
+
+    def mark(self, name: str):
+        if self.enabled:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def report(self, top: int = 15) -> dict:
+        imports = sorted(self.imports, key=lambda item: item[1], reverse=True)[:top]
+        return {
+            'wall_started': self.wall_started,
+            'steps': [{'name': name, 'at': at, 'seconds': seconds} for name, at, seconds in self.steps],
+            'marks': self.marks,
+            'imports': [{'module': name, 'seconds': seconds, 'depth': depth}
+                        for name, seconds, depth in imports],
+        }
+
+    def print_report(self):
+        """打印耗时表，最后一行输出 JSON；之后不再记录导入"""
+        self._remove_import_hook()
+        report = self.report()
+        print("[Startup] 步骤耗时:")
+        for step in report['steps']:
+            print(f"[Startup]   {step['at'] * 1000:8.1f} ms  +{step['seconds'] * 1000:7.1f} ms  {step['name']}")
+        print("[Startup] 最慢的导入:")
+        for item in report['imports']:
+            print(f"[Startup]   {item['seconds'] * 1000:8.1f} ms  {'  ' * item['depth']}{item['module']}")
+        for name, at in self.marks.items():
+            print(f"[Startup] {name}: {at * 1000:.1f} ms")
+        print(json.dumps(report, ensure_ascii=False), flush=True)
+
+
+def _enabled() -> bool:
+    return PROFILE_FLAG in sys.argv or bool(os.environ.get('EASYCONNECT_PROFILE_STARTUP'))
+
+
+PROFILER = StartupProfiler(_enabled())